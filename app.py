@@ -1,33 +1,188 @@
 from flask import Flask, request, jsonify, abort
 from slack_integration import send_slack_message, initialize_slack_client, publish_app_home
-from bedrock_integration import invoke_claude, build_claude_prompt
-from aws_session import assume_role
-from sheets_manager import initialize_sheets_service, duplicate_template_sheet, update_sheet_with_data
+from slack_outbox import SlackOutbox
+from bedrock_integration import (invoke_claude, invoke_claude_stream, build_claude_prompt_parts, request_key,
+                                  response_cache, rate_limiter)
+from prompt_templates import prompt_slices
+from aws_session import get_credential_provider
+from client_registry import get_bedrock_client
+from sheets_manager import (initialize_sheets_service, duplicate_template_sheet, get_sheet_ids, SheetWriter, diff_rows,
+                            scheduler as google_scheduler)
 from utils import verify_slack_signature
-from parse_text import is_greeting, parse_claude_response, remove_curly_brace_pairs
+from parse_text import is_greeting, is_revise_request, is_regenerate_request, is_same, parse_claude_response, remove_curly_brace_pairs, IncrementalTableParser, merge_tables
 from encryption import decrypt_file
+from job_queue import JobQueue
+from dedupe_index import create_dedupe_index
+from state_store import create_state_store
+from test_case_corpus import create_corpus
+from near_duplicates import create_near_duplicate_filter
+from sheet_pool import create_sheet_pool
+from tab_scheduler import create_tab_scheduler, raise_if_cancelled, current_plan, PlanCancelled, PRIORITY_BATCH, PRIORITY_SINGLE_TAB
 from datetime import date
-from threading import Lock
+from functools import partial
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+import contextvars
+import hashlib
 import html
 import json
+import metrics
+import os
+import re
+import sqlite3
+import threading
 import traceback
 
 # Initialize the Flask application
 app = Flask(__name__)
 
-# Lock for thread-safe operation on global state
-state_lock = Lock()
+# Conversation state per user, selected by STATE_BACKEND. Each user's state is locked
+# independently, so one user's conversation never waits on another's
+state_store = create_state_store()
 
-# Global dictionary to maintain state (replace this with a persistent data store in production)
-conversation_states = {}
+NEW_USER_STATE = {
+    'status': 'new',
+    'feature_name': None,
+    'feature_details': None,
+    'feature_criteria': None,
+    'selected_tabs': None,
+    'last_event_ts': '0',
+    'last_bot_message': None,
+    # Set while the user revises their last plan instead of starting a new one
+    'revising': False,
+    # The inputs, per-tab prompt hashes and spreadsheet of the user's last plan, for revisions
+    'last_plan': None,
+    # The ID of the plan in progress. Clearing it cancels the plan in whichever worker process runs it
+    'plan_id': None
+}
+
+# The decrypted configuration (Slack and Google credentials) and the Slack client. Both are
+# set up by init_services on the first request rather than when the module is imported
+config = None
+slack_client = None
+_services_lock = threading.Lock()
+# Placeholder of the local stores not created yet; get_corpus and get_sheet_pool create them on first use
+_NOT_CREATED = object()
 
-# Load and decrypt the encrypted configuration file with Slack and Google credentials
-config = decrypt_file('slack_google_credentials.enc')
+# Initialize the services on start-up (in the background) instead of on the first request
+WARM_UP = os.getenv('WARM_UP', 'false').lower() == 'true'
 
-# Initialize services with the decrypted configuration
-slack_client = initialize_slack_client(config['slack_bot_token'])
-sheets_service = initialize_sheets_service(config['google_service_account_info'])
 TEMPLATE_SHEET_ID = "1hALS2c3KUdb3A6tGYaOZAe_WlV9Km241mDwsTE30rso"
+# Copies of the template made in the background ahead of time, so a new plan only renames
+# one (None if SHEET_POOL_SIZE is 0). Created by get_sheet_pool on first use
+sheet_pool = _NOT_CREATED
+
+# Role assumed for Bedrock calls
+ROLE_ARN = "arn:aws:iam::511738828901:role/test-plan-creator"
+EXTERNAL_ID = "test-plan-creator"
+
+# Maximum number of tabs of a single plan generated in parallel (1 generates them one after another)
+TAB_CONCURRENCY = int(os.getenv('TAB_CONCURRENCY', '4'))
+# The tabs of every plan share the workers of one scheduler, which takes turns between users
+# and runs single-tab plans first. Saying hi again cancels the user's plan in progress
+tab_scheduler = create_tab_scheduler()
+
+# Stream Bedrock responses and write rows to the sheet while the tab is still generating
+BEDROCK_STREAMING = os.getenv('BEDROCK_STREAMING', 'false').lower() == 'true'
+# Number of streamed rows written to the sheet per values update
+STREAM_FLUSH_ROWS = int(os.getenv('STREAM_FLUSH_ROWS', '10'))
+
+# Generate large tabs (those with prompt slices) as several parallel prompts, one per
+# scenario area, and merge the rows. Takes precedence over streaming for those tabs.
+SPLIT_LARGE_TABS = os.getenv('SPLIT_LARGE_TABS', 'false').lower() == 'true'
+
+# Hold every tab's rows until the plan is finished and commit them in a single write
+SHEETS_DEFERRED_WRITES = os.getenv('SHEETS_DEFERRED_WRITES', 'false').lower() == 'true'
+
+# Every generated tab is stored in a local full-text-searchable corpus (None if CORPUS_ENABLED is
+# false). Created by get_corpus on first use rather than when the module is imported
+corpus = _NOT_CREATED
+# What to do with the stored cases of a tab when a highly similar feature was planned before:
+# 'off', 'seed' (show them to Claude as examples) or 'shortcut' (reuse them instead of calling Bedrock)
+CORPUS_REUSE = os.getenv('CORPUS_REUSE', 'off').lower()
+# Share of distinctive words two features must have in common to count as highly similar
+CORPUS_REUSE_SIMILARITY = float(os.getenv('CORPUS_REUSE_SIMILARITY', '0.8'))
+# Maximum number of past test cases listed by the search slash command
+CORPUS_SEARCH_RESULTS = int(os.getenv('CORPUS_SEARCH_RESULTS', '10'))
+
+# Per-tab progress is shown in one Slack message that is edited in place from a background
+# outbox, with the updates made within this many seconds combined into one edit
+slack_outbox = SlackOutbox(coalesce_seconds=float(os.getenv('SLACK_PROGRESS_INTERVAL_SECONDS', '1')))
+
+# Background workers that handle Slack events and interactions outside of Slack's 3-second
+# ack window. They only run short conversation steps, so a user's reply never waits on a plan
+job_queue = JobQueue(
+    max_workers=int(os.getenv('JOB_WORKERS', '4')),
+    max_queue_size=int(os.getenv('JOB_QUEUE_SIZE', '100')),
+)
+# Background workers that each build one test plan. A plan's tabs run on the tab scheduler,
+# so these mostly wait for them
+plan_queue = JobQueue(
+    max_workers=int(os.getenv('PLAN_WORKERS', '8')),
+    max_queue_size=int(os.getenv('PLAN_QUEUE_SIZE', '100')),
+    name='plan',
+    id_prefix='plan-',
+)
+
+WELCOME_MESSAGE = (
+    ":wave: Hi! Welcome to Test Plan Creator.\n"
+    "To create a test plan, I’ll start by asking a few questions about the feature. "
+    "What is the name of the feature you're working on?"
+)
+FEATURE_DETAILS_MESSAGE = "Please provide the details for the feature."
+EXTRA_DETAILS_MESSAGE = "Could you please provide any additional details/acceptance criteria/API Information (if any) for the feature? Else just reply with N/A"
+REVISE_DETAILS_MESSAGE = (
+    "Revising the test plan for *{feature_name}*. Please provide the updated details for the feature, "
+    "or reply with \"same\" to keep them:\n>{feature_details}"
+)
+REVISE_EXTRA_DETAILS_MESSAGE = (
+    "Please provide the updated additional details/acceptance criteria/API Information, "
+    "or reply with \"same\" to keep them:\n>{feature_criteria}"
+)
+NO_PLAN_TO_REVISE_MESSAGE = "There is no test plan to revise yet. Say \"hi\" to create one."
+REGENERATE_MESSAGE = "Regenerating the test plan for *{feature_name}* with fresh test cases in a new spreadsheet."
+NO_PLAN_TO_REGENERATE_MESSAGE = "There is no test plan to regenerate yet. Say \"hi\" to create one."
+PLANS_BUSY_MESSAGE = "Too many test plans are being built right now. Please try again in a few minutes."
+
+metrics.register_gauge('job_queue_depth', lambda: job_queue.stats()['queue_depth'],
+                       'Jobs waiting for a worker.')
+metrics.register_gauge('jobs_in_flight', lambda: job_queue.stats()['running'],
+                       'Jobs currently running.')
+metrics.register_gauge('plan_queue_depth', lambda: plan_queue.stats()['queue_depth'],
+                       'Plans waiting for a plan worker.')
+metrics.register_gauge('plans_in_flight', lambda: plan_queue.stats()['running'],
+                       'Plans currently being built.')
+metrics.register_gauge('response_cache_hit_ratio',
+                       lambda: response_cache.stats()['hit_ratio'] if response_cache else 0.0,
+                       'Share of Bedrock requests answered from the response cache.')
+metrics.register_gauge('bedrock_concurrency_limit', lambda: rate_limiter.stats()['concurrency_limit'],
+                       'Bedrock calls currently allowed in flight by the adaptive rate limiter.')
+metrics.register_gauge('bedrock_calls_in_flight', lambda: rate_limiter.stats()['in_flight'],
+                       'Bedrock calls currently in flight.')
+metrics.register_gauge('tab_tasks_queued', lambda: tab_scheduler.stats()['queued'],
+                       'Tab tasks waiting for a tab worker.')
+metrics.register_gauge('tab_tasks_running', lambda: tab_scheduler.stats()['running'],
+                       'Tab tasks currently running.')
+metrics.register_gauge('spreadsheet_pool_available', lambda: sheet_pool.available() if sheet_pool not in (None, _NOT_CREATED) else 0,
+                       'Copies of the template spreadsheet ready in the pool.')
+metrics.register_gauge('google_write_queue_depth', lambda: google_scheduler.stats()['queued_writes'],
+                       'Sheets writes waiting for the Google API scheduler.')
+metrics.register_gauge('slack_outbox_pending', lambda: slack_outbox.stats()['pending'],
+                       'Slack progress messages with updates not yet delivered.')
+metrics.register_gauge('sts_credential_refreshes',
+                       lambda: get_credential_provider(ROLE_ARN, EXTERNAL_ID).refreshes,
+                       'AssumeRole calls made to refresh the cached credentials.')
+metrics.register_gauge('sts_credential_cache_hits',
+                       lambda: get_credential_provider(ROLE_ARN, EXTERNAL_ID).hits,
+                       'Requests served from the cached assumed-role credentials.')
+
+# Recently accepted Slack event IDs and interactions, used to drop retries and replays. Shared
+# by the worker processes when STATE_BACKEND is sqlite
+seen_requests = create_dedupe_index()
+EVENT_ID_PATTERN = re.compile(r'"event_id"\s*:\s*"([^"]+)"')
+metrics.register_gauge('slack_dedupe_index_hits', lambda: seen_requests.hits,
+                       'Lookups that found an already accepted Slack request.')
+metrics.register_gauge('slack_dedupe_index_size', lambda: len(seen_requests),
+                       'Slack requests remembered for duplicate detection.')
 
 tab_mapping = {
     "acceptance_criteria": "Acceptance Criteria - Use Cases",
@@ -41,6 +196,80 @@ tab_mapping = {
     "migration": "Migration",
 }
 
+def init_services():
+    """
+    Loads and decrypts the configuration and builds the Slack client, once. Thread-safe;
+    called before every request and by the warm-up hook.
+    """
+    global config, slack_client
+    if config is not None and slack_client is not None:
+        return
+    with _services_lock:
+        if config is None:
+            # Load and decrypt the encrypted configuration file with Slack and Google credentials
+            config = decrypt_file('slack_google_credentials.enc')
+        if slack_client is None:
+            slack_client = initialize_slack_client(config['slack_bot_token'])
+
+def get_corpus():
+    """
+    Returns:
+        TestCaseCorpus: The test-case corpus, created once on first use, or None if
+        CORPUS_ENABLED is false or its database could not be opened (retried on next use).
+    """
+    global corpus
+    if corpus is _NOT_CREATED:
+        with _services_lock:
+            if corpus is _NOT_CREATED:
+                try:
+                    corpus = create_corpus()
+                except sqlite3.Error as e:
+                    print(f"Error opening the test case corpus: {e}")
+                    return None
+    return corpus
+
+def get_sheet_pool():
+    """
+    Returns:
+        SpreadsheetPool: The spreadsheet pool, created once on first use, or None if
+        SHEET_POOL_SIZE is 0 or its database could not be opened (retried on next use).
+    """
+    global sheet_pool
+    if sheet_pool is _NOT_CREATED:
+        with _services_lock:
+            if sheet_pool is _NOT_CREATED:
+                try:
+                    sheet_pool = create_sheet_pool(TEMPLATE_SHEET_ID)
+                except sqlite3.Error as e:
+                    print(f"Error opening the spreadsheet pool: {e}")
+                    return None
+    return sheet_pool
+
+def warm_up():
+    """
+    Initializes the services and the clients the first plan needs (assumed-role
+    credentials and the Google API clients), so the first request doesn't pay for them.
+    Can also be called from a server hook such as gunicorn's post_fork.
+    """
+    with metrics.timed('warm_up_seconds', help_text='Duration of the start-up warm-up.'):
+        try:
+            init_services()
+            session_credentials = get_credential_provider(ROLE_ARN, EXTERNAL_ID).get_credentials()
+            if session_credentials:
+                get_bedrock_client(session_credentials['AccessKeyId'], session_credentials['SecretAccessKey'],
+                                   session_credentials['SessionToken'], session_credentials['Generation'])
+            template_sheet_ids()
+            get_corpus()
+            pool = get_sheet_pool()
+            if pool is not None:
+                pool.start(config['google_service_account_info'])
+        except Exception as e:
+            print(f"Warm-up failed, services will be initialized on first use: {e}")
+
+@app.before_request
+def ensure_services():
+    init_services()
+
 @app.route('/')
 def index():
     return 'Welcome to My Test Plan Creator!'
@@ -55,6 +284,16 @@ def slack_events():
     # Verify the request to ensure it came from Slack
     if not verify_slack_signature(request_body, timestamp, signature, config['slack_signing_secret']):
         return jsonify({'message': 'Invalid signature'}), 401
+
+    # Drop retries and replays of events we already accepted, before the body is parsed
+    if request.headers.get('X-Slack-Retry-Num'):
+        metrics.inc('slack_retries_total', help_text='Slack requests marked as retries.', source='event')
+    event_id_match = EVENT_ID_PATTERN.search(request_body)
+    dedupe_key = f"event:{event_id_match.group(1)}" if event_id_match else None
+    if dedupe_key and seen_requests.check_and_add(dedupe_key):
+        metrics.inc('slack_duplicates_dropped_total', help_text='Duplicate Slack requests that were dropped.',
+                    source='event')
+        return jsonify({'status': 'Duplicate event ignored'}), 200
     
     # Slack sends a challenge request to verify the URL - we need to respond with the challenge value
     if request.json.get('type') == 'url_verification':
@@ -62,20 +301,35 @@ def slack_events():
     
     # Handle the event payload from Slack
     event_data = request.json.get('event', {})
+    job_id = None
     if event_data.get('type') == 'app_home_opened':
         user = event_data.get('user')
         if user:
-            publish_app_home(user, slack_client)
+            job_id = job_queue.submit(publish_app_home, user, slack_client,
+                                      description=f"app_home_opened:{user}")
 
     # Only process message events from users or if the bot is mentioned
     if event_data.get('type') == 'message' and not event_data.get('subtype'):
-        handle_slack_event(event_data)
+        job_id = job_queue.submit(handle_slack_event, event_data,
+                                  description=f"message:{event_data.get('user')}")
+        if job_id is None:
+            # Let Slack's retry of this event through once there is room in the queue
+            if dedupe_key:
+                seen_requests.discard(dedupe_key)
+            return jsonify({'message': 'Server busy'}), 503
     
     # Respond to Slack that the event was received
-    return jsonify({'status': 'Event received'}), 200
+    return jsonify({'status': 'Event received', 'job_id': job_id}), 200
 
 @app.route('/slack/interactions', methods=['POST'])
 def slack_interactions():
+    signature = request.headers.get('X-Slack-Signature')
+    timestamp = request.headers.get('X-Slack-Request-Timestamp')
+    request_body = request.get_data(as_text=True)
+
+    if not verify_slack_signature(request_body, timestamp, signature, config['slack_signing_secret']):
+        return jsonify({'message': 'Invalid signature'}), 401
+
     payload = json.loads(request.form.get("payload"))
     user_id = payload['user']['id']
     channel_id = payload['container']['channel_id']
@@ -83,6 +337,13 @@ def slack_interactions():
     if payload['type'] == 'block_actions':
         for action in payload['actions']:
             if action['action_id'] == "submit_tabs":
+                # A replayed submission has the same trigger and action timestamp
+                dedupe_key = f"interaction:{payload.get('trigger_id')}:{action.get('action_ts')}"
+                if seen_requests.check_and_add(dedupe_key):
+                    metrics.inc('slack_duplicates_dropped_total',
+                                help_text='Duplicate Slack requests that were dropped.', source='interaction')
+                    continue
+
                 # The format of `state` may vary, logging to see the structure
                 selected_tabs = []
                 state_values = payload['state']['values']
@@ -93,46 +354,74 @@ def slack_interactions():
                                 option['value'] for option in action_state['selected_options']
                             ])
                 
-                with state_lock:
-                    user_state = conversation_states.get(user_id, {})
+                with state_store.transaction(user_id, default=NEW_USER_STATE) as user_state:
                     user_state['selected_tabs'] = selected_tabs
                     user_state['status'] = 'tabs_selected'
-                    conversation_states[user_id] = user_state
 
-                # After updating the state, we acknowledge the tab selection
-                send_slack_message(slack_client, channel_id, "Tab selections have been received. Processing the details...")
-                # Now, you can call handle_slack_event here or from another trigger
-                handle_slack_event({
+                # Acknowledge the tab selection and start generation in the background
+                job_id = job_queue.submit(start_plan_generation, channel_id, {
                     'type': 'message',
                     'user': user_id,
                     'text': '',
                     'channel': channel_id,
                     'event_ts': payload['container']['message_ts']
-                })
+                }, description=f"submit_tabs:{user_id}")
+                if job_id is None:
+                    seen_requests.discard(dedupe_key)
+                    return jsonify({'message': 'Server busy'}), 503
     # Respond to the interaction with an empty body to acknowledge
     return jsonify({}), 200    
 
-def handle_slack_event(event_data):
-    global conversation_states
+@app.route('/slack/commands', methods=['POST'])
+def slack_commands():
+    signature = request.headers.get('X-Slack-Signature')
+    timestamp = request.headers.get('X-Slack-Request-Timestamp')
+    request_body = request.get_data(as_text=True)
 
+    if not verify_slack_signature(request_body, timestamp, signature, config['slack_signing_secret']):
+        return jsonify({'message': 'Invalid signature'}), 401
+
+    # Searching the local corpus is fast enough to answer within Slack's 3-second window
+    return jsonify({'response_type': 'ephemeral', 'text': search_test_cases(request.form.get('text', ''))}), 200
+
+@app.route('/jobs', methods=['GET'])
+def jobs_status():
+    return jsonify(dict(job_queue.stats(), plans=plan_queue.stats())), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get_job(job_id) or plan_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    job['timings'] = metrics.job_spans(job_id) or {}
+    return jsonify(job), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/cache', methods=['GET'])
+def cache_status():
+    return jsonify(response_cache.stats() if response_cache else {'enabled': False}), 200
+
+def start_plan_generation(channel_id, event_data):
+    send_slack_message(slack_client, channel_id, "Tab selections have been received. Processing the details...")
+    handle_slack_event(event_data)
+
+def handle_slack_event(event_data):
     try:     
         user_id = event_data['user']
         channel_id = event_data['channel']
         text = event_data.get('text', '').strip()
         event_ts = event_data.get('event_ts', '')
+        reply = None
+        plan = None
+        bypass_cache = False
 
-        with state_lock:
-        # Fetch the user state, or create a new state if it doesn't exist
-            user_state = conversation_states.setdefault(
-                user_id, {
-                    'status': 'new',
-                    'feature_name': None,
-                    'feature_details': None,
-                    'feature_criteria': None,
-                    'selected_tabs': None,
-                    'last_event_ts': '0',
-                    'last_bot_message': None
-                    })
+        # Fetch the user state, or create a new state if it doesn't exist. Only this user's
+        # state is locked while the transition is decided; Slack messages and plan
+        # generation run after the lock is released
+        with state_store.transaction(user_id, default=NEW_USER_STATE) as user_state:
 
             # If the received event is older than the last event processed for the user, discard it
             if event_ts <= user_state['last_event_ts']:
@@ -144,121 +433,592 @@ def handle_slack_event(event_data):
                 return
 
             if is_greeting(text):
-                send_greeting(channel_id, user_id)
+                if user_state['status'] == 'generating':
+                    # The plan in progress is superseded by the new conversation. Cancelled here
+                    # if this process runs it, and by its next check of the plan ID otherwise
+                    cancelled = tab_scheduler.cancel_user(user_id)
+                    print(f"Cancelled the plan in progress of {user_id} ({cancelled} tab tasks)")
+                user_state['plan_id'] = None
+                user_state['last_bot_message'] = WELCOME_MESSAGE
+                reply = send_greeting
                 user_state['status'] = 'awaiting_feature_name'
+                user_state['revising'] = False
+
+            elif is_revise_request(text) and user_state['status'] != 'generating':
+                last_plan = user_state.get('last_plan')
+                if last_plan is None:
+                    message = NO_PLAN_TO_REVISE_MESSAGE
+                else:
+                    # Start from the last plan's answers; the feature name (and spreadsheet) stay the same
+                    for key in ('feature_name', 'feature_details', 'feature_criteria', 'selected_tabs'):
+                        user_state[key] = last_plan[key]
+                    user_state['revising'] = True
+                    user_state['status'] = 'awaiting_feature_details'
+                    message = REVISE_DETAILS_MESSAGE.format(**last_plan)
+                user_state['last_bot_message'] = message
+                reply = partial(send_message, message)
+
+            elif is_regenerate_request(text) and user_state['status'] != 'generating':
+                last_plan = user_state.get('last_plan')
+                if last_plan is None:
+                    message = NO_PLAN_TO_REGENERATE_MESSAGE
+                else:
+                    # The last plan's answers again, with every tab asked of Bedrock anew
+                    for key in ('feature_name', 'feature_details', 'feature_criteria', 'selected_tabs'):
+                        user_state[key] = last_plan[key]
+                    plan_tasks = tab_scheduler.start_plan(user_id, max_in_flight=TAB_CONCURRENCY,
+                                                          is_current=plan_is_current)
+                    plan = (last_plan['selected_tabs'], last_plan['feature_name'], last_plan['feature_details'],
+                            last_plan['feature_criteria'], None, plan_tasks)
+                    user_state['plan_id'] = plan_tasks.plan_id
+                    bypass_cache = True
+                    user_state['revising'] = False
+                    user_state['status'] = 'generating'
+                    message = REGENERATE_MESSAGE.format(**last_plan)
+                user_state['last_bot_message'] = message
+                reply = partial(send_message, message)
 
             elif user_state['status'] == 'awaiting_feature_name':
                 user_state['feature_name'] = remove_curly_brace_pairs(text)
                 user_state['status'] = 'awaiting_feature_details'
-                ask_for_feature_details(channel_id, user_id)
+                user_state['last_bot_message'] = FEATURE_DETAILS_MESSAGE
+                reply = ask_for_feature_details
 
             elif user_state['status'] == 'awaiting_feature_details':
-                user_state['feature_details'] = remove_curly_brace_pairs(text)
-                ask_for_extra_details(channel_id, user_id)   
+                if not (user_state.get('revising') and is_same(text)):
+                    user_state['feature_details'] = remove_curly_brace_pairs(text)
+                if user_state.get('revising'):
+                    message = REVISE_EXTRA_DETAILS_MESSAGE.format(feature_criteria=user_state['feature_criteria'])
+                    user_state['last_bot_message'] = message
+                    reply = partial(send_message, message)
+                else:
+                    user_state['last_bot_message'] = EXTRA_DETAILS_MESSAGE
+                    reply = ask_for_extra_details
                 user_state['status'] = 'awaiting_feature_criteria'
                 
             elif user_state['status'] == 'awaiting_feature_criteria':
-                user_state['feature_criteria'] = remove_curly_brace_pairs(text)
-                ask_for_tabs_update(channel_id, user_id)
+                if not (user_state.get('revising') and is_same(text)):
+                    user_state['feature_criteria'] = remove_curly_brace_pairs(text)
+                # A revision starts with the last plan's tabs checked
+                reply = partial(ask_for_tabs_update, selected_tabs=user_state['selected_tabs']
+                                if user_state.get('revising') else None)
                 user_state['status'] = 'tabs_selected'
 
             elif user_state['status'] == 'tabs_selected':
-                selected_tabs = user_state['selected_tabs']
-                feature_name = user_state['feature_name']
-                feature_details = user_state['feature_details']
-                feature_criteria = user_state['feature_criteria']
-                process_feature_details(channel_id, user_id, selected_tabs, feature_name, 
-                                        feature_details, feature_criteria)
+                # Registered under the user's lock, so a greeting right after this cancels it
+                plan_tasks = tab_scheduler.start_plan(user_id, max_in_flight=TAB_CONCURRENCY,
+                                                      is_current=plan_is_current)
+                plan = (user_state['selected_tabs'], user_state['feature_name'],
+                        user_state['feature_details'], user_state['feature_criteria'],
+                        user_state['last_plan'] if user_state.get('revising') else None,
+                        plan_tasks)
+                user_state['plan_id'] = plan_tasks.plan_id
+                user_state['revising'] = False
+                # Further messages are ignored until the plan is finished
+                user_state['status'] = 'generating'
             
             user_state['last_event_ts'] = event_ts
-            conversation_states[user_id] = user_state
+
+        if reply:
+            reply(channel_id, user_id)
+        if plan:
+            queue_plan(channel_id, user_id, plan, bypass_cache)
     
     except Exception as e:
         print(f"An error occurred: {e}")
 
+def queue_plan(channel_id, user_id, plan, bypass_cache=False):
+    """
+    Hands the plan to a plan worker, so the job worker is free for the next conversation
+    step (including a greeting that cancels this plan).
+    """
+    job_id = plan_queue.submit(process_feature_details, channel_id, user_id, *plan, bypass_cache=bypass_cache,
+                               description=f"plan:{user_id}")
+    if job_id is not None:
+        return
+    plan[-1].close()
+    # The tabs stay selected, so the user's next message starts the plan again
+    with state_store.transaction(user_id, default=NEW_USER_STATE) as user_state:
+        if user_state.get('status') == 'generating' and user_state.get('plan_id') == plan[-1].plan_id:
+            user_state['status'] = 'tabs_selected'
+            user_state['plan_id'] = None
+    send_slack_message(slack_client, channel_id, PLANS_BUSY_MESSAGE)
+
+def plan_is_current(plan_tasks):
+    """
+    Returns:
+        bool: Whether the user's state still names the plan as their plan in progress. A
+        greeting clears it, in whichever worker process it was handled.
+    """
+    try:
+        user_state = state_store.get(plan_tasks.user_id)
+    except sqlite3.Error as e:
+        print(f"Could not check whether the plan of {plan_tasks.user_id} is still wanted: {e}")
+        return True
+    # An evicted state has no newer plan either
+    return user_state is None or user_state.get('plan_id') == plan_tasks.plan_id
+
 def process_feature_details(channel_id, user_id, selected_tabs, feature_name, 
-                                    feature_details, feature_criteria):
-    try: 
-        global conversation_states
-        # Assume the role just before the AWS service call
-        role_arn = "arn:aws:iam::511738828901:role/test-plan-creator"  
-        external_id = "test-plan-creator" 
-
-        session_credentials = assume_role(role_arn, external_id)
-        if session_credentials:
-            aws_access_key_id_temp = session_credentials['AccessKeyId']
-            aws_secret_access_key_temp = session_credentials['SecretAccessKey']
-            aws_session_token_temp = session_credentials['SessionToken']
-
-            new_sheet_id = duplicate_template_sheet(config['google_service_account_info'], TEMPLATE_SHEET_ID, feature_name)
-            print("New Sheet ID:", new_sheet_id)
+                                    feature_details, feature_criteria, last_plan=None, plan_tasks=None,
+                                    bypass_cache=False):
+    """
+    Builds the test plan and sends its spreadsheet to the user. Given last_plan, the plan
+    is revised in last_plan's spreadsheet instead: only the tabs whose prompt changed or
+    that are newly selected are regenerated, and only their changed rows are written.
+    Args:
+        plan_tasks (PlanTasks): The plan in the tab scheduler, cancelled if the user starts over.
+        bypass_cache (bool): Ask Bedrock for every tab, instead of reusing cached responses
+            or the stored cases of a similar feature.
+    """
+    if plan_tasks is None:
+        plan_tasks = tab_scheduler.start_plan(user_id, max_in_flight=TAB_CONCURRENCY)
+    progress = None
+    with metrics.stage('plan'):
+        try: 
+            # Cached credentials are reused across plans and refreshed shortly before they expire
+            with metrics.stage('credentials'):
+                session_credentials = get_credential_provider(ROLE_ARN, EXTERNAL_ID).get_credentials()
+            if session_credentials:
+                aws_access_key_id_temp = session_credentials['AccessKeyId']
+                aws_secret_access_key_temp = session_credentials['SecretAccessKey']
+                aws_session_token_temp = session_credentials['SessionToken']
+                bedrock_client = get_bedrock_client(aws_access_key_id_temp, aws_secret_access_key_temp,
+                                                    aws_session_token_temp, session_credentials['Generation'])
+                plan_tasks.raise_if_cancelled()
+                progress = slack_outbox.start_progress(slack_client, channel_id,
+                                                       f"{'Revising' if last_plan else 'Building'} test cases "
+                                                       f"for {feature_name}",
+                                                       [tab_mapping[tab] for tab in selected_tabs])
+                tab_hashes = {tab: tab_prompt_hash(feature_name, feature_details, feature_criteria, tab_mapping[tab])
+                              for tab in selected_tabs}
+
+                if last_plan:
+                    new_sheet_id = last_plan['sheet_id']
+                    sheet_writer = SheetWriter(config['google_service_account_info'], new_sheet_id, template_sheet_ids())
+                    tabs_to_generate = [tab for tab in selected_tabs
+                                        if last_plan['tab_hashes'].get(tab) != tab_hashes[tab]]
+                    for tab in selected_tabs:
+                        if tab not in tabs_to_generate:
+                            progress.update(tab_mapping[tab], 'unchanged')
+                    metrics.inc('plan_revision_tabs_total', len(selected_tabs) - len(tabs_to_generate),
+                                help_text='Tabs of revised plans, by whether they were regenerated.',
+                                result='unchanged')
+                    metrics.inc('plan_revision_tabs_total', len(tabs_to_generate),
+                                help_text='Tabs of revised plans, by whether they were regenerated.',
+                                result='regenerated')
+                    # The rows currently in the sheet, to write only the rows that change
+                    with metrics.stage('sheets_read'):
+                        previous_tables = sheet_writer.read([tab_mapping[tab] for tab in tabs_to_generate], 3)
+                else:
+                    with metrics.stage('duplicate_sheet'):
+                        new_sheet_id = new_plan_sheet(feature_name)
+                        print("New Sheet ID:", new_sheet_id)
+                        sheet_writer = SheetWriter(config['google_service_account_info'], new_sheet_id, template_sheet_ids())
+                    tabs_to_generate = selected_tabs
+                    previous_tables = None
             
-            for tab in selected_tabs:
-                tab_name = tab_mapping[tab] 
-                send_slack_message(slack_client, channel_id, f"Getting test cases for {tab_name} tab")
-                prompt = build_claude_prompt(feature_name, feature_details, feature_criteria, tab_name)
-                raw_response = invoke_claude(prompt, aws_access_key_id_temp, aws_secret_access_key_temp, aws_session_token_temp)
-                send_slack_message(slack_client, channel_id, f"Successfully built test cases for {tab_name} tab")
+                failed_tabs = generate_tabs(progress, tabs_to_generate, feature_name, feature_details,
+                                            feature_criteria, bedrock_client, sheet_writer, previous_tables,
+                                            plan_tasks, bypass_cache)
+                # Commits writes deferred by SHEETS_DEFERRED_WRITES
+                with metrics.stage('sheets_write'):
+                    sheet_writer.flush()
+                progress.set_title(f"Built test cases for {feature_name}")
+                # Lets the final progress state land above the messages below
+                progress.close()
+                if failed_tabs:
+                    send_slack_message(slack_client, channel_id,
+                                       f"Could not build test cases for: {', '.join(failed_tabs)}")
+
+                sheet_url = f"https://docs.google.com/spreadsheets/d/{new_sheet_id}"
+                sheet_message = f"Here's the Google Sheet with test cases: {sheet_url}"
+                # Failed tabs keep their old hash (if any), so the next revision retries them
+                failed = {tab for tab in tabs_to_generate if tab_mapping[tab] in failed_tabs}
+                plan_hashes = dict(last_plan['tab_hashes']) if last_plan else {}
+                plan_hashes.update({tab: tab_hash for tab, tab_hash in tab_hashes.items() if tab not in failed})
+                with state_store.transaction(user_id, default=NEW_USER_STATE) as user_state:
+                    user_state['last_bot_message'] = sheet_message
+                    user_state['last_plan'] = {
+                        'sheet_id': new_sheet_id,
+                        'feature_name': feature_name,
+                        'feature_details': feature_details,
+                        'feature_criteria': feature_criteria,
+                        'selected_tabs': selected_tabs,
+                        'tab_hashes': plan_hashes,
+                    }
+                send_slack_message(slack_client, channel_id, sheet_message)    
+    
+        except PlanCancelled:
+            # The user started over; the tabs written so far stay in the sheet
+            print(f"The plan of {user_id} for {feature_name} was cancelled")
+            if progress is not None:
+                progress.set_title(f"Cancelled test cases for {feature_name}")
+                progress.close()
+
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+
+        finally:
+            plan_tasks.close()
+            # Let the user start a new plan, unless they already restarted with a greeting
+            # (and maybe started another plan)
+            with state_store.transaction(user_id, default=NEW_USER_STATE) as user_state:
+                if user_state.get('status') == 'generating' and user_state.get('plan_id') == plan_tasks.plan_id:
+                    user_state['status'] = 'new'
+                    user_state['plan_id'] = None
+
+def generate_tabs(progress, selected_tabs, feature_name, feature_details, feature_criteria,
+                  bedrock_client, sheet_writer, previous_tables=None, plan_tasks=None, bypass_cache=False):
+    """
+    Generates the selected tabs on the tab scheduler, at most TAB_CONCURRENCY at a time.
+    Each tab is written to the sheet as soon as it finishes, and a failing tab does not
+    abort the others. Test cases that nearly repeat one already kept for the plan are dropped.
+    Args:
+        previous_tables (dict): {tab name: rows currently in the sheet} when revising a
+            plan, so only the rows that change are written.
+        plan_tasks (PlanTasks): The user's plan in the tab scheduler. Without one (batch
+            generation) the tabs run behind every Slack plan's.
+        bypass_cache (bool): Ask Bedrock for every tab, instead of reusing cached responses
+            or the stored cases of a similar feature.
+    Returns:
+        list: The names of the tabs that failed.
+    Raises:
+        PlanCancelled: If the plan was cancelled.
+    """
+    failed_tabs = []
+    duplicate_filter = create_near_duplicate_filter() if selected_tabs else None
+    if plan_tasks is None:
+        plan_tasks = tab_scheduler.start_plan(priority=PRIORITY_BATCH, max_in_flight=TAB_CONCURRENCY)
+        close_plan = True
+    else:
+        close_plan = False
+        if len(selected_tabs) == 1:
+            plan_tasks.priority = PRIORITY_SINGLE_TAB
+    try:
+        # Each tab runs in a copy of this context so timings stay attributed to the job
+        futures = {
+            plan_tasks.submit(generate_tab, progress, tab_mapping[tab], feature_name, feature_details,
+                              feature_criteria, bedrock_client, sheet_writer,
+                              None if previous_tables is None else previous_tables.get(tab_mapping[tab], []),
+                              duplicate_filter, bypass_cache):
+                tab_mapping[tab]
+            for tab in selected_tabs
+        }
+        for future in as_completed(futures):
+            tab_name = futures[future]
+            try:
+                future.result()
+            except (CancelledError, PlanCancelled):
+                progress.update(tab_name, 'cancelled')
+            except Exception as e:
+                print(f"An error occurred while building the {tab_name} tab: {e}")
+                traceback.print_exc()
+                progress.update(tab_name, 'failed')
+                failed_tabs.append(tab_name)
+    finally:
+        if close_plan:
+            plan_tasks.close()
+    plan_tasks.raise_if_cancelled()
+    return failed_tabs
+
+def generate_tab(progress, tab_name, feature_name, feature_details, feature_criteria,
+                 bedrock_client, sheet_writer, previous=None, duplicate_filter=None, bypass_cache=False):
+    with metrics.tagged(tab=tab_name), metrics.stage('tab'):
+        progress.update(tab_name, 'generating')
+        similar = similar_cases(feature_name, feature_details, tab_name)
+        examples = similar if CORPUS_REUSE == 'seed' else None
+        # A regenerated plan asks for fresh test cases, so it never reuses stored ones
+        reused = bool(similar) and CORPUS_REUSE == 'shortcut' and not bypass_cache
+        slices = prompt_slices(tab_name) if SPLIT_LARGE_TABS else ()
+        if reused:
+            parsed_data = similar
+        elif slices:
+            parsed_data = generate_tab_split(tab_name, slices, feature_name, feature_details, feature_criteria,
+                                             bedrock_client, examples, bypass_cache)
+        else:
+            with metrics.stage('prompt'):
+                prompt = build_claude_prompt_parts(feature_name, feature_details, feature_criteria, tab_name,
+                                                   examples=examples)
+            # Revisions are not streamed, as only the rows that change are written
+            if BEDROCK_STREAMING and previous is None:
+                parsed_data = generate_tab_streaming(tab_name, prompt, bedrock_client, sheet_writer,
+                                                     duplicate_filter, bypass_cache)
+                store_cases(feature_name, feature_details, tab_name, parsed_data)
+                progress.update(tab_name, 'done')
+                return
+            raise_if_cancelled()
+            with metrics.stage('bedrock'):
+                raw_response = invoke_claude(prompt, bedrock_client=bedrock_client, bypass_cache=bypass_cache)
+            with metrics.stage('parse'):
                 parsed_data = parse_claude_response(raw_response)  # This function should return a 2D array
-                # Find the tab in the spreadsheet and update it with parsed data
-                last_col_num = len(parsed_data[0])
-                end_column_letter = chr(ord('A') + last_col_num - 1)
-                formatted_range = f"'{tab_name}'!A3:{end_column_letter}{len(parsed_data) + 2}"  # +2 to account for header rows
-                update_sheet_with_data(sheets_service, new_sheet_id, formatted_range, parsed_data)  
+        # Nothing is stored or written for a plan that was cancelled while this tab generated
+        raise_if_cancelled()
+        parsed_data = remove_near_duplicates(duplicate_filter, tab_name, parsed_data)
+        if not reused:
+            store_cases(feature_name, feature_details, tab_name, parsed_data)
+        if previous is not None:
+            patch_tab(tab_name, parsed_data, previous, sheet_writer)
+            progress.update(tab_name, 'done')
+            return
+        # Find the tab in the spreadsheet and update it with parsed data
+        formatted_range = tab_range(tab_name, 3, parsed_data)  # Row 3 is below the template's header rows
+        if SHEETS_DEFERRED_WRITES:
+            sheet_writer.add(formatted_range, parsed_data)
+        else:
+            with metrics.stage('sheets_write'):
+                sheet_writer.write(formatted_range, parsed_data)
+        progress.update(tab_name, 'done')
 
+def patch_tab(tab_name, parsed_data, previous, sheet_writer):
+    """
+    Writes only the runs of rows of parsed_data that differ from the rows previously in
+    the tab, and clears the previous rows past its end.
+    """
+    runs = diff_rows(parsed_data, previous)
+    changed = sum(len(rows) for _, rows in runs)
+    metrics.inc('plan_revision_rows_total', changed, help_text='Rows of revised tabs, by whether they were written.',
+                result='written')
+    metrics.inc('plan_revision_rows_total', max(len(parsed_data), len(previous)) - changed,
+                help_text='Rows of revised tabs, by whether they were written.', result='unchanged')
+    if not runs:
+        return
+    for offset, rows in runs:
+        sheet_writer.add(tab_range(tab_name, 3 + offset, rows), rows, resize=False)
+    if SHEETS_DEFERRED_WRITES:
+        sheet_writer.add(f"'{tab_name}'")
+    else:
+        # Commits the runs together with the resize
+        with metrics.stage('sheets_write'):
+            sheet_writer.resize(tab_name)
 
-            sheet_url = f"https://docs.google.com/spreadsheets/d/{new_sheet_id}"
-            sheet_message = f"Here's the Google Sheet with test cases: {sheet_url}"
-            send_slack_message(slack_client, channel_id, sheet_message)    
+def generate_tab_split(tab_name, slices, feature_name, feature_details, feature_criteria, bedrock_client,
+                       examples=None, bypass_cache=False):
+    """
+    Generates each slice of the tab with its own prompt, in parallel as tasks of the tab's
+    plan in the tab scheduler, so no single response runs into max_tokens, and merges the
+    slices' rows under one header.
+    Args:
+        examples (list): Earlier test cases (header row first) to seed every slice with.
+    Returns:
+        list: The merged table, with duplicate rows removed and S.No renumbered.
+    """
+    def generate_slice(slice_name):
+        with metrics.tagged(slice=slice_name):
+            with metrics.stage('prompt'):
+                prompt = build_claude_prompt_parts(feature_name, feature_details, feature_criteria, tab_name,
+                                                   slice_name, examples=examples)
+            raise_if_cancelled()
+            with metrics.stage('bedrock'):
+                raw_response = invoke_claude(prompt, bedrock_client=bedrock_client, bypass_cache=bypass_cache)
+            with metrics.stage('parse'):
+                return parse_claude_response(raw_response)
 
-            user_state = conversation_states.get(user_id, {})
-            user_state['last_bot_message'] = sheet_message
-            user_state['status'] = 'new'
-            conversation_states[user_id] = user_state   
-    
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        traceback.print_exc()
+    plan = current_plan()
+    if plan is not None:
+        tables = plan.map(generate_slice, slices)
+    else:
+        # Called outside a plan's tab task, the slices make up a plan of their own
+        plan = tab_scheduler.start_plan(max_in_flight=len(slices))
+        try:
+            tables = plan.map(generate_slice, slices)
+        finally:
+            plan.close()
+    with metrics.stage('merge'):
+        return merge_tables(tables)
+
+def generate_tab_streaming(tab_name, prompt, bedrock_client, sheet_writer, duplicate_filter=None,
+                           bypass_cache=False):
+    """
+    Streams the tab's response from Bedrock, parsing rows as they arrive and writing them
+    to the sheet in batches of STREAM_FLUSH_ROWS while generation continues. Near duplicates
+    are removed from each batch before it is written.
+    Returns:
+        list: Every row written, header row first.
+    """
+    parser = IncrementalTableParser()
+    table = []
+    pending_rows = []
+    next_row = 3  # Row 3 is below the template's header rows
+    flushes = []
+    # A single writer thread keeps the batches in order without blocking the stream
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='sheet-writer') as writer:
+        def flush():
+            nonlocal pending_rows, next_row
+            if table:
+                # Filters the batch under the header already written, numbering on from the last row
+                pending_rows = remove_near_duplicates(duplicate_filter, tab_name, [table[0]] + pending_rows,
+                                                      len(table))[1:]
+            else:
+                pending_rows = remove_near_duplicates(duplicate_filter, tab_name, pending_rows)
+            if not pending_rows:
+                return
+            table.extend(pending_rows)
+            flushes.append(writer.submit(contextvars.copy_context().run, sheet_writer.write,
+                                         tab_range(tab_name, next_row, pending_rows), pending_rows, resize=False))
+            next_row += len(pending_rows)
+            pending_rows = []
+
+        for chunk in invoke_claude_stream(prompt, bedrock_client, bypass_cache=bypass_cache):
+            # Stops reading the stream (and writing its rows) once the plan is cancelled
+            raise_if_cancelled()
+            with metrics.stage('parse'):
+                rows = parser.feed(chunk)
+            pending_rows.extend(rows)
+            if len(pending_rows) >= STREAM_FLUSH_ROWS:
+                flush()
+        pending_rows.extend(parser.close())
+        if pending_rows:
+            flush()
+        for future in flushes:
+            future.result()
+
+    sheet_writer.resize(tab_name)
+    return table
+
+def remove_near_duplicates(duplicate_filter, tab_name, table, first_number=1):
+    """
+    Returns:
+        list: table (header row first) without the test cases that nearly repeat one kept
+        before, with S.No renumbered from first_number. table itself if duplicate_filter is None.
+    """
+    if duplicate_filter is None:
+        return table
+    with metrics.stage('dedupe'):
+        filtered = duplicate_filter.filter_table(table, first_number)
+    metrics.inc('near_duplicates_removed_total', len(table) - len(filtered),
+                help_text='Generated test cases dropped as near duplicates of another case of the plan.')
+    if len(filtered) < len(table):
+        print(f"Removed {len(table) - len(filtered)} near-duplicate test cases from {tab_name}")
+    return filtered
+
+def tab_prompt_hash(feature_name, feature_details, feature_criteria, tab_name):
+    """
+    Returns:
+        str: A hash of the Bedrock requests the tab is generated from. When it is unchanged,
+        regenerating the tab would send the same prompts.
+    """
+    slices = prompt_slices(tab_name) if SPLIT_LARGE_TABS else ()
+    prompts = [build_claude_prompt_parts(feature_name, feature_details, feature_criteria, tab_name, slice_name)
+               for slice_name in slices or (None,)]
+    return hashlib.sha256(json.dumps([request_key(prompt) for prompt in prompts]).encode()).hexdigest()
+
+def similar_cases(feature_name, feature_details, tab_name):
+    """
+    Returns:
+        list: The stored cases of tab_name (header row first) of a feature highly similar
+        to this one, or None if there are none or CORPUS_REUSE is off.
+    """
+    if CORPUS_REUSE not in ('seed', 'shortcut'):
+        return None
+    corpus = get_corpus()
+    if corpus is None:
+        return None
+    try:
+        with metrics.stage('corpus_lookup'):
+            match = corpus.find_similar(feature_name, feature_details, tab_name, CORPUS_REUSE_SIMILARITY)
+    except sqlite3.Error as e:
+        print(f"Error looking up similar test cases for {tab_name}: {e}")
+        return None
+    if match is None:
+        return None
+    metrics.inc('corpus_reuse_total', help_text='Tabs seeded with or reusing the test cases of a similar feature.',
+                mode=CORPUS_REUSE)
+    return match[1]
+
+def store_cases(feature_name, feature_details, tab_name, parsed_data):
+    # The corpus is best effort; a failure to store never fails the tab
+    corpus = get_corpus()
+    if corpus is None:
+        return
+    try:
+        with metrics.stage('corpus_store'):
+            corpus.add_table(feature_name, feature_details, tab_name, parsed_data)
+    except sqlite3.Error as e:
+        print(f"Error storing the {tab_name} test cases in the corpus: {e}")
+
+def new_plan_sheet(feature_name):
+    """
+    Returns:
+        str: The ID of a new copy of the template named feature_name, taken from the
+        spreadsheet pool if it has one.
+    """
+    service_account_info = config['google_service_account_info']
+    pool = get_sheet_pool()
+    if pool is not None:
+        spreadsheet_id = pool.claim(service_account_info, feature_name)
+        if spreadsheet_id is not None:
+            return spreadsheet_id
+    return duplicate_template_sheet(service_account_info, TEMPLATE_SHEET_ID, feature_name)
+
+def template_sheet_ids():
+    # Copies keep the template's sheetIds, so the template is only looked up once
+    sheets_service = initialize_sheets_service(config['google_service_account_info'])
+    return get_sheet_ids(sheets_service, TEMPLATE_SHEET_ID)
+
+def tab_range(tab_name, start_row, rows):
+    last_col_num = max(len(row) for row in rows)
+    end_column_letter = chr(ord('A') + last_col_num - 1)
+    return f"'{tab_name}'!A{start_row}:{end_column_letter}{start_row + len(rows) - 1}"
+
+def search_test_cases(text):
+    """
+    Searches past test cases for the search slash command. Words such as tab:security,
+    priority:p0 or feature:checkout narrow the search; the other words must all appear
+    in the test case.
+    Returns:
+        str: The matching test cases, formatted for Slack.
+    """
+    corpus = get_corpus()
+    if corpus is None:
+        return "The test case corpus is disabled."
+    filters, words = {}, []
+    for word in text.split():
+        name, _, value = word.partition(':')
+        if value and name.lower() in ('tab', 'priority', 'feature'):
+            filters.setdefault(name.lower(), []).append(value)
+        else:
+            words.append(word)
+    tab = ' '.join(filters.get('tab', [])) or None
+    if tab:
+        # Tabs can be given by key (acceptance_criteria) or by name
+        tab = tab_mapping.get(tab.lower(), tab)
+    priority = ' '.join(filters.get('priority', [])) or None
+    feature = ' '.join(filters.get('feature', [])) or None
+    if not (words or tab or priority or feature):
+        return "Usage: <words> [tab:<tab>] [priority:<P0|P1|P2>] [feature:<words>]"
+    try:
+        with metrics.stage('corpus_search'):
+            results = corpus.search(' '.join(words), tab=tab, priority=priority, feature=feature,
+                                    limit=CORPUS_SEARCH_RESULTS)
+    except sqlite3.Error as e:
+        print(f"Error searching the test case corpus: {e}")
+        return "Could not search past test cases, please try again."
+    if not results:
+        return "No past test cases match your search."
+    lines = [f"Past test cases matching *{html.escape(text.strip(), quote=False)}*:"]
+    for result in results:
+        lines.append(f"• [{result['priority'] or '-'}] {html.escape(result['description'] or '', quote=False)} "
+                     f"_({html.escape(result['feature_name'], quote=False)} / {result['tab']})_")
+    return '\n'.join(lines)
+
+def send_message(text, channel_id, user_id):
+    send_slack_message(slack_client, channel_id, text)
 
 def send_greeting(channel_id, user_id):
-    global conversation_states
-    
-    welcome_message = (
-        ":wave: Hi! Welcome to Test Plan Creator.\n"
-        "To create a test plan, I’ll start by asking a few questions about the feature. "
-        "What is the name of the feature you're working on?"
-    )
-    send_slack_message(slack_client, channel_id, welcome_message)
-    user_state = conversation_states.get(user_id, {})
-    user_state['last_bot_message'] = welcome_message
-    conversation_states[user_id] = user_state
+    send_slack_message(slack_client, channel_id, WELCOME_MESSAGE)
     
 def ask_for_feature_details(channel_id, user_id):
-    global conversation_states
-    
     # Since we've already asked for the feature name in `send_greeting`, move on to the next question.
-    message = "Please provide the details for the feature."
-    send_slack_message(slack_client, channel_id, message)
-    
-    user_state = conversation_states.get(user_id, {})
-    user_state['last_bot_message'] = message
-    conversation_states[user_id] = user_state
+    send_slack_message(slack_client, channel_id, FEATURE_DETAILS_MESSAGE)
 
 def ask_for_extra_details(channel_id, user_id):
-    global conversation_states
-
-    message = "Could you please provide any additional details/acceptance criteria/API Information (if any) for the feature? Else just reply with N/A"
-    send_slack_message(slack_client, channel_id, message)
-    # Update the user state to expect acceptance criteria.
-    
-    user_state = conversation_states.get(user_id, {})
-    user_state['last_bot_message'] = message
-    conversation_states[user_id] = user_state
+    send_slack_message(slack_client, channel_id, EXTRA_DETAILS_MESSAGE)
 
 def escape_html(text):
     return html.unescape(text) 
 
-def ask_for_tabs_update(channel_id, user_id):
+def ask_for_tabs_update(channel_id, user_id, selected_tabs=None):
     blocks = [
         {
             "type": "section",
@@ -295,16 +1055,26 @@ def ask_for_tabs_update(channel_id, user_id):
             ],
         },
     ]
+    if selected_tabs:
+        # Slack requires the initial options to be copies of the options themselves
+        checkboxes = blocks[1]['accessory']
+        checkboxes['initial_options'] = [option for option in checkboxes['options']
+                                         if option['value'] in selected_tabs]
 
     fallback_text = 'Please select the tabs to update with test cases.'
+    from slack_sdk.errors import SlackApiError
     try:
-        response = slack_client.chat_postMessage(
-            channel=channel_id,
-            text=fallback_text, 
-            blocks=blocks
-            )
+        with metrics.outbound_call('slack', 'chat_postMessage'):
+            response = slack_client.chat_postMessage(
+                channel=channel_id,
+                text=fallback_text, 
+                blocks=blocks
+                )
     except SlackApiError as e:
         print(f"Error sending interactive message: {e.response['error']}")
 
+if WARM_UP:
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
 if __name__ == '__main__':
     app.run(debug=True)  
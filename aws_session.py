@@ -1,17 +1,100 @@
-import boto3
-from botocore.exceptions import ClientError
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+import metrics
 
-def assume_role(role_arn, external_id):
+def assume_role(role_arn, external_id, sts_client=None):
+    # boto3 is imported on first use to keep importing the app cheap
+    import boto3
+    from botocore.exceptions import ClientError
     timestamp_str = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    sts_client = boto3.client('sts')
+    sts_client = sts_client or boto3.client('sts')
     try:
-        assumed_role_object = sts_client.assume_role(
-            RoleArn=role_arn,
-            RoleSessionName=f"TestPlanCreatorSession{timestamp_str}",
-            ExternalId=external_id
-        )
+        with metrics.outbound_call('sts', 'assume_role'):
+            assumed_role_object = sts_client.assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=f"TestPlanCreatorSession{timestamp_str}",
+                ExternalId=external_id
+            )
         return assumed_role_object['Credentials']
     except ClientError as e:
         print(f"Error assuming role: {e}")
         return None
+
+class AssumedRoleCredentialProvider:
+    """
+    Caches the temporary credentials of an assumed role and refreshes them shortly before
+    they expire. Refreshes are single-flight: concurrent callers wait for one AssumeRole
+    call and share its result.
+    """
+
+    def __init__(self, role_arn, external_id, refresh_margin=timedelta(minutes=5)):
+        self.role_arn = role_arn
+        self.external_id = external_id
+        self.refresh_margin = refresh_margin
+        self.hits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        # Incremented on every refresh so clients built from the credentials can be keyed by it
+        self.generation = 0
+        self._credentials = None
+        self._sts_client = None
+        self._lock = Lock()
+
+    def _is_fresh(self, credentials, margin):
+        if not credentials:
+            return False
+        return datetime.now(timezone.utc) < credentials['Expiration'] - margin
+
+    def get_credentials(self):
+        """
+        Returns:
+            dict: The STS Credentials (AccessKeyId, SecretAccessKey, SessionToken, Expiration)
+            plus the Generation they belong to, or None if the role could not be assumed.
+        """
+        credentials = self._credentials
+        if self._is_fresh(credentials, self.refresh_margin):
+            self.hits += 1
+            return credentials
+
+        with self._lock:
+            # Another thread may have refreshed while we were waiting for the lock
+            if self._is_fresh(self._credentials, self.refresh_margin):
+                self.hits += 1
+                return self._credentials
+
+            if self._sts_client is None:
+                import boto3
+                self._sts_client = boto3.client('sts')
+            new_credentials = assume_role(self.role_arn, self.external_id, self._sts_client)
+            if new_credentials:
+                self.generation += 1
+                self.refreshes += 1
+                self._credentials = dict(new_credentials, Generation=self.generation)
+                return self._credentials
+
+            self.refresh_failures += 1
+            # Keep serving the old credentials while they are still valid
+            if self._is_fresh(self._credentials, timedelta(0)):
+                return self._credentials
+            return None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'generation': self.generation,
+        }
+
+_providers = {}
+_providers_lock = Lock()
+
+def get_credential_provider(role_arn, external_id):
+    """
+    Returns the process-wide credential provider for the given role and external ID.
+    """
+    with _providers_lock:
+        key = (role_arn, external_id)
+        if key not in _providers:
+            _providers[key] = AssumedRoleCredentialProvider(role_arn, external_id)
+        return _providers[key]
@@ -0,0 +1,333 @@
+"""
+Generates test plans for many features at once, outside of Slack.
+
+Features are read from a CSV file (columns feature_name, feature_details, feature_criteria
+and tabs) or a JSONL file with the same keys. tabs lists tab values or names separated by
+commas or semicolons (a list in JSONL); every tab is generated when it is empty. Each plan
+is written to a copy of the template spreadsheet, or to local CSV or XLSX files.
+
+Finished plans are recorded in a state file next to the output, so rerunning the same
+command after an interruption skips them and only retries the tabs that failed.
+
+    python batch_generate.py features.csv --output xlsx --out-dir plans
+"""
+import argparse
+import contextvars
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import app
+from aws_session import get_credential_provider
+from bedrock_integration import rate_limiter, response_cache
+from client_registry import get_bedrock_client
+from parse_text import remove_curly_brace_pairs
+from sheets_manager import duplicate_template_sheet, SheetWriter
+from tab_scheduler import TabScheduler
+
+OUTPUT_FORMATS = ('sheets', 'csv', 'xlsx')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV or JSONL file with one feature per row')
+    parser.add_argument('--output', choices=OUTPUT_FORMATS, default='sheets',
+                        help='copies of the template spreadsheet, or local CSV/XLSX files')
+    parser.add_argument('--out-dir', default='batch_output', help='directory for local files and the state file')
+    parser.add_argument('--state', help='state file used to resume (default: <out-dir>/batch_state.jsonl)')
+    parser.add_argument('--feature-concurrency', type=int, default=4,
+                        help='features generated in parallel (tabs per feature follow TAB_CONCURRENCY)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='ask Bedrock for every tab instead of reusing cached responses or stored cases')
+    args = parser.parse_args(argv)
+    if args.output == 'xlsx':
+        # Checked before any tab is generated, rather than when the first plan is written
+        try:
+            import openpyxl
+        except ImportError:
+            parser.error("--output xlsx needs openpyxl: pip install openpyxl")
+    return args
+
+def split_tabs(tabs):
+    if isinstance(tabs, str):
+        tabs = re.split(r'[;,]', tabs)
+    selected = []
+    names = {name.lower(): value for value, name in app.tab_mapping.items()}
+    for tab in tabs or []:
+        tab = tab.strip()
+        if not tab:
+            continue
+        value = tab if tab in app.tab_mapping else names.get(tab.lower())
+        if value is None:
+            raise ValueError(f"Unknown tab '{tab}'. Use one of: {', '.join(app.tab_mapping)}")
+        selected.append(value)
+    return selected or list(app.tab_mapping)
+
+def read_features(path):
+    """
+    Returns:
+        list: One dict per feature with name, details, criteria, tabs and a stable key.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    features = []
+    for number, row in enumerate(rows, start=1):
+        name = (row.get('feature_name') or row.get('name') or '').strip()
+        if not name:
+            raise ValueError(f"Row {number} of {path} has no feature_name")
+        feature = {
+            'name': remove_curly_brace_pairs(name).strip(),
+            'details': remove_curly_brace_pairs(row.get('feature_details') or row.get('details') or '').strip(),
+            'criteria': remove_curly_brace_pairs(row.get('feature_criteria') or row.get('criteria') or 'N/A').strip(),
+            'tabs': split_tabs(row.get('tabs')),
+        }
+        # Identifies the feature across runs, so a resumed run recognizes finished plans
+        feature['key'] = hashlib.sha256(json.dumps(
+            [feature['name'], feature['details'], feature['criteria']]).encode()).hexdigest()[:16]
+        features.append(feature)
+    return features
+
+class StateFile:
+    """
+    Append-only JSONL record of finished plans. The last record of a feature wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by an interruption
+                    self.records[record['key']] = record
+
+    def record(self, record):
+        with self._lock:
+            self.records[record['key']] = record
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+class LocalTableWriter:
+    """
+    Stand-in for SheetWriter that collects each tab's rows and writes them to a CSV file
+    per tab, or to one XLSX workbook with a sheet per tab, when flushed.
+    """
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self.rows_written = 0
+        self._tabs = {}
+        self._lock = threading.Lock()
+
+    def add(self, sheet_range, values=None, resize=True):
+        if not values:
+            return
+        sheet_name, cells = sheet_range.split('!')
+        start_row = int(re.match(r'[A-Z]+(\d+)', cells).group(1))
+        with self._lock:
+            rows = self._tabs.setdefault(sheet_name.strip("'"), {})
+            for offset, row in enumerate(values):
+                rows[start_row + offset] = row
+            self.rows_written += len(values)
+
+    def write(self, sheet_range, values, resize=True):
+        self.add(sheet_range, values, resize)
+
+    def resize(self, sheet_name):
+        pass
+
+    def flush(self):
+        with self._lock:
+            tabs = {name: [rows[i] for i in sorted(rows)] for name, rows in self._tabs.items()}
+        if self.output_format == 'csv':
+            os.makedirs(self.path, exist_ok=True)
+            for name, rows in tabs.items():
+                with open(os.path.join(self.path, f"{slugify(name)}.csv"), 'w', newline='', encoding='utf-8') as f:
+                    csv.writer(f).writerows(rows)
+        else:
+            self._write_xlsx(tabs)
+
+    def _write_xlsx(self, tabs):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportError("XLSX output needs openpyxl: pip install openpyxl")
+        if os.path.exists(self.path):
+            # A resumed run replaces the tabs it regenerated and keeps the others
+            workbook = openpyxl.load_workbook(self.path)
+        else:
+            workbook = openpyxl.Workbook()
+            workbook.remove(workbook.active)
+        for name, rows in tabs.items():
+            title = name[:31]  # Excel's sheet name limit
+            if title in workbook.sheetnames:
+                workbook.remove(workbook[title])
+            sheet = workbook.create_sheet(title)
+            for row in rows:
+                sheet.append(row)
+        workbook.save(self.path)
+
+class CountingWriter:
+    """
+    Wraps a SheetWriter to count the rows written through it.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.rows_written = 0
+        self._lock = threading.Lock()
+
+    def _count(self, values):
+        with self._lock:
+            self.rows_written += len(values or [])
+
+    def add(self, sheet_range, values=None, resize=True):
+        self._count(values)
+        return self.writer.add(sheet_range, values, resize)
+
+    def write(self, sheet_range, values, resize=True):
+        self._count(values)
+        self.writer.write(sheet_range, values, resize)
+
+    def resize(self, sheet_name):
+        self.writer.resize(sheet_name)
+
+    def flush(self):
+        self.writer.flush()
+
+class ConsoleProgress:
+    """
+    Progress of one plan's tabs, printed instead of posted to Slack.
+    """
+
+    def __init__(self, feature_name):
+        self.feature_name = feature_name
+
+    def update(self, item, status):
+        if status in ('done', 'failed'):
+            print(f"[{self.feature_name}] {item}: {status}")
+
+def slugify(text):
+    return re.sub(r'[^A-Za-z0-9]+', '-', text).strip('-').lower() or 'feature'
+
+def open_output(feature, args, location=None):
+    """
+    Returns:
+        tuple: The writer for the feature's plan and its location (sheet URL or file path).
+        A location from an earlier run is reused, so retried tabs land in the same plan.
+    """
+    if args.output == 'sheets':
+        app.init_services()
+        service_account_info = app.config['google_service_account_info']
+        if location is None:
+            spreadsheet_id = duplicate_template_sheet(service_account_info, app.TEMPLATE_SHEET_ID, feature['name'])
+            location = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
+        spreadsheet_id = location.rsplit('/', 1)[-1]
+        return CountingWriter(SheetWriter(service_account_info, spreadsheet_id, app.template_sheet_ids())), location
+
+    if location is None:
+        name = f"{slugify(feature['name'])}-{feature['key'][:8]}"
+        location = os.path.join(args.out_dir, name + ('.xlsx' if args.output == 'xlsx' else ''))
+    return LocalTableWriter(location, args.output), location
+
+def generate_plan(feature, tabs, args, location):
+    session_credentials = get_credential_provider(app.ROLE_ARN, app.EXTERNAL_ID).get_credentials()
+    if not session_credentials:
+        raise RuntimeError("Could not assume the Bedrock role")
+    bedrock_client = get_bedrock_client(session_credentials['AccessKeyId'], session_credentials['SecretAccessKey'],
+                                        session_credentials['SessionToken'], session_credentials['Generation'])
+    writer, location = open_output(feature, args, location)
+    failed_tabs = app.generate_tabs(ConsoleProgress(feature['name']), tabs, feature['name'], feature['details'],
+                                    feature['criteria'], bedrock_client, writer, bypass_cache=args.no_cache)
+    writer.flush()
+    # generate_tabs reports tab names; the state file keeps tab values
+    names = {name: value for value, name in app.tab_mapping.items()}
+    return location, [names[name] for name in failed_tabs], writer.rows_written
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.out_dir, exist_ok=True)
+    state = StateFile(args.state or os.path.join(args.out_dir, 'batch_state.jsonl'))
+    features = read_features(args.input)
+
+    # Plans finished before are skipped; plans with failed tabs only retry those tabs
+    work = []
+    skipped = 0
+    for feature in features:
+        previous = state.records.get(feature['key'])
+        if previous and previous['output'] == args.output:
+            tabs = [tab for tab in feature['tabs'] if tab in previous['failed_tabs'] or tab not in previous['tabs']]
+            if not tabs:
+                skipped += 1
+                continue
+            work.append((feature, tabs, previous))
+        else:
+            work.append((feature, feature['tabs'], None))
+
+    print(f"{len(features)} features, {skipped} already done, {len(work)} to generate "
+          f"({sum(len(tabs) for _, tabs, _ in work)} tabs)")
+    start = time.perf_counter()
+    totals = {'plans': 0, 'failed_plans': 0, 'tabs': 0, 'failed_tabs': 0, 'rows': 0}
+    # No Slack plans compete for the tab workers here: give every feature its TAB_CONCURRENCY
+    app.tab_scheduler = TabScheduler(max_workers=max(1, args.feature_concurrency) * max(1, app.TAB_CONCURRENCY))
+    executor = ThreadPoolExecutor(max_workers=max(1, args.feature_concurrency), thread_name_prefix='feature')
+    try:
+        futures = {
+            executor.submit(contextvars.copy_context().run, generate_plan, feature, tabs, args,
+                            previous['location'] if previous else None): (feature, tabs, previous)
+            for feature, tabs, previous in work
+        }
+        for future in as_completed(futures):
+            feature, tabs, previous = futures[future]
+            try:
+                location, failed_tabs, rows = future.result()
+            except Exception as e:
+                print(f"[{feature['name']}] failed: {e}")
+                traceback.print_exc()
+                totals['failed_plans'] += 1
+                continue
+            done_tabs = sorted(set(previous['tabs'] if previous else []) | set(tabs))
+            state.record({'key': feature['key'], 'name': feature['name'], 'output': args.output,
+                          'location': location, 'tabs': done_tabs, 'failed_tabs': failed_tabs})
+            totals['plans'] += 1
+            totals['tabs'] += len(tabs) - len(failed_tabs)
+            totals['failed_tabs'] += len(failed_tabs)
+            totals['rows'] += rows
+            print(f"[{feature['name']}] {location}" + (f" ({len(failed_tabs)} tabs failed)" if failed_tabs else ''))
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("Interrupted. Run the same command again to resume.")
+        raise SystemExit(130)
+    executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    minutes = elapsed / 60 or 1
+    limiter = rate_limiter.stats()
+    print(f"\n{totals['plans']} plans ({totals['failed_plans']} failed), {totals['tabs']} tabs "
+          f"({totals['failed_tabs']} failed), {totals['rows']} rows in {elapsed:.1f}s")
+    print(f"throughput: {totals['plans'] / minutes:.1f} plans/min, {totals['tabs'] / minutes:.1f} tabs/min, "
+          f"{totals['rows'] / max(elapsed, 1e-9):.1f} rows/s")
+    print(f"Bedrock: {limiter['calls']} calls, {limiter['throttles']} throttled, {limiter['retries']} retries; "
+          f"response cache hit ratio {response_cache.stats()['hit_ratio'] if response_cache else 0.0:.0%}")
+    if totals['failed_plans'] or totals['failed_tabs']:
+        print("Some plans or tabs failed. Run the same command again to retry them.")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,10 @@
-import boto3
 import json
-from botocore.exceptions import ClientError
+import os
+from client_registry import get_bedrock_client
+from response_cache import ResponseCache, create_response_cache
+from prompt_templates import build_claude_prompt, build_claude_prompt_parts
+from rate_limiter import create_rate_limiter
+import metrics
 
 # Initialize the Bedrock client for Claude model invocation
 
@@ -8,26 +12,44 @@ modelId = "anthropic.claude-3-haiku-20240307-v1:0"  # Replace with your actual m
 accept = "application/json"
 content_type = "application/json"
 
-def invoke_claude(prompt, aws_access_key_id, aws_secret_access_key, aws_session_token):
+# Mark the shared prompt prefix for Bedrock prompt caching (requires a model that supports it)
+PROMPT_CACHING = os.getenv('BEDROCK_PROMPT_CACHING', 'false').lower() == 'true'
+
+# Identical requests (same model, parameters and prompt) are answered from this cache
+response_cache = create_response_cache()
+
+# Shared by every Bedrock call in the process: caps request and token rates, adapts the
+# number of calls in flight to throttling, and retries transient errors
+rate_limiter = create_rate_limiter()
+
+MAX_TOKENS = 4096
+
+def estimate_tokens(request_body):
     """
-    Sends prompt to Claude API and returns the response.
-    Args:
-        prompt (str): Prompt string to send to Claude.
     Returns:
-        str: The text of Claude's response.
+        int: A rough upper bound of the tokens the request uses: about four characters per
+        input token, plus max_tokens, which Bedrock reserves against the quota up front.
     """
-    # Initialize the Bedrock client with the temporary credentials
-    bedrock = boto3.client(
-        service_name="bedrock-runtime",
-        region_name='us-west-2',
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key,
-        aws_session_token=aws_session_token
-    )
-
-    request_body = {
+    return len(json.dumps(request_body["messages"])) // 4 + request_body["max_tokens"]
+
+def build_request_body(prompt):
+    """
+    Args:
+        prompt (str or tuple): The prompt text, or its (prefix, suffix) parts from
+            build_claude_prompt_parts.
+    """
+    if isinstance(prompt, tuple):
+        prefix, suffix = prompt
+        if PROMPT_CACHING:
+            prompt = [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": suffix},
+            ]
+        else:
+            prompt = prefix + suffix
+    return {
         "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 4096,
+        "max_tokens": MAX_TOKENS,
         "messages": [
             {
                 "role": "user",
@@ -36,153 +58,138 @@ def invoke_claude(prompt, aws_access_key_id, aws_secret_access_key, aws_session_
         ],
     }
 
-    try:
-        response = bedrock.invoke_model(
-            modelId=modelId,
-            body=json.dumps(request_body),
-        )
+def request_key(prompt):
+    """
+    Returns:
+        str: A hash of everything Bedrock receives for prompt, the same as its response cache key.
+    """
+    return ResponseCache.make_key(modelId, build_request_body(prompt))
 
-        # Process and return the response
-        result = json.loads(response.get("body").read())
+def invoke_claude(prompt, aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None,
+                  bedrock_client=None, bypass_cache=False, generation=None):
+    """
+    Sends prompt to Claude API and returns the response.
+    Args:
+        prompt (str or tuple): Prompt string, or its (prefix, suffix) parts, to send to Claude.
+        bedrock_client: A pooled bedrock-runtime client. If omitted, the shared client for
+            the given temporary credentials is used.
+        bypass_cache (bool): Always call Bedrock, even if the response is cached.
+        generation (int): The Generation of the temporary credentials, which keys the shared
+            client. Required if bedrock_client is omitted.
+    Returns:
+        str: The text of Claude's response.
+    """
+    from botocore.exceptions import ClientError
+    if bedrock_client is None and generation is None:
+        raise ValueError("invoke_claude needs a bedrock_client or the generation of the credentials.")
+    request_body = build_request_body(prompt)
+    cache_key = ResponseCache.make_key(modelId, request_body)
+    if response_cache and not bypass_cache:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            return cached_text
+
+    bedrock = bedrock_client or get_bedrock_client(
+        aws_access_key_id, aws_secret_access_key, aws_session_token, generation)
+
+    def invoke():
+        with metrics.outbound_call('bedrock', 'invoke_model'):
+            response = bedrock.invoke_model(
+                modelId=modelId,
+                body=json.dumps(request_body),
+            )
+            return json.loads(response.get("body").read())
+
+    try:
+        # Throttling and transient errors are retried by the rate limiter
+        result, permit = rate_limiter.call(invoke, estimate_tokens(request_body), operation='invoke_model')
+        permit.record_usage(used_tokens(result.get("usage", {})))
+        permit.release()
+        record_token_usage(result.get("usage", {}))
         output_list = result.get("content", [])
         # Assuming the response content is the one you need
-        return output_list[0]["text"] if output_list else ''
+        text = output_list[0]["text"] if output_list else ''
+        if response_cache and text:
+            response_cache.put(cache_key, text)
+        return text
 
     except ClientError as e:
         print(f"Couldn't invoke model. Error: {e.response['Error']}")
         raise
 
-def safe_format(template, **kwargs):
-    # Escape any curly braces in the provided details
-    escaped_kwargs = {k: str(v).replace('{', '{{').replace('}', '}}') for k, v in kwargs.items()}
-    return template.format(**escaped_kwargs)
-
-def build_claude_prompt(feature_name, feature_details, extra_info, tab):
+def invoke_claude_stream(prompt, bedrock_client, bypass_cache=False):
     """
-    Construct prompt text based on provided details for Claude.
+    Sends prompt to Claude API with response streaming.
+    Args:
+        prompt (str or tuple): Prompt string, or its (prefix, suffix) parts, to send to Claude.
+        bedrock_client: A bedrock-runtime client.
+        bypass_cache (bool): Always call Bedrock, even if the response is cached.
+    Yields:
+        str: Pieces of Claude's response text as they are generated. A cached response
+        is yielded in one piece.
     """
-    tab_prompts = {
-        "Acceptance Criteria - Use Cases": f""" Human: Generate as many test cases as possible in tabular form for {feature_name} ensuring that all all logic paths and user scenarios are covered.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            The table should only include columns: S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes.
-            Do not include any introductory text, explanations, or comments outside of the table.
-            Do not just limit to 10-15 test cases (if possible), build as many test cases as possible with all possible permutations and combinations.
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Regression Tests - Impacted Features": f""" Human:  Generate as many test cases as possible for potential regression in tabular form for features that might be impacted by {feature_name}.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Focus on areas of the application that are most likely to be affected and detail the steps required to verify that existing functionality is still working as expected.
-            Build as many regression test cases as possible with all possible permutations and combinations.
-            The table should only include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes.
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Performance": f""" Human:  Generate as many test cases as possibl to outline performance test scenarios in tabular form that assess the responsiveness, stability, and speed of {feature_name}.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Describe the setup, tools required to measure, expected metrics, and how to simulate load or stress conditions.
-            Build as many performance test cases as possible with all possible permutations and combinations.
-            The table should only include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes.
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Security": f""" Human: Generate as many test cases as possible in tabular form covering comprehensive security verification of {feature_name} including role-based access control, cross-organization data isolation, common attack vectors like XSS, SQL injection, and any potential vulnerabilities related to data exposure.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Build as many security test cases as possible with all possible permutations and combinations.
-            The table should include an S.No, Category, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Category | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "API": f""" Human: If {feature_name} includes API changes, provide API test cases in tabular form that validate both positive paths and error cases. 
-            Generate as many test cases as possible.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Include tests for request and response integrity, error handling, and adherence to RESTful principles if applicable. Test cases should also consider boundary conditions and data validation.
-            Test steps should include steps to be performed, Request, API and Payload to be used (if possible)
-            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Browser Specific": f""" Human: Generate as many browser compatibility test cases as possible in tabular form that ensure {feature_name} works correctly on supported web browsers.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Include steps for checking functionality, layout, and user interactions.
-            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Usability": f""" Human: Generate as many usability test cases as possible in tabular form that assess the user experience and interaction flow of {feature_name}.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Focus on intuitiveness, ease of use, and user satisfaction metrics.
-            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Backward Compatibility": f""" Human: Generate as many test cases as possible in tabular form to ensure backward compatibility for {feature_name}, paying special attention to impacts on existing features, customer queries, and data handling.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            Address any potential breaking changes and compatibility with previous versions.
-            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """,
-
-        "Migration": f""" Human: Generate as many test cases as possible in tabular form to validate migration scenarios for {feature_name} including data migration integrity prior and post-migration, performance comparison, and the correctness of the data transformation process.
-            Feature details: {feature_details}, 
-            Extra Information: {extra_info}
-            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
-            Do not include any introductory text, explanations, or comments outside of the table. "
-            Start your table immediately after this line and exclude any non-table text.
-            The response should be in markdown format, starting immediately below a header row like this:
-            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
-            | --- | --- | --- | --- | --- |
-            Assistant: """
-    }  
-
-    if tab in tab_prompts:
-        prompt_template = tab_prompts[tab]
-        prompt = safe_format(
-            prompt_template,
-            feature_name=feature_name, 
-            feature_details=feature_details, 
-            extra_info=extra_info
-    )
-        return prompt  # Return the formatted prompt for the specific tab
-
-    # If the tab is not in the dictionary, raise an error or handle it accordingly
-    raise ValueError(f"Prompt for tab '{tab}' does not exist.")
+    from botocore.exceptions import ClientError
+    request_body = build_request_body(prompt)
+    cache_key = ResponseCache.make_key(modelId, request_body)
+    if response_cache and not bypass_cache:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            yield cached_text
+            return
+
+    def open_stream():
+        return bedrock_client.invoke_model_with_response_stream(
+            modelId=modelId,
+            body=json.dumps(request_body),
+        )
+
+    try:
+        # The timing covers the whole stream, from the request to the last event
+        with metrics.outbound_call('bedrock', 'invoke_model_with_response_stream'):
+            # Only opening the stream is retried; once text is yielded a retry would repeat it
+            response, permit = rate_limiter.call(open_stream, estimate_tokens(request_body),
+                                                 operation='invoke_model_with_response_stream')
+            # The permit is held until the stream ends, so it counts towards the calls in flight
+            with permit:
+                pieces = []
+                tokens = 0
+                for event in response.get("body"):
+                    chunk = event.get("chunk")
+                    if not chunk:
+                        continue
+                    message = json.loads(chunk["bytes"])
+                    if message.get("type") == "content_block_delta":
+                        text = message["delta"].get("text", "")
+                        pieces.append(text)
+                        yield text
+                    elif message.get("type") == "message_start":
+                        usage = message.get("message", {}).get("usage", {})
+                        tokens += used_tokens(usage)
+                        record_token_usage(usage)
+                    elif message.get("type") == "message_delta":
+                        tokens += used_tokens(message.get("usage", {}))
+                        record_token_usage(message.get("usage", {}))
+                permit.record_usage(tokens)
+        if response_cache and pieces:
+            response_cache.put(cache_key, ''.join(pieces))
+
+    except ClientError as e:
+        print(f"Couldn't invoke model with response stream. Error: {e.response['Error']}")
+        raise
+
+# Usage field -> token type label. The cache fields are only reported with prompt caching.
+TOKEN_USAGE_TYPES = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_write",
+}
+
+def record_token_usage(usage):
+    for field, token_type in TOKEN_USAGE_TYPES.items():
+        if usage.get(field):
+            metrics.inc('bedrock_tokens_total', usage[field], help_text='Bedrock tokens used.',
+                        type=token_type)
+
+def used_tokens(usage):
+    return sum(usage.get(field) or 0 for field in TOKEN_USAGE_TYPES)
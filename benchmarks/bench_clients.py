@@ -0,0 +1,58 @@
+"""
+Micro-benchmark of per-call client overhead: building a new Bedrock / Google client on
+every call (the old behaviour) versus fetching the pooled client from client_registry.
+
+No requests are sent; only client construction and lookup are timed.
+
+    python benchmarks/bench_clients.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import boto3
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+
+import client_registry
+
+FAKE_CREDENTIALS = ('AKIAFAKEFAKEFAKE', 'fake-secret', 'fake-token')
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def report(name, before, after):
+    print(f"{name:<10} new client per call: {before * 1000:8.3f} ms   "
+          f"pooled: {after * 1000:8.4f} ms   speedup: {before / after:,.0f}x")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    bedrock_before = time_per_call(lambda: boto3.client(
+        service_name='bedrock-runtime', region_name='us-west-2',
+        aws_access_key_id=FAKE_CREDENTIALS[0], aws_secret_access_key=FAKE_CREDENTIALS[1],
+        aws_session_token=FAKE_CREDENTIALS[2]), iterations)
+    bedrock_after = time_per_call(
+        lambda: client_registry.get_bedrock_client(*FAKE_CREDENTIALS, generation=1), iterations * 100)
+    report('bedrock', bedrock_before, bedrock_after)
+
+    credentials = AnonymousCredentials()
+    for api, version in (('drive', 'v3'), ('sheets', 'v4')):
+        # The old code rebuilt the discovery client on every plan
+        before = time_per_call(lambda: build(api, version, credentials=credentials), iterations)
+        services = {}
+        def pooled():
+            service = services.get(api)
+            if service is None:
+                service = services[api] = client_registry.build_google_service(api, version, credentials)
+            return service
+        after = time_per_call(pooled, iterations * 100)
+        report(api, before, after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Size and speed of the test-case corpus: storing synthetic plans, full-text searches,
+similar-feature lookups, and the Bedrock calls saved when a re-planned feature reuses
+its stored tabs (CORPUS_REUSE=shortcut) instead of generating them again.
+
+    python benchmarks/bench_corpus.py [features] [cases-per-tab]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from offline import load_app_offline
+from bench_split import NullProgress
+from test_case_corpus import TestCaseCorpus
+
+TABS = ("Acceptance Criteria - Use Cases", "Security", "API")
+AREAS = ("checkout", "invoices", "exports", "login", "search", "notifications", "reports", "billing",
+         "permissions", "uploads", "webhooks", "dashboards")
+ACTIONS = ("create", "edit", "delete", "share", "filter", "schedule", "approve", "archive", "retry", "import")
+HEADER = ["S.No", "Test Case Description", "Priority", "Test Steps", "Expected Outcomes"]
+
+def synthetic_table(rng, area, cases):
+    rows = [HEADER]
+    for i in range(cases):
+        action = rng.choice(ACTIONS)
+        rows.append([str(i + 1), f"Verify a user can {action} {area} item {i} with timeout {rng.randint(1, 90)}s",
+                     f"P{rng.randint(0, 2)}", f"1. Open {area}<br>2. {action.title()} an item",
+                     f"The {area} item is {action}d and an audit entry is written"])
+    return rows
+
+def timed_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+def main():
+    features = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    cases = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    rng = random.Random(7)
+    app = load_app_offline()
+    corpus = TestCaseCorpus(os.path.join(tempfile.mkdtemp(prefix='corpus-'), 'bench.db'))
+
+    stored_features = []
+    start = time.perf_counter()
+    for i in range(features):
+        area = AREAS[i % len(AREAS)]
+        name = f"{area.title()} {rng.choice(ACTIONS)} flow {i}"
+        details = f"Users can {rng.choice(ACTIONS)} {area} from the {rng.choice(AREAS)} page, release {i}"
+        stored_features.append((name, details))
+        for tab in TABS:
+            corpus.add_table(name, details, tab, synthetic_table(rng, area, cases))
+    elapsed = time.perf_counter() - start
+    print(f"stored  {len(corpus):6d} cases of {features} features in {elapsed:5.2f}s "
+          f"({len(corpus) / elapsed:7.0f} cases/s), {os.path.getsize(corpus.path) / 1e6:5.1f} MB")
+
+    for query, kwargs in (("archive invoices", {}), ("audit", {'tab': 'Security', 'priority': 'P0'}),
+                          ("retry", {'feature': 'webhooks'})):
+        latency, results = timed_ms(lambda: corpus.search(query, limit=20, **kwargs), 20)
+        print(f"search  {query!r:20s} {str(kwargs):40s} {latency:6.2f} ms  {len(results)} results")
+
+    # A stored feature described with one more word
+    name, details = stored_features[len(stored_features) // 2]
+    latency, match = timed_ms(lambda: corpus.find_similar(name, details + ' for admins',
+                                                          "Security", 0.8), 20)
+    print(f"similar {latency:6.2f} ms  similarity {match[0] if match else 0:.2f}, "
+          f"{len(match[1]) - 1 if match else 0} cases")
+
+    # Planning a feature (stored in the corpus with CORPUS_REUSE=off) and then planning it again:
+    # with CORPUS_REUSE=shortcut every tab is reused instead of calling Bedrock
+    calls = []
+    def invoke_claude(prompt, *args, **kwargs):
+        calls.append(prompt)
+        return '\n'.join(['| ' + ' | '.join(HEADER) + ' |', '| --- |' * len(HEADER)] +
+                         ['| ' + ' | '.join(row) + ' |' for row in synthetic_table(rng, 'reports', cases)[1:]])
+    class NullSheetWriter:
+        def write(self, sheet_range, values, resize=True):
+            pass
+    app.invoke_claude = invoke_claude
+    app.corpus = corpus
+    app.SHEETS_DEFERRED_WRITES = False
+    for mode in ('off', 'shortcut'):
+        app.CORPUS_REUSE = mode
+        calls.clear()
+        start = time.perf_counter()
+        for tab in TABS:
+            app.generate_tab(NullProgress(), tab, "Reports export flow 2000",
+                             "Users can export reports from the dashboards page", 'N/A', None, NullSheetWriter())
+        print(f"replan  CORPUS_REUSE={mode:8s} {len(calls)} Bedrock calls for {len(TABS)} tabs "
+              f"in {(time.perf_counter() - start) * 1000:6.1f} ms")
+    assert not calls, "the re-planned feature should reuse every stored tab"
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Sheets writes of many plans finishing at once, against a local fake Sheets API that
+enforces a per-window write quota (answering 429 beyond it, as Google does per minute)
+and fails a share of calls with a 503. Compared with sending every write directly,
+with no pacing or retries, where a single 429 or 503 loses the plan's writes.
+
+    python benchmarks/bench_google_scheduler.py [plans] [tabs-per-plan]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import httplib2
+from googleapiclient.errors import HttpError
+import sheets_manager
+from google_scheduler import GoogleApiScheduler
+
+WINDOW_SECONDS = 2.0
+
+class FakeRequest:
+    def __init__(self, api, rows):
+        self.api = api
+        self.rows = rows
+
+    def execute(self):
+        return self.api.execute(self.rows)
+
+class FakeSheetsApi:
+    """
+    Admits writes_per_window write calls in any WINDOW_SECONDS, like the per-minute Sheets
+    write quota, and fails error_rate of the admitted calls with a 503.
+    """
+
+    def __init__(self, writes_per_window=20, error_rate=0.03, latency=0.05):
+        self.writes_per_window = writes_per_window
+        self.error_rate = error_rate
+        self.latency = latency
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.rows_written = 0
+        self._writes = deque()
+        self._lock = threading.Lock()
+        self._random = random.Random(1)
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        return FakeRequest(self, sum(len(entry['values']) for entry in body.get('data', [])))
+
+    def execute(self, rows):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self._writes and self._writes[0] <= now - WINDOW_SECONDS:
+                self._writes.popleft()
+            if len(self._writes) >= self.writes_per_window:
+                self.throttled += 1
+                raise HttpError(httplib2.Response({'status': 429}), b'{"error": {"status": "RESOURCE_EXHAUSTED"}}')
+            self._writes.append(now)
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                raise HttpError(httplib2.Response({'status': 503}), b'{"error": {"status": "UNAVAILABLE"}}')
+            self.rows_written += rows
+        return {}
+
+def run(plans, tabs, scheduler):
+    api = FakeSheetsApi()
+    sheets_manager.initialize_sheets_service = lambda service_account_info: api
+    sheets_manager.scheduler = scheduler
+    sheet_ids = {f"Tab {tab}": tab for tab in range(tabs)}
+    lost = []
+
+    def plan(index):
+        writer = sheets_manager.SheetWriter({'client_email': 'bench'}, f"sheet-{index}", sheet_ids)
+        # The plan's tabs finish together and are written from their own threads
+        def write_tab(tab):
+            rows = [[str(row), f"Case {row}", "P1", "Steps", "Works"] for row in range(40)]
+            writer.write(f"'Tab {tab}'!A3:E42", rows)
+        with ThreadPoolExecutor(max_workers=tabs) as executor:
+            for future in [executor.submit(write_tab, tab) for tab in range(tabs)]:
+                try:
+                    future.result()
+                except HttpError:
+                    lost.append(index)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=plans) as executor:
+        list(executor.map(plan, range(plans)))
+    return api, len(set(lost)), time.perf_counter() - start
+
+def report(label, plans, tabs, api, lost, elapsed):
+    print(f"{label:10s} {plans - lost:3d}/{plans} plans complete in {elapsed:5.1f}s  {api.calls:4d} API calls  "
+          f"{api.throttled:4d} throttled  {api.errors:3d} failed with 503  "
+          f"{api.rows_written:5d} rows written")
+
+def main():
+    plans = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    tabs = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    # No budgets and no retries: every write goes straight to the API, as before the scheduler
+    with contextlib.redirect_stdout(io.StringIO()):
+        unpaced = run(plans, tabs, GoogleApiScheduler(0, 0, 0, max_workers=64, max_retries=0))
+    report("unpaced", plans, tabs, *unpaced)
+
+    scheduler = GoogleApiScheduler(sheets_writes_per_minute=20, window_seconds=WINDOW_SECONDS, max_workers=4,
+                                   base_delay=0.1, max_delay=2.0)
+    # The scheduler logs every retry; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduled = run(plans, tabs, scheduler)
+    report("scheduler", plans, tabs, *scheduled)
+    stats = scheduler.stats()
+    print(f"           {stats['writes']} writes sent in {stats['batches']} merged batches, {stats['retries']} retries")
+    if scheduled[1]:
+        raise SystemExit(f"{scheduled[1]} plans lost writes through the scheduler")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Near-duplicate filtering of large synthetic plans: tabs of distinct test cases with
+reworded copies (a changed word and a different priority) spread across them.
+Reports the time of the vectorized MinHash filter, the copies it catches and the distinct
+cases it wrongly drops, compared with computing the same signatures row by row in Python.
+
+    python benchmarks/bench_near_duplicates.py [rows] [duplicate-share]
+"""
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from near_duplicates import NearDuplicateFilter
+
+HEADER = ["S.No", "Test Case Description", "Priority", "Test Steps", "Expected Outcomes"]
+ACTIONS = ["create", "edit", "delete", "export", "import", "share", "archive", "restore", "approve", "reject"]
+OBJECTS = ["invoice", "report", "user", "team", "project", "comment", "attachment", "webhook", "token", "dashboard"]
+CONDITIONS = ["as an admin", "as a viewer", "while offline", "with an expired session", "on mobile",
+              "with 10000 records", "with unicode names", "during maintenance", "after a timeout", "via the API"]
+STEPS = ["Log in", "Open the settings page", "Select a record", "Click the action button", "Confirm the dialog",
+         "Reload the page", "Check the audit log", "Switch the language", "Resize the window", "Sign out"]
+
+def distinct_case(random_source, index):
+    action, subject, condition = (random_source.choice(ACTIONS), random_source.choice(OBJECTS),
+                                  random_source.choice(CONDITIONS))
+    steps = random_source.sample(STEPS, 4)
+    return [str(index), f"Verify a user can {action} a {subject} {condition} (case {index})",
+            f"P{random_source.randrange(3)}",
+            '\n'.join(f"{i}. {step} for {subject} {index}" for i, step in enumerate(steps, 1)),
+            f"The {subject} is {action}d and the change is shown to the user ({index})"]
+
+def reworded(random_source, row):
+    # A copy that says the same thing: one word changed and a different priority
+    copy = list(row)
+    words = copy[1].split()
+    words[random_source.randrange(len(words))] = random_source.choice(["check", "ensure", "confirm"])
+    copy[1] = ' '.join(words)
+    copy[2] = f"P{random_source.randrange(3)}"
+    return copy
+
+def build_plan(rows, duplicate_share, tabs=8):
+    """
+    Returns:
+        list: The tabs, each a list of (row, index of the distinct case it states).
+    """
+    random_source = random.Random(7)
+    originals = max(1, int(rows * (1 - duplicate_share)))
+    cases = [distinct_case(random_source, i) for i in range(originals)]
+    copies = []
+    for _ in range(rows - originals):
+        group = random_source.randrange(originals)
+        copies.append((reworded(random_source, cases[group]), group))
+    labelled = list(zip(cases, range(originals))) + copies
+    random_source.shuffle(labelled)
+    size = -(-len(labelled) // tabs)
+    return [labelled[i:i + size] for i in range(0, len(labelled), size)]
+
+def python_signature(duplicate_filter, text):
+    # The same MinHash, one shingle and one permutation at a time
+    k = duplicate_filter.shingle_size
+    data = text.encode('utf-8').ljust(k)
+    mask = (1 << 64) - 1
+    hashes = set()
+    for start in range(len(data) - k + 1):
+        value = 0
+        for byte in data[start:start + k]:
+            value = (value * 1099511628211 + byte) & mask
+        hashes.add(value ^ (value >> 29))
+    return [min(((int(a) * h + int(b)) & mask) >> 32 for h in hashes)
+            for a, b in zip(duplicate_filter._multipliers, duplicate_filter._offsets)]
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    duplicate_share = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    plan = build_plan(rows, duplicate_share)
+    duplicate_filter = NearDuplicateFilter(0.85)
+    print(f"{rows} rows in {len(plan)} tabs, {duplicate_share:.0%} reworded copies, "
+          f"LSH {duplicate_filter.bands} bands x {duplicate_filter.band_rows} rows")
+
+    start = time.perf_counter()
+    kept_per_case = Counter()
+    for tab in plan:
+        kept = duplicate_filter.filter_table([HEADER] + [list(case) for case, _ in tab])
+        kept_texts = {row[1] for row in kept[1:]}
+        kept_per_case.update(group for case, group in tab if case[1] in kept_texts)
+    elapsed = time.perf_counter() - start
+    cases = len({group for tab in plan for _, group in tab})
+    # A distinct case should keep exactly one of its rows
+    missed = sum(count - 1 for count in kept_per_case.values())
+    lost = cases - len(kept_per_case)
+    print(f"vectorized  {elapsed * 1000:8.0f} ms  {rows / elapsed:9.0f} rows/s  removed {duplicate_filter.removed} of "
+          f"{rows - cases} copies; {missed} copies kept, {lost} distinct cases lost")
+
+    # The row-by-row signatures alone, on a sample, extrapolated to every row
+    sample = [case for case, _ in plan[0][:500]]
+    texts = NearDuplicateFilter.row_texts(HEADER, sample)
+    start = time.perf_counter()
+    python_signatures = [python_signature(duplicate_filter, text) for text in texts]
+    python_elapsed = (time.perf_counter() - start) * rows / len(sample)
+    print(f"python      {python_elapsed * 1000:8.0f} ms  {rows / python_elapsed:9.0f} rows/s  "
+          f"(signatures only, extrapolated from {len(sample)} rows)")
+    assert python_signatures == duplicate_filter.signatures(texts).tolist(), "signatures differ"
+    print(f"speed-up    {python_elapsed / elapsed:8.0f}x")
+
+if __name__ == '__main__':
+    main()
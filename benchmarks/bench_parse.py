@@ -0,0 +1,81 @@
+"""
+Throughput and peak memory of parse_claude_response on large synthetic tables, compared
+with the previous implementation (two full-text token rewrites, a split, and a look-back
+at lines[i-1] for the header).
+
+    python benchmarks/bench_parse.py [rows ...]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from parse_text import parse_claude_response
+
+def legacy_parse_claude_response(raw_response):
+    if raw_response is None:
+        raise ValueError("The response from Claude is empty. Cannot parse an empty response.")
+
+    raw_response = raw_response.replace('<br>', '[BR_TOKEN]').replace('\n', '[NL_TOKEN]')
+    lines = raw_response.split('[NL_TOKEN]')
+    data = []
+    header_found = False
+    table_started = False
+
+    for i, line in enumerate(lines):
+        if '|' in line:
+            line = line.replace('[BR_TOKEN]', '\n')
+            if '---' in line and '|' in lines[i-1]:
+                header_found = True
+                headers = [cell.strip() for cell in lines[i-1].strip('|').split('|')]
+                data.append(headers)
+                continue
+            if header_found and '|' in line:
+                table_started = True
+                row_data = [cell.strip() for cell in line.strip('|').split('|')]
+                data.append(row_data)
+            elif table_started:
+                break
+
+    if not data or not header_found:
+        raise ValueError("No markdown table data found in the response")
+
+    return data
+
+def synthetic_table(rows):
+    lines = ["| S.No | Category | Test Case Description | Priority | Test Steps | Expected Outcomes |",
+             "| --- | --- | --- | --- | --- | --- |"]
+    for i in range(1, rows + 1):
+        lines.append(f"| {i} | Access control | Verify that a user with role {i % 7} cannot read another "
+                     f"organization's records | P{i % 3} | 1. Log in as user {i}<br>2. Request record {i * 31}"
+                     f"<br>3. Inspect the response | The request is rejected with 403 and nothing is exposed |")
+    return '\n'.join(lines)
+
+def measure(parse, text, repeats=15):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse(text)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    parse(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    for rows in sizes:
+        text = synthetic_table(rows)
+        assert parse_claude_response(text) == legacy_parse_claude_response(text)
+        megabytes = len(text) / 1e6
+        print(f"{rows} rows ({megabytes:.1f} MB of markdown)")
+        for name, parse in (('legacy', legacy_parse_claude_response), ('single-pass', parse_claude_response)):
+            elapsed, peak = measure(parse, text)
+            print(f"  {name:<12} {elapsed * 1000:8.1f} ms  {rows / elapsed:>10,.0f} rows/s  "
+                  f"{megabytes / elapsed:6.1f} MB/s  peak {peak / 1e6:6.1f} MB")
+
+if __name__ == '__main__':
+    main()
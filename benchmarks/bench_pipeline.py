@@ -0,0 +1,270 @@
+"""
+Offline end-to-end benchmark of the Slack test-plan pipeline.
+
+Bedrock, STS, Drive, Sheets and Slack are replaced by local stand-ins with configurable
+latency and payload sizes. Simulated users drive signed requests at /slack/events and
+/slack/interactions concurrently, each walking through the conversation and selecting
+several tabs. Reports p50/p95/p99 plan latency, plans per minute and peak RSS.
+
+    python benchmarks/bench_pipeline.py --users 20 --tabs 4 --bedrock-latency 1.0
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import resource
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from offline import OFFLINE_CONFIG, load_app_offline
+from google_scheduler import GoogleApiScheduler
+
+TAB_VALUES = ["acceptance_criteria", "regression_tests", "performance", "security", "api",
+              "browser_specific", "usability", "backward_compatibility", "migration"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help='concurrent simulated users')
+    parser.add_argument('--tabs', type=int, default=4, help='tabs selected by each user')
+    parser.add_argument('--rows', type=int, default=40, help='table rows per generated tab')
+    parser.add_argument('--bedrock-latency', type=float, default=1.0, help='seconds per Bedrock call')
+    parser.add_argument('--sts-latency', type=float, default=0.2, help='seconds per AssumeRole call')
+    parser.add_argument('--drive-latency', type=float, default=1.5, help='seconds per Drive copy')
+    parser.add_argument('--sheets-latency', type=float, default=0.3, help='seconds per Sheets API call')
+    parser.add_argument('--slack-latency', type=float, default=0.1, help='seconds per Slack API call')
+    parser.add_argument('--jitter', type=float, default=0.2, help='relative random jitter on every latency')
+    parser.add_argument('--workers', type=int, default=8, help='JOB_WORKERS and PLAN_WORKERS for the app')
+    parser.add_argument('--tab-concurrency', type=int, default=4, help='TAB_CONCURRENCY for the app')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for all plans')
+    parser.add_argument('--max-p95', type=float, help='exit with an error if p95 plan latency exceeds this')
+    return parser.parse_args()
+
+class Stubs:
+    """
+    Local stand-ins for the outbound services, recording the messages sent to each channel.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.calls = defaultdict(int)
+        self.messages = defaultdict(list)
+        self.message_event = threading.Condition()
+        self._lock = threading.Lock()
+
+    def sleep(self, service, latency):
+        with self._lock:
+            self.calls[service] += 1
+        time.sleep(latency * random.uniform(1 - self.args.jitter, 1 + self.args.jitter))
+
+    def record_message(self, channel_id, text):
+        with self.message_event:
+            self.messages[channel_id].append((time.perf_counter(), text))
+            self.message_event.notify_all()
+
+    def wait_for_message(self, channel_id, count, timeout):
+        deadline = time.monotonic() + timeout
+        with self.message_event:
+            while len(self.messages[channel_id]) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no reply in {channel_id} after {timeout}s")
+                self.message_event.wait(remaining)
+            return self.messages[channel_id][count - 1]
+
+    def table(self, prompt):
+        header = "| S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |"
+        lines = [header, "| --- | --- | --- | --- | --- |"]
+        for i in range(1, self.args.rows + 1):
+            lines.append(f"| {i} | Verify case {i} of {len(prompt)} | P{i % 3} | 1. Step one<br>2. Step two | Works |")
+        return '\n'.join(lines)
+
+    # Bedrock
+    def invoke_claude(self, prompt, *args, **kwargs):
+        self.sleep('bedrock', self.args.bedrock_latency)
+        return self.table(prompt)
+
+    def invoke_claude_stream(self, prompt, bedrock_client, **kwargs):
+        text = self.table(prompt)
+        pieces = 20
+        step = max(1, len(text) // pieces)
+        for i in range(0, len(text), step):
+            self.sleep('bedrock_chunk', self.args.bedrock_latency / pieces)
+            yield text[i:i + step]
+
+    # STS
+    def assume_role(self, role_arn, external_id, sts_client=None):
+        self.sleep('sts', self.args.sts_latency)
+        return {'AccessKeyId': 'AKIAOFFLINE', 'SecretAccessKey': 'secret', 'SessionToken': 'token',
+                'Expiration': datetime.now(timezone.utc) + timedelta(hours=1)}
+
+    # Drive
+    def duplicate_template_sheet(self, service_account_info, template_id, new_title):
+        self.sleep('drive', self.args.drive_latency)
+        return f"sheet-{hashlib.md5(new_title.encode()).hexdigest()[:8]}"
+
+    # Slack
+    def send_slack_message(self, slack_client, channel_id, text):
+        self.sleep('slack', self.args.slack_latency)
+        self.record_message(channel_id, text)
+
+    def chat_postMessage(self, channel, text, **kwargs):
+        self.sleep('slack', self.args.slack_latency)
+        self.record_message(channel, text)
+        return {'ok': True, 'ts': f"{time.time():.6f}"}
+
+    def chat_update(self, channel, ts, text, **kwargs):
+        self.sleep('slack_update', self.args.slack_latency)
+        return {'ok': True, 'ts': ts}
+
+class FakeRequest:
+    def __init__(self, stubs, name, result):
+        self.stubs = stubs
+        self.name = name
+        self.result = result
+
+    def execute(self):
+        self.stubs.sleep(f"sheets_{self.name}", self.stubs.args.sheets_latency)
+        return self.result
+
+class FakeSheetsService:
+    """
+    Local stand-in for the Sheets discovery client used by sheets_manager.
+    """
+
+    def __init__(self, stubs, tab_names):
+        self.stubs = stubs
+        self.tab_names = tab_names
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, fields=None):
+        sheets = [{'properties': {'title': title, 'sheetId': i}} for i, title in enumerate(self.tab_names)]
+        return FakeRequest(self.stubs, 'get', {'sheets': sheets})
+
+    def update(self, **kwargs):
+        return FakeRequest(self.stubs, 'values_update', {})
+
+    def batchUpdate(self, spreadsheetId, body):
+        name = 'values_batchUpdate' if 'data' in body else 'batchUpdate'
+        return FakeRequest(self.stubs, name, {})
+
+def install_stubs(app, stubs):
+    import aws_session
+    import sheets_manager
+
+    app.invoke_claude = stubs.invoke_claude
+    app.invoke_claude_stream = stubs.invoke_claude_stream
+    aws_session.assume_role = stubs.assume_role
+    app.duplicate_template_sheet = stubs.duplicate_template_sheet
+    app.send_slack_message = stubs.send_slack_message
+    app.init_services()
+    app.slack_client.chat_postMessage = stubs.chat_postMessage
+    app.slack_client.chat_update = stubs.chat_update
+    sheets_service = FakeSheetsService(stubs, list(app.tab_mapping.values()))
+    sheets_manager.initialize_sheets_service = lambda service_account_info: sheets_service
+    # The fake Sheets API has no quota to pace to (bench_google_scheduler.py covers pacing)
+    sheets_manager.scheduler = GoogleApiScheduler(0, 0, 0)
+    app.initialize_sheets_service = sheets_manager.initialize_sheets_service
+
+def signed_headers(body):
+    timestamp = str(int(time.time()))
+    signature = 'v0=' + hmac.new(OFFLINE_CONFIG['slack_signing_secret'].encode(),
+                                 f"v0:{timestamp}:{body}".encode(), hashlib.sha256).hexdigest()
+    return {'X-Slack-Request-Timestamp': timestamp, 'X-Slack-Signature': signature}
+
+def post_event(client, user_id, channel_id, text):
+    body = json.dumps({'type': 'event_callback', 'event_id': f"Ev{random.getrandbits(48):x}", 'event': {
+        'type': 'message', 'user': user_id, 'channel': channel_id, 'text': text, 'event_ts': f"{time.time():.6f}"}})
+    response = client.post('/slack/events', data=body, content_type='application/json', headers=signed_headers(body))
+    assert response.status_code == 200, response.status_code
+
+def post_tab_selection(client, user_id, channel_id, tabs):
+    payload = {
+        'type': 'block_actions', 'user': {'id': user_id}, 'trigger_id': f"{random.getrandbits(48):x}",
+        'container': {'channel_id': channel_id, 'message_ts': f"{time.time():.6f}"},
+        'actions': [{'action_id': 'submit_tabs', 'action_ts': f"{time.time():.6f}"}],
+        'state': {'values': {'tabs': {'tab_selection': {
+            'type': 'checkboxes', 'selected_options': [{'value': tab} for tab in tabs]}}}},
+    }
+    body = urllib.parse.urlencode({'payload': json.dumps(payload)})
+    response = client.post('/slack/interactions', data=body, content_type='application/x-www-form-urlencoded',
+                           headers=signed_headers(body))
+    assert response.status_code == 200, response.status_code
+
+def simulate_user(app, stubs, index, args, plan_latencies, errors):
+    client = app.app.test_client()
+    user_id, channel_id = f"U{index:05d}", f"D{index:05d}"
+    tabs = random.sample(TAB_VALUES, min(args.tabs, len(TAB_VALUES)))
+    try:
+        # hi -> feature name -> details -> criteria, each answered by one bot message
+        for step, text in enumerate(['hi', f"Feature {index}", f"Details of feature {index}", 'N/A'], start=1):
+            post_event(client, user_id, channel_id, text)
+            stubs.wait_for_message(channel_id, step, args.timeout)
+            time.sleep(0.01)  # Slack event timestamps are strictly increasing per user
+
+        start = time.perf_counter()
+        post_tab_selection(client, user_id, channel_id, tabs)
+        count = 4
+        while True:
+            count += 1
+            finished_at, text = stubs.wait_for_message(channel_id, count, args.timeout)
+            if text.startswith("Here's the Google Sheet"):
+                plan_latencies.append(finished_at - start)
+                return
+    except Exception as e:
+        errors.append(f"{user_id}: {e}")
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('JOB_WORKERS', str(args.workers))
+    os.environ.setdefault('PLAN_WORKERS', str(args.workers))
+    os.environ.setdefault('TAB_CONCURRENCY', str(args.tab_concurrency))
+    # Every plan worker's plan can run its TAB_CONCURRENCY tabs at once
+    os.environ.setdefault('TAB_WORKERS', str(args.workers * args.tab_concurrency))
+    os.environ.setdefault('RESPONSE_CACHE_ENABLED', 'false')
+    app = load_app_offline()
+    stubs = Stubs(args)
+    install_stubs(app, stubs)
+
+    plan_latencies, errors = [], []
+    threads = [threading.Thread(target=simulate_user, args=(app, stubs, i, args, plan_latencies, errors))
+               for i in range(args.users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"{args.users} users x {args.tabs} tabs, Bedrock {args.bedrock_latency:.2f}s/call, "
+          f"{args.workers} job and plan workers, tab concurrency {args.tab_concurrency}")
+    if plan_latencies:
+        print(f"plan latency  p50 {percentile(plan_latencies, 50):6.2f}s  p95 {percentile(plan_latencies, 95):6.2f}s  "
+              f"p99 {percentile(plan_latencies, 99):6.2f}s")
+    print(f"throughput    {len(plan_latencies) / elapsed * 60:6.1f} plans/min ({len(plan_latencies)} plans in {elapsed:.1f}s)")
+    print(f"peak RSS      {peak_rss_mb:6.1f} MB")
+    print("outbound calls " + ', '.join(f"{name}={count}" for name, count in sorted(stubs.calls.items())))
+    for error in errors:
+        print(f"error: {error}")
+
+    if errors:
+        raise SystemExit(1)
+    if args.max_p95 is not None and percentile(plan_latencies, 95) > args.max_p95:
+        raise SystemExit(f"p95 plan latency {percentile(plan_latencies, 95):.2f}s exceeds {args.max_p95:.2f}s")
+
+if __name__ == '__main__':
+    main()
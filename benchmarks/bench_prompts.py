@@ -0,0 +1,207 @@
+"""
+Prompt construction cost of the precompiled template registry, compared with the previous
+builder (nine f-string templates rebuilt per call, then safe_format over the result).
+Also checks that rendered prompts are byte-identical across calls, so response cache keys
+are stable, and that every tab of a plan shares the same prompt prefix.
+
+    python benchmarks/bench_prompts.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bedrock_integration import build_request_body, modelId
+from prompt_templates import PROMPT_TEMPLATES, build_claude_prompt, build_claude_prompt_parts, render_prefix
+from response_cache import ResponseCache
+
+def legacy_safe_format(template, **kwargs):
+    # Escape any curly braces in the provided details
+    escaped_kwargs = {k: str(v).replace('{', '{{').replace('}', '}}') for k, v in kwargs.items()}
+    return template.format(**escaped_kwargs)
+
+def legacy_build_claude_prompt(feature_name, feature_details, extra_info, tab):
+    """
+    Construct prompt text based on provided details for Claude.
+    """
+    tab_prompts = {
+        "Acceptance Criteria - Use Cases": f""" Human: Generate as many test cases as possible in tabular form for {feature_name} ensuring that all all logic paths and user scenarios are covered.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            The table should only include columns: S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes.
+            Do not include any introductory text, explanations, or comments outside of the table.
+            Do not just limit to 10-15 test cases (if possible), build as many test cases as possible with all possible permutations and combinations.
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Regression Tests - Impacted Features": f""" Human:  Generate as many test cases as possible for potential regression in tabular form for features that might be impacted by {feature_name}.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Focus on areas of the application that are most likely to be affected and detail the steps required to verify that existing functionality is still working as expected.
+            Build as many regression test cases as possible with all possible permutations and combinations.
+            The table should only include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes.
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Performance": f""" Human:  Generate as many test cases as possibl to outline performance test scenarios in tabular form that assess the responsiveness, stability, and speed of {feature_name}.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Describe the setup, tools required to measure, expected metrics, and how to simulate load or stress conditions.
+            Build as many performance test cases as possible with all possible permutations and combinations.
+            The table should only include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes.
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Security": f""" Human: Generate as many test cases as possible in tabular form covering comprehensive security verification of {feature_name} including role-based access control, cross-organization data isolation, common attack vectors like XSS, SQL injection, and any potential vulnerabilities related to data exposure.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Build as many security test cases as possible with all possible permutations and combinations.
+            The table should include an S.No, Category, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Category | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "API": f""" Human: If {feature_name} includes API changes, provide API test cases in tabular form that validate both positive paths and error cases. 
+            Generate as many test cases as possible.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Include tests for request and response integrity, error handling, and adherence to RESTful principles if applicable. Test cases should also consider boundary conditions and data validation.
+            Test steps should include steps to be performed, Request, API and Payload to be used (if possible)
+            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Browser Specific": f""" Human: Generate as many browser compatibility test cases as possible in tabular form that ensure {feature_name} works correctly on supported web browsers.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Include steps for checking functionality, layout, and user interactions.
+            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Usability": f""" Human: Generate as many usability test cases as possible in tabular form that assess the user experience and interaction flow of {feature_name}.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Focus on intuitiveness, ease of use, and user satisfaction metrics.
+            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Backward Compatibility": f""" Human: Generate as many test cases as possible in tabular form to ensure backward compatibility for {feature_name}, paying special attention to impacts on existing features, customer queries, and data handling.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            Address any potential breaking changes and compatibility with previous versions.
+            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """,
+
+        "Migration": f""" Human: Generate as many test cases as possible in tabular form to validate migration scenarios for {feature_name} including data migration integrity prior and post-migration, performance comparison, and the correctness of the data transformation process.
+            Feature details: {feature_details}, 
+            Extra Information: {extra_info}
+            The table should include an S.No, Test Case Description, Priority (P0-high, P1-medium, P2-low), Test steps, and Expected Outcomes. 
+            Do not include any introductory text, explanations, or comments outside of the table. "
+            Start your table immediately after this line and exclude any non-table text.
+            The response should be in markdown format, starting immediately below a header row like this:
+            | S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |
+            | --- | --- | --- | --- | --- |
+            Assistant: """
+    }  
+
+    if tab in tab_prompts:
+        prompt_template = tab_prompts[tab]
+        prompt = legacy_safe_format(
+            prompt_template,
+            feature_name=feature_name, 
+            feature_details=feature_details, 
+            extra_info=extra_info
+    )
+        return prompt  # Return the formatted prompt for the specific tab
+
+    # If the tab is not in the dictionary, raise an error or handle it accordingly
+    raise ValueError(f"Prompt for tab '{tab}' does not exist.")
+
+FEATURE = (
+    "Bulk export",
+    "Users can export up to 50k records as CSV or XLSX from the reports page. Exports run in the "
+    "background and a download link is emailed when ready. " * 4,
+    "Only admins can export other users' reports.",
+)
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def check_stable_keys():
+    tabs = list(PROMPT_TEMPLATES)
+    prefixes = set()
+    keys = {}
+    for tab in tabs:
+        parts = build_claude_prompt_parts(*FEATURE, tab)
+        render_prefix.cache_clear()
+        again = build_claude_prompt_parts(*FEATURE, tab)
+        assert parts == again, f"prompt for {tab} is not byte-identical across renders"
+        assert parts[0] + parts[1] == build_claude_prompt(*FEATURE, tab)
+        prefixes.add(parts[0].encode())
+        key = ResponseCache.make_key(modelId, build_request_body(parts))
+        assert key == ResponseCache.make_key(modelId, build_request_body(again)), f"unstable cache key for {tab}"
+        keys[tab] = key
+    assert len(prefixes) == 1, "tabs of a plan do not share one prompt prefix"
+    assert len(set(keys.values())) == len(tabs), "different tabs share a cache key"
+    # User text is inserted verbatim; the previous builder raised KeyError on "{...}" in it
+    assert "{id}" in build_claude_prompt("Exports", "Rows keyed by {id}", "", tabs[0])
+    prefix_bytes = len(prefixes.pop())
+    print(f"cache keys stable across renders, shared prefix of {prefix_bytes} bytes across {len(tabs)} tabs")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    check_stable_keys()
+    tabs = list(PROMPT_TEMPLATES)
+    name, details, extra = FEATURE
+
+    # A plan renders each of its tabs for one feature; a new feature every len(tabs) calls
+    legacy = measure(lambda i: legacy_build_claude_prompt(
+        f"{name} {i // len(tabs)}", details, extra, tabs[i % len(tabs)]), iterations)
+    registry = measure(lambda i: build_claude_prompt(
+        f"{name} {i // len(tabs)}", details, extra, tabs[i % len(tabs)]), iterations)
+    parts = measure(lambda i: build_claude_prompt_parts(
+        f"{name} {i // len(tabs)}", details, extra, tabs[i % len(tabs)]), iterations)
+
+    print(f"legacy builder       {legacy:8.2f} us/prompt")
+    print(f"registry (joined)    {registry:8.2f} us/prompt  ({legacy / registry:.1f}x)")
+    print(f"registry (parts)     {parts:8.2f} us/prompt  ({legacy / parts:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Sustained throughput of Bedrock calls through the adaptive rate limiter against a local
+stub that throttles like Bedrock: it admits a fixed number of concurrent calls and a
+request rate (a token bucket with a small burst), and answers anything beyond that with a
+ThrottlingException. Compared with calling the stub directly, where every throttle fails
+the call (and with it the plan).
+
+    python benchmarks/bench_rate_limiter.py [callers] [calls-per-caller]
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from botocore.exceptions import ClientError
+from rate_limiter import AdaptiveRateLimiter
+
+class ThrottlingStubBedrock:
+    def __init__(self, max_concurrency=6, requests_per_second=20, burst=5, latency=0.2):
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.latency = latency
+        self.in_flight = 0
+        self.level = burst
+        self.refilled_at = time.monotonic()
+        self.throttled = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.burst, self.level + (now - self.refilled_at) * self.requests_per_second)
+            self.refilled_at = now
+            if self.in_flight >= self.max_concurrency or self.level < 1:
+                self.throttled += 1
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests'},
+                                   'ResponseMetadata': {'HTTPStatusCode': 429}}, 'InvokeModel')
+            self.level -= 1
+            self.in_flight += 1
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        usage = {'input_tokens': 300, 'output_tokens': 700}
+        return {'body': io.BytesIO(json.dumps({'content': [{'text': 'ok'}], 'usage': usage}).encode())}
+
+def run(callers, calls_per_caller, limiter):
+    stub = ThrottlingStubBedrock()
+    failures = []
+
+    def call():
+        return json.loads(stub.invoke_model(modelId='stub', body='{}')['body'].read())
+
+    def caller():
+        for _ in range(calls_per_caller):
+            try:
+                if limiter is None:
+                    call()
+                else:
+                    result, permit = limiter.call(call, estimated_tokens=1500)
+                    permit.record_usage(sum(result['usage'].values()))
+                    permit.release()
+            except ClientError as e:
+                failures.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    start = time.perf_counter()
+    # The limiter logs every retry; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return stub, failures, time.perf_counter() - start
+
+def main():
+    callers = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    calls_per_caller = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    total = callers * calls_per_caller
+
+    stub, failures, elapsed = run(callers, calls_per_caller, None)
+    print(f"no limiter  {stub.completed:4d}/{total} calls succeeded in {elapsed:5.1f}s "
+          f"({stub.completed / elapsed:5.1f}/s), {stub.throttled} throttled, {len(failures)} failed")
+
+    limiter = AdaptiveRateLimiter(requests_per_minute=0, tokens_per_minute=0, max_concurrency=32,
+                                  max_retries=10, base_delay=0.05, max_delay=2.0, decrease_cooldown=0.2)
+    stub, failures, elapsed = run(callers, calls_per_caller, limiter)
+    limiter_failures = len(failures)
+    stats = limiter.stats()
+    print(f"limiter     {stub.completed:4d}/{total} calls succeeded in {elapsed:5.1f}s "
+          f"({stub.completed / elapsed:5.1f}/s), {stub.throttled} throttled, {stats['retries']} retries, "
+          f"{len(failures)} failed, concurrency limit {stats['concurrency_limit']:.1f}")
+
+    # Request and token buckets set just under the stub's rate avoid most throttles up front
+    limiter = AdaptiveRateLimiter(requests_per_minute=18 * 60, tokens_per_minute=18 * 60 * 1000,
+                                  max_concurrency=32, max_retries=10, base_delay=0.05, max_delay=2.0,
+                                  burst_seconds=0.5, decrease_cooldown=0.2)
+    stub, failures, elapsed = run(callers, calls_per_caller, limiter)
+    limiter_failures += len(failures)
+    stats = limiter.stats()
+    print(f"limiter+rpm {stub.completed:4d}/{total} calls succeeded in {elapsed:5.1f}s "
+          f"({stub.completed / elapsed:5.1f}/s), {stub.throttled} throttled, {stats['retries']} retries, "
+          f"{len(failures)} failed, concurrency limit {stats['concurrency_limit']:.1f}")
+    if limiter_failures:
+        raise SystemExit(f"{limiter_failures} calls failed through the rate limiter")
+
+if __name__ == '__main__':
+    main()
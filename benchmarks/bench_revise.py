@@ -0,0 +1,124 @@
+"""
+Work saved by revising a plan instead of building it again, driven through the Slack
+conversation with local stand-ins for Bedrock, STS, Drive, Sheets and Slack. A plan is
+built, then revised by adding a tab and by fixing a typo in the feature details, and the
+Bedrock calls, Drive copies and sheet rows written are compared with building every plan
+from scratch.
+
+    python benchmarks/bench_revise.py [rows-per-tab]
+"""
+import argparse
+import re
+import sys
+import time
+from collections import defaultdict
+
+from offline import load_app_offline
+from bench_pipeline import Stubs, FakeRequest, FakeSheetsService, install_stubs
+
+USER, CHANNEL = 'U0REVISE', 'D0REVISE'
+DETAILS = "Admins can export the monthly invoice report as CSV from the biling page"
+FIXED_DETAILS = DETAILS.replace("biling", "billing")
+
+class RevisionStubs(Stubs):
+    def table(self, prompt):
+        # Most cases do not depend on the wording of the details; a few quote its end
+        prefix, suffix = prompt
+        details = re.search(r"Feature details: (.*)", prefix).group(1).split()
+        header = "| S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |"
+        lines = [header, "| --- | --- | --- | --- | --- |"]
+        for i in range(1, self.args.rows + 1):
+            subject = ' '.join(details[-3:]) if i % 7 == 0 else f"case {i} of {len(suffix)}"
+            lines.append(f"| {i} | Verify {subject} | P{i % 3} | 1. Step one<br>2. Step two | Works |")
+        return '\n'.join(lines)
+
+class GridSheetsService(FakeSheetsService):
+    """
+    Keeps the cells written to every tab, and answers batchGet from them like Sheets does
+    (trailing empty cells and rows omitted).
+    """
+
+    def __init__(self, stubs, tab_names):
+        super().__init__(stubs, tab_names)
+        self.grids = defaultdict(dict)
+        self.rows_written = 0
+
+    def batchUpdate(self, spreadsheetId, body):
+        for data in body.get('data', []):
+            match = re.match(r"'(.+)'!A(\d+):[A-Z]+\d+", data['range'])
+            tab, start = match.group(1), int(match.group(2))
+            for offset, row in enumerate(data['values']):
+                self.grids[spreadsheetId, tab][start + offset] = row
+            self.rows_written += len(data['values'])
+        return super().batchUpdate(spreadsheetId, body)
+
+    def batchGet(self, spreadsheetId, ranges):
+        value_ranges = []
+        for sheet_range in ranges:
+            match = re.match(r"'(.+)'!A(\d+):Z", sheet_range)
+            grid = self.grids[spreadsheetId, match.group(1)]
+            rows = [grid.get(i, []) for i in range(int(match.group(2)), max(grid, default=0) + 1)]
+            rows = [row[:max((i + 1 for i, cell in enumerate(row) if cell != ''), default=0)] for row in rows]
+            while rows and not rows[-1]:
+                rows.pop()
+            value_ranges.append({'range': sheet_range, 'values': rows})
+        return FakeRequest(self.stubs, 'values_batchGet', {'valueRanges': value_ranges})
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    args = argparse.Namespace(rows=rows, bedrock_latency=0, sts_latency=0, drive_latency=0, sheets_latency=0,
+                              slack_latency=0, jitter=0)
+    app = load_app_offline()
+    app.SHEETS_DEFERRED_WRITES = False
+    app.corpus = None
+    app.response_cache = None
+    stubs = RevisionStubs(args)
+    install_stubs(app, stubs)
+    import sheets_manager
+    service = GridSheetsService(stubs, list(app.tab_mapping.values()))
+    sheets_manager.initialize_sheets_service = lambda service_account_info: service
+    app.initialize_sheets_service = sheets_manager.initialize_sheets_service
+
+    def say(text):
+        app.handle_slack_event({'user': USER, 'channel': CHANNEL, 'text': text, 'event_ts': f"{time.time():.6f}"})
+
+    def select(tabs):
+        with app.state_store.transaction(USER, default=app.NEW_USER_STATE) as user_state:
+            user_state['selected_tabs'] = tabs
+            user_state['status'] = 'tabs_selected'
+        say('')
+        app.plan_queue.join()
+
+    def measure(label, conversation):
+        before = dict(stubs.calls), service.rows_written
+        conversation()
+        calls = {name: stubs.calls[name] - before[0].get(name, 0) for name in ('bedrock', 'drive')}
+        written = service.rows_written - before[1]
+        print(f"{label:30s} {calls['bedrock']:2d} Bedrock calls  {calls['drive']} Drive copies  "
+              f"{written:4d} rows written")
+        return calls['bedrock'], written
+
+    tabs = ['acceptance_criteria', 'security', 'api']
+    def build(details, tabs):
+        def conversation():
+            for text in ('hi', 'Invoice export', details, 'N/A'):
+                say(text)
+            select(tabs)
+        return conversation
+
+    def revise(details, tabs):
+        def conversation():
+            for text in ('revise', details, 'same'):
+                say(text)
+            select(tabs)
+        return conversation
+
+    measure("new plan (3 tabs)", build(DETAILS, tabs))
+    added = measure("revise: add a tab", revise('same', tabs + ['performance']))
+    fixed = measure("revise: fix a typo in details", revise(FIXED_DETAILS, tabs + ['performance']))
+    full = measure("rebuild from scratch (4 tabs)", build(FIXED_DETAILS, tabs + ['performance']))
+    assert added[0] == 1, "adding a tab should only generate that tab"
+    assert fixed[1] < full[1], "a typo fix should write fewer rows than a rebuild"
+
+if __name__ == '__main__':
+    main()
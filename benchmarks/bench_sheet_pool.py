@@ -0,0 +1,167 @@
+"""
+Time a new plan waits for its spreadsheet, with and without the pool of pre-copied
+template spreadsheets, against a local stand-in for Drive where copying the template takes
+COPY_SECONDS and renaming a file RENAME_SECONDS. Plans arrive in bursts; after the last
+burst the template is edited, and the copies of the old version must be discarded. Last, a
+pooled copy that was deleted from Drive must be dropped from the pool, while a Drive error
+during the rename must leave the pool's copies alone.
+
+    python benchmarks/bench_sheet_pool.py [plans] [pool-size] [low-water]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from offline import load_app_offline
+
+COPY_SECONDS = 1.5
+RENAME_SECONDS = 0.1
+GET_SECONDS = 0.05
+
+class FakeHttpError(Exception):
+    # Like googleapiclient's HttpError
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.resp = type('Response', (), {'status': status})()
+
+class FakeDriveRequest:
+    def __init__(self, seconds, result):
+        self.seconds = seconds
+        self.result = result
+
+    def execute(self):
+        time.sleep(self.seconds)
+        return self.result
+
+class FakeDrive:
+    """
+    Keeps the files' names and the template's modifiedTime, like Drive.
+    """
+
+    def __init__(self, template_id):
+        self.template_id = template_id
+        self.modified_time = '2026-01-01T00:00:00.000Z'
+        self.names = {}
+        self.copies = 0
+        self.deleted = 0
+        # Errors raised by the next renames
+        self.rename_errors = []
+        self.lock = threading.Lock()
+
+    def files(self):
+        return self
+
+    def copy(self, fileId, body, **kwargs):
+        spreadsheet_id = f"copy-{uuid.uuid4().hex[:8]}"
+        with self.lock:
+            self.copies += 1
+            self.names[spreadsheet_id] = (body['name'], self.modified_time)
+        return FakeDriveRequest(COPY_SECONDS, {'id': spreadsheet_id})
+
+    def update(self, fileId, body, **kwargs):
+        with self.lock:
+            if self.rename_errors:
+                raise self.rename_errors.pop(0)
+            self.names[fileId] = (body['name'], self.names[fileId][1])
+        return FakeDriveRequest(RENAME_SECONDS, {'id': fileId})
+
+    def delete(self, fileId, **kwargs):
+        with self.lock:
+            self.deleted += 1
+            del self.names[fileId]
+        return FakeDriveRequest(GET_SECONDS, {})
+
+    def get(self, fileId, fields=None, **kwargs):
+        return FakeDriveRequest(GET_SECONDS, {'modifiedTime': self.modified_time})
+
+def run_bursts(app, plans, burst=3, pause=4.0):
+    # Plans arrive a few at a time, with a pause that lets the pool refill in between
+    waits = []
+    lock = threading.Lock()
+
+    def plan(index):
+        start = time.perf_counter()
+        spreadsheet_id = app.new_plan_sheet(f"Feature {index}")
+        with lock:
+            waits.append((time.perf_counter() - start, spreadsheet_id))
+
+    for first in range(0, plans, burst):
+        threads = [threading.Thread(target=plan, args=(i,)) for i in range(first, min(plans, first + burst))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time.sleep(pause)
+    return waits
+
+def report(label, waits):
+    seconds = sorted(wait for wait, _ in waits)
+    print(f"{label:10s} p50 {seconds[len(seconds) // 2]:5.2f}s  max {seconds[-1]:5.2f}s  "
+          f"({len(seconds)} plans)")
+
+def main():
+    plans = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    low_water = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    app = load_app_offline()
+    import sheets_manager
+    from google_scheduler import GoogleApiScheduler
+    from sheet_pool import SpreadsheetPool
+    drive = FakeDrive(app.TEMPLATE_SHEET_ID)
+    sheets_manager.get_drive_service = lambda service_account_info: drive
+    sheets_manager.scheduler = GoogleApiScheduler(0, 0, 0)
+    app.init_services()
+
+    app.sheet_pool = None
+    report("no pool", run_bursts(app, plans, pause=0))
+
+    pool = SpreadsheetPool(app.TEMPLATE_SHEET_ID, os.path.join(tempfile.mkdtemp(prefix='pool-'), 'sheet_pool.db'),
+                           size=size, low_water=low_water, check_seconds=1.0)
+    app.sheet_pool = pool
+    pool.start(app.config['google_service_account_info'])
+    # Filled in the background before the first plans arrive, as after warm-up
+    while pool.available() < size:
+        time.sleep(0.1)
+    waits = run_bursts(app, plans)
+    report(f"pool of {size}", waits)
+    stats = pool.stats()
+    print(f"           {stats['hits']} claims served from the pool, {stats['misses']} copied on demand")
+    assert all(drive.names[spreadsheet_id][0].startswith("Feature") for _, spreadsheet_id in waits)
+
+    # The template is edited: its pooled copies are replaced, and none of them is handed out
+    drive.modified_time = '2026-02-01T00:00:00.000Z'
+    time.sleep(1.0)
+    spreadsheet_id = app.new_plan_sheet("After the template changed")
+    assert drive.names[spreadsheet_id][1] == drive.modified_time, "a copy of the old template was handed out"
+    deadline = time.monotonic() + 10 * COPY_SECONDS * size
+    while pool.available() < size and time.monotonic() < deadline:
+        time.sleep(0.1)
+    print(f"template edited: {pool.stats()['invalidated']} outdated copies deleted, "
+          f"{pool.available()} copies of the new version ready")
+
+    # The first copy claimed was deleted from Drive: it is dropped and the next one claimed
+    drive.rename_errors = [FakeHttpError(404, "file not found")]
+    deleted = drive.deleted
+    spreadsheet_id = app.new_plan_sheet("After a deleted copy")
+    assert drive.names[spreadsheet_id][0] == "After a deleted copy"
+    assert drive.deleted == deleted + 1, "the deleted copy was not dropped"
+    print("deleted copy: dropped from the pool and the next one claimed")
+
+    # Drive fails the rename (its retries are bench_google_scheduler's business): the copy
+    # stays in the pool and the plan copies the template instead
+    sheets_manager.scheduler.max_retries = 0
+    while pool.available() < size:
+        time.sleep(0.1)
+    drive.rename_errors = [FakeHttpError(503, "backend error")]
+    deleted, copies = drive.deleted, drive.copies
+    spreadsheet_id = app.new_plan_sheet("During a Drive outage")
+    assert drive.names[spreadsheet_id][0] == "During a Drive outage"
+    assert drive.deleted == deleted and drive.copies == copies + 1, "a healthy pooled copy was given up"
+    assert pool.available() == size, "the copy was not put back in the pool"
+    print(f"Drive error: the copy went back to the pool ({pool.available()} ready), the template was copied")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Rows and wall-clock time of generating a large tab with one prompt versus split into its
+parallel slice prompts, against a stub Bedrock that generates output tokens at a fixed
+rate and truncates the response at max_tokens, as Bedrock does.
+
+    python benchmarks/bench_split.py [cases-per-area] [seconds-per-1k-tokens]
+"""
+import sys
+import threading
+import time
+
+from offline import load_app_offline
+
+TAB = "Acceptance Criteria - Use Cases"
+TOKENS_PER_CHAR = 0.25
+
+class StubBedrock:
+    """
+    Answers every prompt with cases_per_area test cases for each scenario area it asks for,
+    a few of which are generic cases that every area repeats.
+    """
+
+    def __init__(self, app, cases_per_area, seconds_per_1k_tokens):
+        self.areas = app.prompt_slices(TAB)
+        self.cases_per_area = cases_per_area
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.calls = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def invoke_claude(self, prompt, *args, **kwargs):
+        prefix, suffix = prompt
+        areas = [area for area in self.areas if area in suffix] or self.areas
+        lines = ["| S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |",
+                 "| --- | --- | --- | --- | --- |"]
+        number = 1
+        for area in areas:
+            for i in range(self.cases_per_area):
+                # The first three cases of every area are the same generic checks
+                description = f"Generic check {i}" if i < 3 else f"Verify {area} case {i}"
+                lines.append(f"| {number} | {description} | P{i % 3} | 1. Open the feature<br>"
+                             f"2. Exercise {description.lower()} | Works as expected |")
+                number += 1
+        text = '\n'.join(lines)
+
+        max_chars = int(4096 / TOKENS_PER_CHAR)
+        with self._lock:
+            self.calls += 1
+            if len(text) > max_chars:
+                self.truncated += 1
+        text = text[:max_chars]
+        time.sleep(len(text) * TOKENS_PER_CHAR / 1000 * self.seconds_per_1k_tokens)
+        return text
+
+class NullProgress:
+    def update(self, item, status):
+        pass
+
+def run(app, stub, split):
+    app.SPLIT_LARGE_TABS = split
+    written = []
+    class RecordingSheetWriter:
+        def write(self, sheet_range, values, resize=True):
+            written.extend(values)
+    start = time.perf_counter()
+    app.generate_tab(NullProgress(), TAB, 'Bulk export', 'Export reports as CSV', 'N/A', None, RecordingSheetWriter())
+    return time.perf_counter() - start, written
+
+def main():
+    cases_per_area = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    seconds_per_1k_tokens = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    app = load_app_offline()
+    stub = StubBedrock(app, cases_per_area, seconds_per_1k_tokens)
+    app.invoke_claude = stub.invoke_claude
+    app.SHEETS_DEFERRED_WRITES = False
+    expected = len(stub.areas) * (cases_per_area - 3) + 3
+
+    for split in (False, True):
+        stub.calls = stub.truncated = 0
+        elapsed, table = run(app, stub, split)
+        rows = table[1:]
+        if split:
+            assert [row[0] for row in rows] == [str(i) for i in range(1, len(rows) + 1)], "S.No is not renumbered"
+            assert len({tuple(row[1:]) for row in rows}) == len(rows), "duplicate rows were kept"
+        print(f"{'split' if split else 'whole'}  {elapsed:6.2f}s  {len(rows):4d}/{expected} rows  "
+              f"{stub.calls} Bedrock calls, {stub.truncated} truncated")
+
+if __name__ == '__main__':
+    main()
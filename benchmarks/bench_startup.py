@@ -0,0 +1,74 @@
+"""
+Cold-start cost of the app: time to import app.py, latency of the first and second
+request (a signed Slack url_verification challenge), and the slowest imports as reported
+by `python -X importtime`. Every run uses a fresh interpreter.
+
+    python benchmarks/bench_startup.py [runs] [--top N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the fresh interpreter; prints its timings as JSON on the last line of stdout
+CHILD = """
+import json, time
+start = time.perf_counter()
+from offline import load_app_offline
+app = load_app_offline()
+imported = time.perf_counter()
+from bench_pipeline import signed_headers
+client = app.app.test_client()
+def challenge():
+    body = json.dumps({'type': 'url_verification', 'challenge': 'ping'})
+    started = time.perf_counter()
+    response = client.post('/slack/events', data=body, content_type='application/json', headers=signed_headers(body))
+    assert response.get_json() == {'challenge': 'ping'}, response.status_code
+    return time.perf_counter() - started
+first = challenge()
+second = challenge()
+print(json.dumps({'import': imported - start, 'first_request': first, 'second_request': second}))
+"""
+
+def run_child(importtime=False):
+    env = dict(os.environ)
+    if 'TEST_CASE_CREATION_SECRET_KEY' not in env:
+        from cryptography.fernet import Fernet
+        env['TEST_CASE_CREATION_SECRET_KEY'] = Fernet.generate_key().decode()
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD]
+    result = subprocess.run(command, cwd=BENCHMARKS_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(stderr, top):
+    # Lines look like "import time:       self [us] |  cumulative | imported package"
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative_us), int(self_us), name.rstrip()))
+    top_level = [entry for entry in imports if not entry[2].startswith('  ')]
+    return sorted(top_level, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('runs', type=int, nargs='?', default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    args = parser.parse_args()
+
+    timings = [run_child()[0] for _ in range(args.runs)]
+    for name in ('import', 'first_request', 'second_request'):
+        samples = [timing[name] * 1000 for timing in timings]
+        print(f"{name:15s} median {statistics.median(samples):7.1f} ms  (min {min(samples):7.1f}, max {max(samples):7.1f})")
+
+    _, stderr = run_child(importtime=True)
+    print(f"\nslowest top-level imports (python -X importtime, cumulative):")
+    for cumulative_us, self_us, name in slowest_imports(stderr, args.top):
+        print(f"  {cumulative_us / 1000:7.1f} ms  {name.strip()}")
+
+if __name__ == '__main__':
+    main()
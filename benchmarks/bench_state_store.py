@@ -0,0 +1,88 @@
+"""
+Read/write latency of the conversation state backends with many active users, plus a
+multi-process check that several workers can share one SQLite store.
+
+    python benchmarks/bench_state_store.py [users]
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from state_store import MemoryStateStore, SQLiteStateStore
+
+def sample_state(i):
+    return {
+        'status': 'awaiting_feature_details', 'feature_name': f"Feature {i}",
+        'feature_details': 'x' * 200, 'feature_criteria': None, 'selected_tabs': None,
+        'last_event_ts': f"{time.time():.6f}", 'last_bot_message': 'Please provide the details for the feature.',
+    }
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6 for p in (50, 95, 99)}
+
+def measure(name, store, users, operations):
+    for i in range(users):
+        store.put(f"U{i}", sample_state(i))
+
+    results = {}
+    for op in ('get', 'put', 'transaction'):
+        samples = []
+        for _ in range(operations):
+            user_id = f"U{random.randrange(users)}"
+            start = time.perf_counter()
+            if op == 'get':
+                store.get(user_id)
+            elif op == 'put':
+                store.put(user_id, sample_state(0))
+            else:
+                with store.transaction(user_id) as state:
+                    state['last_event_ts'] = f"{time.time():.6f}"
+            samples.append(time.perf_counter() - start)
+        results[op] = percentiles(samples)
+
+    for op, p in results.items():
+        print(f"{name:<8} {op:<12} p50 {p[50]:8.1f} us   p95 {p[95]:8.1f} us   p99 {p[99]:8.1f} us")
+
+def worker(path, worker_id, updates):
+    store = SQLiteStateStore(path)
+    for _ in range(updates):
+        with store.transaction('shared-user', default={'count': 0}) as state:
+            state['count'] += 1
+
+def check_multiprocess(path, processes=4, updates=250):
+    start = time.perf_counter()
+    workers = [multiprocessing.Process(target=worker, args=(path, i, updates)) for i in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    count = SQLiteStateStore(path).get('shared-user')['count']
+    print(f"sqlite   {processes} processes x {updates} read-modify-write updates: "
+          f"{count} counted in {elapsed:.2f}s ({count / elapsed:,.0f} updates/s)")
+    assert count == processes * updates, "lost updates between worker processes"
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    operations = 5000
+    print(f"{users} active users, {operations} operations per measurement")
+    measure('memory', MemoryStateStore(), users, operations)
+    with tempfile.TemporaryDirectory() as directory:
+        measure('sqlite', SQLiteStateStore(os.path.join(directory, 'states.db')), users, operations)
+        check_multiprocess(os.path.join(directory, 'shared.db'))
+
+    store = MemoryStateStore(ttl_seconds=0.5)
+    for i in range(users):
+        store.put(f"U{i}", sample_state(i))
+    time.sleep(0.6)
+    store.evict_expired()
+    print(f"memory   TTL eviction removed {store.evictions} abandoned conversations, {len(store)} left")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Time-to-first-row of streaming generation against a local stub of Bedrock's
+invoke_model_with_response_stream, compared with waiting for the whole response.
+
+    python benchmarks/bench_streaming.py [rows] [seconds-per-row]
+"""
+import json
+import sys
+import time
+
+from offline import load_app_offline
+
+def synthetic_table(rows):
+    lines = ["| S.No | Test Case Description | Priority | Test Steps | Expected Outcomes |",
+             "| --- | --- | --- | --- | --- |"]
+    for i in range(1, rows + 1):
+        lines.append(f"| {i} | Verify scenario {i} | P{i % 3} | 1. Open page<br>2. Do thing {i} | Works as expected |")
+    return '\n'.join(lines)
+
+class StubBedrockStream:
+    """
+    Emits the response the way Bedrock does: a content_block_delta event per small chunk,
+    paced so that one table row takes row_latency seconds to generate.
+    """
+
+    def __init__(self, text, row_latency, chunk_size=16):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.delay = row_latency * chunk_size / (len(text) / text.count('\n'))
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        return {'body': self._events()}
+
+    def _events(self):
+        yield {'chunk': {'bytes': json.dumps({'type': 'message_start'}).encode()}}
+        for i in range(0, len(self.text), self.chunk_size):
+            time.sleep(self.delay)
+            delta = {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': self.text[i:i + self.chunk_size]}}
+            yield {'chunk': {'bytes': json.dumps(delta).encode()}}
+        yield {'chunk': {'bytes': json.dumps({'type': 'message_stop'}).encode()}}
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    row_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    app = load_app_offline()
+    text = synthetic_table(rows)
+
+    writes = []
+    class RecordingSheetWriter:
+        def write(self, sheet_range, values, resize=True):
+            writes.append((time.perf_counter(), sheet_range, values))
+        def resize(self, sheet_name):
+            pass
+
+    start = time.perf_counter()
+    app.generate_tab_streaming('Security', 'prompt', StubBedrockStream(text, row_latency), RecordingSheetWriter())
+    total = time.perf_counter() - start
+
+    written = [row for _, _, values in writes for row in values]
+    assert written == app.parse_claude_response(text), "streamed rows differ from the blocking parser"
+    print(f"{rows} rows at {row_latency * 1000:.0f} ms/row, flushing every {app.STREAM_FLUSH_ROWS} rows")
+    print(f"blocking mode: first row written after {total:.2f}s (the full generation)")
+    print(f"streaming:     first row written after {writes[0][0] - start:.2f}s, "
+          f"{len(writes)} sheet writes, done after {total:.2f}s")
+    for timestamp, sheet_range, values in writes[:3]:
+        print(f"  +{timestamp - start:5.2f}s {sheet_range} ({len(values)} rows)")
+
+if __name__ == '__main__':
+    main()
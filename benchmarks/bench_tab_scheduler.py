@@ -0,0 +1,169 @@
+"""
+Fairness and cancellation of tab generation when plans compete for Bedrock, with a stub tab
+that holds one of BEDROCK_SLOTS concurrent Bedrock calls for TAB_SECONDS.
+
+- Fairness: several users start plans with every tab, then one user asks for a single tab. Its
+  latency is compared with the previous per-plan thread pools, where every plan's tabs
+  race for Bedrock and the single tab waits behind the earlier plans' tabs.
+- Cancellation: a user's plan with every tab is started and then superseded while it is
+  generating, both through signed requests at /slack/events (job queue, then plan queue),
+  with the sqlite state backend. Either the user says hi, handled by this process, or
+  another worker process handles their hi: it only clears the plan ID in the shared state
+  database. Bedrock calls the superseded plan still makes are compared with the previous
+  behaviour (all of them).
+
+    python benchmarks/bench_tab_scheduler.py [busy-users]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+BEDROCK_SLOTS = 4
+TAB_SECONDS = 0.2
+CHECK_SECONDS = 0.05
+os.environ.setdefault('TAB_WORKERS', str(BEDROCK_SLOTS))
+os.environ.setdefault('TAB_CONCURRENCY', str(BEDROCK_SLOTS))
+os.environ.setdefault('PLAN_CANCEL_CHECK_SECONDS', str(CHECK_SECONDS))
+os.environ.setdefault('STATE_BACKEND', 'sqlite')
+os.environ.setdefault('STATE_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='states-'), 'states.db'))
+
+from offline import load_app_offline
+from bench_pipeline import Stubs, install_stubs, post_event
+from state_store import SQLiteStateStore
+from tab_scheduler import raise_if_cancelled, PlanCancelled
+
+class NoProgress:
+    def update(self, item, status):
+        pass
+
+class StubBedrock:
+    """
+    Admits BEDROCK_SLOTS calls at a time, in arrival order, like the adaptive rate limiter
+    at its concurrency limit.
+    """
+
+    def __init__(self):
+        self.slots = threading.Semaphore(BEDROCK_SLOTS)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def generate_tab(self, progress, tab_name, feature_name, *args, **kwargs):
+        raise_if_cancelled()
+        with self.slots:
+            with self.lock:
+                self.calls.append((feature_name, time.monotonic()))
+            time.sleep(TAB_SECONDS)
+        raise_if_cancelled()
+
+def legacy_generate_tabs(app, stub, tabs, feature_name):
+    # The previous generate_tabs: a thread pool of TAB_CONCURRENCY per plan
+    with ThreadPoolExecutor(max_workers=max(1, min(app.TAB_CONCURRENCY, len(tabs)))) as executor:
+        futures = [executor.submit(stub.generate_tab, NoProgress(), tab, feature_name) for tab in tabs]
+        for future in as_completed(futures):
+            future.result()
+
+def scheduled_generate_tabs(app, tabs, feature_name, user_id):
+    plan_tasks = app.tab_scheduler.start_plan(user_id, max_in_flight=app.TAB_CONCURRENCY)
+    try:
+        app.generate_tabs(NoProgress(), tabs, feature_name, '', '', None, None, plan_tasks=plan_tasks)
+    except PlanCancelled:
+        pass
+    finally:
+        plan_tasks.close()
+
+def all_tabs(app):
+    return list(app.tab_mapping)
+
+def fairness(app, busy_users, generate):
+    """
+    Returns:
+        tuple: Seconds until the single-tab plan finished, and until every plan finished.
+    """
+    threads = [threading.Thread(target=generate, args=(all_tabs(app), f"busy-{i}", f"UBUSY{i}"))
+               for i in range(busy_users)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    time.sleep(TAB_SECONDS / 2)
+    single_start = time.monotonic()
+    generate(['security'], 'single', 'USINGLE')
+    single = time.monotonic() - single_start
+    for thread in threads:
+        thread.join()
+    return single, time.monotonic() - start
+
+def legacy_cancellation(app, stub):
+    """
+    Returns:
+        int: Bedrock calls made by the superseded plan after the user said hi.
+    """
+    thread = threading.Thread(target=legacy_generate_tabs, args=(app, stub, all_tabs(app), 'superseded'))
+    thread.start()
+    time.sleep(TAB_SECONDS / 2)
+    said_hi = time.monotonic()
+    thread.join()
+    return sum(1 for name, at in stub.calls if name == 'superseded' and at > said_hi)
+
+def cancellation(app, stub, user, other_process):
+    """
+    Returns:
+        int: Bedrock calls made by the superseded plan after the user said hi.
+    """
+    client = app.app.test_client()
+    channel_id = f"D{user}"
+    app.state_store.put(user, dict(app.NEW_USER_STATE, status='tabs_selected', feature_name='superseded',
+                                   feature_details='', feature_criteria='', selected_tabs=all_tabs(app)))
+    post_event(client, user, channel_id, 'Go')
+    while not any(name == 'superseded' for name, _ in stub.calls):
+        time.sleep(0.01)
+    said_hi = time.monotonic()
+    if other_process:
+        # Another worker process handled the greeting: only the shared state changed
+        with SQLiteStateStore(os.environ['STATE_DB_PATH']).transaction(user) as user_state:
+            user_state.update(status='awaiting_feature_name', plan_id=None)
+    else:
+        post_event(client, user, channel_id, 'hi')
+    app.job_queue.join()
+    app.plan_queue.join()
+    status = app.state_store.get(user)['status']
+    assert status == 'awaiting_feature_name', f"the superseded plan reset the new conversation ({status})"
+    return sum(1 for name, at in stub.calls if name == 'superseded' and at > said_hi)
+
+def main():
+    busy_users = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    app = load_app_offline()
+    install_stubs(app, Stubs(argparse.Namespace(bedrock_latency=TAB_SECONDS, sts_latency=0, drive_latency=0.05,
+                                                sheets_latency=0.01, slack_latency=0.01, jitter=0, rows=10)))
+    app.send_greeting = lambda channel_id, user_id: None
+    print(f"{busy_users} users with {len(all_tabs(app))}-tab plans, {BEDROCK_SLOTS} Bedrock slots, "
+          f"{TAB_SECONDS * 1000:.0f} ms per tab")
+
+    stub = StubBedrock()
+    single, total = fairness(app, busy_users, lambda tabs, name, user: legacy_generate_tabs(app, stub, tabs, name))
+    print(f"per-plan pools   single-tab plan {single:5.2f}s  all plans {total:5.2f}s")
+    stub = StubBedrock()
+    app.generate_tab = stub.generate_tab
+    scheduled_single, total = fairness(app, busy_users, lambda tabs, name, user:
+                                       scheduled_generate_tabs(app, tabs, name, user))
+    print(f"tab scheduler    single-tab plan {scheduled_single:5.2f}s  all plans {total:5.2f}s")
+
+    legacy_calls = legacy_cancellation(app, StubBedrock())
+    stub = StubBedrock()
+    app.generate_tab = stub.generate_tab
+    local_calls = cancellation(app, stub, 'UCANCEL', other_process=False)
+    stub = StubBedrock()
+    app.generate_tab = stub.generate_tab
+    remote_calls = cancellation(app, stub, 'UREMOTE', other_process=True)
+    print(f"after hi         {legacy_calls} Bedrock calls of the superseded plan with per-plan pools, "
+          f"{local_calls} with the tab scheduler, {remote_calls} when another process handled the hi "
+          f"(plan ID checked every {app.tab_scheduler.check_seconds * 1000:.0f} ms)")
+    assert scheduled_single < single, "the single-tab plan should not wait behind the busy plans"
+    assert local_calls < legacy_calls, "a superseded plan should stop calling Bedrock"
+    assert remote_calls < legacy_calls, "a plan superseded in another process should stop calling Bedrock"
+
+if __name__ == '__main__':
+    main()
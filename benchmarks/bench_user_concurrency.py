@@ -0,0 +1,117 @@
+"""
+Concurrency check for per-user conversation handling, driven through signed requests at
+/slack/events so every step goes through the job queue like in production.
+
+Several users start slow plans first, more of them than there are job workers. N other
+users then walk through the conversation at the same time. Each step only pays the Slack
+latency: plans run on their own workers, so they neither hold a user's lock nor a job
+worker while they generate.
+
+    python benchmarks/bench_user_concurrency.py [users] [slow-plans]
+"""
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+JOB_WORKERS = 4
+os.environ.setdefault('JOB_WORKERS', str(JOB_WORKERS))
+
+from offline import load_app_offline
+from bench_pipeline import post_event
+
+SLACK_LATENCY = 0.05
+PLAN_LATENCY = 2.0
+
+class FakeSlack:
+    """
+    Records the messages sent to each channel, so a step's latency can be measured until
+    the bot's reply.
+    """
+
+    def __init__(self):
+        self.messages = defaultdict(list)
+        self.condition = threading.Condition()
+
+    def record(self, channel_id):
+        time.sleep(SLACK_LATENCY)
+        with self.condition:
+            self.messages[channel_id].append(time.perf_counter())
+            self.condition.notify_all()
+
+    def send_slack_message(self, slack_client, channel_id, text):
+        self.record(channel_id)
+
+    def chat_postMessage(self, channel, **kwargs):
+        self.record(channel)
+        return {'ok': True}
+
+    def wait_for_message(self, channel_id, count, timeout=30):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.messages[channel_id]) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no reply in {channel_id} after {timeout}s")
+                self.condition.wait(remaining)
+            return self.messages[channel_id][count - 1]
+
+def fake_process_feature_details(channel_id, user_id, *args, **kwargs):
+    time.sleep(PLAN_LATENCY)
+    # The plan in the tab scheduler
+    args[-1].close()
+
+def run_conversation(app, slack, user_id, step_latencies):
+    client = app.app.test_client()
+    channel_id = f"D{user_id}"
+    for step, text in enumerate(['hi', 'Feature', 'Details', 'N/A'], start=1):
+        start = time.perf_counter()
+        post_event(client, user_id, channel_id, text)
+        step_latencies.append(slack.wait_for_message(channel_id, step) - start)
+        time.sleep(0.01)  # Slack event timestamps are strictly increasing per user
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    slow_plans = int(sys.argv[2]) if len(sys.argv) > 2 else JOB_WORKERS + 2
+    app = load_app_offline()
+    slack = FakeSlack()
+    app.init_services()
+    app.slack_client.chat_postMessage = slack.chat_postMessage
+    app.send_slack_message = slack.send_slack_message
+    app.process_feature_details = fake_process_feature_details
+
+    # The slow users reach the generation step, and each plan takes PLAN_LATENCY seconds
+    client = app.app.test_client()
+    for i in range(slow_plans):
+        user_id = f"USLOW{i}"
+        app.state_store.put(user_id, dict(app.NEW_USER_STATE, status='tabs_selected', feature_name='Slow',
+                                          selected_tabs=['security']))
+        post_event(client, user_id, f"D{user_id}", '')
+    time.sleep(0.1)
+
+    step_latencies = []
+    threads = [threading.Thread(target=run_conversation, args=(app, slack, f"U{i}", step_latencies))
+               for i in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    app.plan_queue.join()
+
+    finished = sum(1 for i in range(users)
+                   if app.state_store.get(f"U{i}")['status'] == 'tabs_selected')
+    print(f"{users} users finished their conversations in {elapsed:.2f}s while {slow_plans} plans "
+          f"took {PLAN_LATENCY:.1f}s each ({JOB_WORKERS} job workers)")
+    step_latencies.sort()
+    print(f"step latency: p50 {step_latencies[len(step_latencies) // 2] * 1000:.1f} ms  "
+          f"max {step_latencies[-1] * 1000:.1f} ms (Slack stub latency {SLACK_LATENCY * 1000:.0f} ms, "
+          f"shared by {users} users on {JOB_WORKERS} job workers)")
+    assert finished == users, f"only {finished}/{users} users reached tab selection"
+    assert max(step_latencies) < PLAN_LATENCY, "a user's conversation waited on another user's plan"
+    print("OK: users progressed independently")
+
+if __name__ == '__main__':
+    main()
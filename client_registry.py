@@ -0,0 +1,95 @@
+import threading
+
+# boto3, the Google API client and slack_sdk take hundreds of milliseconds to import, so
+# each is imported by the function that first builds one of its clients
+
+BEDROCK_REGION = 'us-west-2'
+
+# Sized for the tab workers of several concurrent plans sharing one Bedrock client
+BEDROCK_MAX_POOL_CONNECTIONS = 32
+# Retries are left to rate_limiter, which backs off across every caller at once
+BEDROCK_RETRIES = {'total_max_attempts': 1, 'mode': 'standard'}
+
+_lock = threading.Lock()
+_bedrock_clients = {}
+_google_credentials = {}
+_slack_clients = {}
+# googleapiclient's httplib2 transport is not thread-safe, so every worker thread gets its
+# own Google service objects (built once per thread and reused afterwards)
+_thread_local = threading.local()
+
+def get_bedrock_client(aws_access_key_id, aws_secret_access_key, aws_session_token, generation):
+    """
+    Returns a shared bedrock-runtime client for the given credential generation.
+    boto3 clients are thread-safe, so one client serves every worker until the
+    credentials are refreshed and the generation changes.
+    """
+    client = _bedrock_clients.get(generation)
+    if client is not None:
+        return client
+    with _lock:
+        client = _bedrock_clients.get(generation)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+            client = boto3.client(
+                service_name="bedrock-runtime",
+                region_name=BEDROCK_REGION,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                aws_session_token=aws_session_token,
+                config=Config(max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS, retries=BEDROCK_RETRIES),
+            )
+            # Clients of older generations hold expired credentials and can be dropped
+            _bedrock_clients.clear()
+            _bedrock_clients[generation] = client
+        return client
+
+def get_google_credentials(service_account_info):
+    key = service_account_info.get('client_email')
+    credentials = _google_credentials.get(key)
+    if credentials is None:
+        with _lock:
+            credentials = _google_credentials.get(key)
+            if credentials is None:
+                from google.oauth2 import service_account
+                credentials = service_account.Credentials.from_service_account_info(service_account_info)
+                _google_credentials[key] = credentials
+    return credentials
+
+def build_google_service(api, version, credentials):
+    from googleapiclient.discovery import build
+    # Static discovery documents ship with google-api-python-client, so building a
+    # service never fetches the discovery document over the network
+    return build(api, version, credentials=credentials, static_discovery=True, cache_discovery=False)
+
+def _get_google_service(api, version, service_account_info):
+    services = getattr(_thread_local, 'services', None)
+    if services is None:
+        services = _thread_local.services = {}
+    key = (api, version, service_account_info.get('client_email'))
+    service = services.get(key)
+    if service is None:
+        service = build_google_service(api, version, get_google_credentials(service_account_info))
+        services[key] = service
+    return service
+
+def get_sheets_service(service_account_info):
+    return _get_google_service('sheets', 'v4', service_account_info)
+
+def get_drive_service(service_account_info):
+    return _get_google_service('drive', 'v3', service_account_info)
+
+def get_slack_client(slack_bot_token):
+    """
+    Returns a shared Slack WebClient. WebClient opens a connection per call and keeps no
+    per-request state, so it is safe to share across worker threads.
+    """
+    client = _slack_clients.get(slack_bot_token)
+    if client is None:
+        with _lock:
+            client = _slack_clients.get(slack_bot_token)
+            if client is None:
+                from slack_sdk import WebClient
+                client = _slack_clients[slack_bot_token] = WebClient(token=slack_bot_token)
+    return client
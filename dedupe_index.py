@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class TTLIndex:
+    """
+    Bounded set of recently seen keys with O(1) lookups. Keys expire after ttl_seconds, and
+    the oldest keys are dropped first once max_entries is reached.
+    """
+
+    def __init__(self, max_entries=50000, ttl_seconds=60 * 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> time added, oldest first (every key has the same TTL)
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._keys:
+            key, added_at = next(iter(self._keys.items()))
+            if now - added_at < self.ttl_seconds and len(self._keys) <= self.max_entries:
+                break
+            del self._keys[key]
+            if now - added_at < self.ttl_seconds:
+                self.evictions += 1
+
+    def check_and_add(self, key):
+        """
+        Records key as seen.
+        Returns:
+            bool: True if the key had already been seen within the TTL.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if key in self._keys:
+                self.hits += 1
+                return True
+            self.misses += 1
+            self._keys[key] = now
+            self._expire(now)
+            return False
+
+    def discard(self, key):
+        """
+        Forgets key, so a retry of a request that could not be accepted is processed.
+        """
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def __len__(self):
+        return len(self._keys)
+
+class SQLiteTTLIndex:
+    """
+    TTLIndex kept in a local SQLite database in WAL mode, so the worker processes of one
+    host share the keys they have seen. A key is claimed by the process whose insert
+    succeeds first.
+    """
+
+    def __init__(self, path, max_entries=50000, ttl_seconds=60 * 60, eviction_interval=60):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.eviction_interval = eviction_interval
+        # Counted by this process only
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_eviction = 0
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS seen_requests (key TEXT PRIMARY KEY, added_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS seen_requests_added_at ON seen_requests (added_at)')
+
+    @contextmanager
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so each thread keeps its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        yield connection
+
+    def check_and_add(self, key):
+        """
+        Records key as seen.
+        Returns:
+            bool: True if the key had already been seen within the TTL.
+        """
+        now = time.time()
+        with self._connection() as connection:
+            # An expired key counts as new
+            connection.execute('DELETE FROM seen_requests WHERE key = ? AND added_at <= ?',
+                               (key, now - self.ttl_seconds))
+            added = connection.execute('INSERT OR IGNORE INTO seen_requests (key, added_at) VALUES (?, ?)',
+                                       (key, now)).rowcount
+        if added:
+            self.misses += 1
+            self._maybe_evict(now)
+            return False
+        self.hits += 1
+        return True
+
+    def discard(self, key):
+        """
+        Forgets key, so a retry of a request that could not be accepted is processed.
+        """
+        with self._connection() as connection:
+            connection.execute('DELETE FROM seen_requests WHERE key = ?', (key,))
+
+    def _maybe_evict(self, now):
+        if now - self._last_eviction < self.eviction_interval:
+            return
+        self._last_eviction = now
+        with self._connection() as connection:
+            connection.execute('DELETE FROM seen_requests WHERE added_at <= ?', (now - self.ttl_seconds,))
+            # Keys beyond max_entries are dropped oldest first
+            self.evictions += connection.execute(
+                'DELETE FROM seen_requests WHERE key IN '
+                '(SELECT key FROM seen_requests ORDER BY added_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,)
+            ).rowcount
+
+    def __len__(self):
+        with self._connection() as connection:
+            return connection.execute('SELECT COUNT(*) FROM seen_requests').fetchone()[0]
+
+def create_dedupe_index():
+    """
+    Creates the index of accepted Slack requests configured by the DEDUPE_* environment
+    variables. With the sqlite state backend it is kept in the state database, so a retry
+    that reaches another worker process is still recognized.
+    """
+    max_entries = int(os.getenv('DEDUPE_MAX_ENTRIES', '50000'))
+    ttl_seconds = int(os.getenv('DEDUPE_TTL_SECONDS', '3600'))
+    if os.getenv('STATE_BACKEND', 'memory') == 'sqlite':
+        return SQLiteTTLIndex(os.getenv('STATE_DB_PATH', 'conversation_states.db'), max_entries=max_entries,
+                              ttl_seconds=ttl_seconds)
+    return TTLIndex(max_entries=max_entries, ttl_seconds=ttl_seconds)
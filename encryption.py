@@ -1,14 +1,28 @@
 import os
 import json
-from cryptography.fernet import Fernet
+import threading
 
-# Retrieve encryption key from environment variable
-key_str = os.getenv('TEST_CASE_CREATION_SECRET_KEY')
-if not key_str:
-    raise EnvironmentError('TEST_CASE_CREATION_SECRET_KEY environment variable not found.')
-key = key_str.encode()
+_fernet = None
+_fernet_lock = threading.Lock()
 
-fernet = Fernet(key)
+def get_fernet():
+    """
+    Returns the Fernet instance for the key in TEST_CASE_CREATION_SECRET_KEY. The key is read
+    (and cryptography imported) on first use rather than when the module is imported.
+    Raises:
+        EnvironmentError: If TEST_CASE_CREATION_SECRET_KEY is not set.
+    """
+    global _fernet
+    if _fernet is None:
+        with _fernet_lock:
+            if _fernet is None:
+                from cryptography.fernet import Fernet
+                # Retrieve encryption key from environment variable
+                key_str = os.getenv('TEST_CASE_CREATION_SECRET_KEY')
+                if not key_str:
+                    raise EnvironmentError('TEST_CASE_CREATION_SECRET_KEY environment variable not found.')
+                _fernet = Fernet(key_str.encode())
+    return _fernet
 
 def encrypt_file(input_filepath, output_filepath):
     """
@@ -20,7 +34,7 @@ def encrypt_file(input_filepath, output_filepath):
 
     # Serialize and encrypt the data
     json_data = json.dumps(data).encode()
-    encrypted_data = fernet.encrypt(json_data)
+    encrypted_data = get_fernet().encrypt(json_data)
     
     # Write the encrypted data to the output file
     with open(output_filepath, 'wb') as f:
@@ -35,7 +49,7 @@ def decrypt_file(input_filepath):
         encrypted_data = f.read()
 
     # Decrypt and deserialize the data
-    decrypted_data = fernet.decrypt(encrypted_data)
+    decrypted_data = get_fernet().decrypt(encrypted_data)
     return json.loads(decrypted_data.decode())
 
 ##encrypt_file('slack_google_credentials.json', 'slack_google_credentials.enc')
\ No newline at end of file
@@ -0,0 +1,254 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import metrics
+
+# HTTP statuses of Google API errors that are retried
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Drive reports rate limits as 403 errors with one of these reasons
+RATE_LIMIT_REASONS = ('ratelimitexceeded', 'userratelimitexceeded')
+
+def classify_error(error):
+    """
+    Returns:
+        tuple: (retryable, throttled) for an exception raised by a Google API call.
+    """
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        status = int(status)
+        content = str(getattr(error, 'content', b'')).lower()
+        if status == 429 or (status == 403 and any(reason in content for reason in RATE_LIMIT_REASONS)):
+            return True, True
+        return status in RETRYABLE_STATUSES, False
+    # Dropped connections and timeouts (socket.timeout is TimeoutError)
+    return isinstance(error, (ConnectionError, TimeoutError)), False
+
+class SlidingWindowBudget:
+    """
+    Admits at most limit calls in any window of window_seconds, the way Google counts its
+    per-minute quotas. A limit of 0 admits every call.
+    """
+
+    def __init__(self, limit, window_seconds=60.0):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.paused_until = 0.0
+        self._calls = deque()
+
+    def wait_time(self, now):
+        # Seconds until a call is admitted, 0 if it is now
+        wait = max(0.0, self.paused_until - now)
+        if self.limit:
+            while self._calls and self._calls[0] <= now - self.window_seconds:
+                self._calls.popleft()
+            if len(self._calls) >= self.limit:
+                wait = max(wait, self._calls[0] + self.window_seconds - now)
+        return wait
+
+    def take(self, now):
+        if self.limit:
+            self._calls.append(now)
+
+class GoogleApiScheduler:
+    """
+    Shared by every job, in front of every Sheets and Drive call. Each quota (Sheets
+    writes, Sheets reads, Drive) has its own per-minute budget; calls wait for room in
+    their budget, and 429 and 5xx responses are retried with full-jitter exponential
+    backoff while the throttled quota is paused for everyone.
+
+    Spreadsheet writes are queued and sent by background sender threads. All writes to one
+    spreadsheet that are pending when a sender gets budget for it are merged into one
+    values().batchUpdate (followed by one batchUpdate for their formatting requests), and
+    only one batch per spreadsheet is in flight, so writes land in the order they were made.
+    """
+
+    def __init__(self, sheets_writes_per_minute=60, sheets_reads_per_minute=60, drive_requests_per_minute=120,
+                 window_seconds=60.0, max_workers=4, max_retries=6, base_delay=1.0, max_delay=32.0):
+        self.budgets = {
+            'sheets_write': SlidingWindowBudget(sheets_writes_per_minute, window_seconds),
+            'sheets_read': SlidingWindowBudget(sheets_reads_per_minute, window_seconds),
+            'drive': SlidingWindowBudget(drive_requests_per_minute, window_seconds),
+        }
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        # spreadsheet ID -> writes waiting to be sent
+        self._pending = OrderedDict()
+        self._in_flight = set()
+        self._workers = []
+        self.calls = 0
+        self.writes = 0
+        self.batches = 0
+        self.throttles = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _acquire(self, quota):
+        budget = self.budgets[quota]
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = budget.wait_time(now)
+                if wait == 0:
+                    budget.take(now)
+                    self.calls += 1
+                    return
+                self._condition.wait(wait)
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, quota, fn, service, operation, acquired=False, idempotent=True):
+        """
+        Calls fn() in this thread once quota has room for it, retrying 429 and 5xx errors.
+        Args:
+            quota (str): 'sheets_write', 'sheets_read' or 'drive'.
+            service (str), operation (str): Name the call in the outbound call metrics.
+            acquired (bool): Whether room for the first attempt was already taken.
+            idempotent (bool): Whether fn() may be repeated after it failed. If not, only
+                rate-limit errors are retried: Google rejected those calls without running
+                them, while a 5xx or a timeout may come after the call took effect.
+        Returns:
+            The result of fn().
+        """
+        attempt = 0
+        while True:
+            if not acquired:
+                self._acquire(quota)
+            acquired = False
+            try:
+                with metrics.outbound_call(service, operation):
+                    return fn()
+            except Exception as e:
+                retryable, throttled = classify_error(e)
+                if not (retryable if idempotent else throttled) or attempt >= self.max_retries:
+                    with self._condition:
+                        self.failures += 1
+                    raise
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                with self._condition:
+                    self.retries += 1
+                    if throttled:
+                        self.throttles += 1
+                        # Nobody else spends this quota until the backoff is over
+                        budget = self.budgets[quota]
+                        budget.paused_until = max(budget.paused_until, time.monotonic() + delay)
+                if throttled:
+                    metrics.inc('google_api_throttles_total', help_text='Google API calls rejected by a rate limit.',
+                                quota=quota)
+                metrics.inc('google_api_retries_total', help_text='Google API calls retried after a transient error.',
+                            quota=quota)
+                print(f"Google API {service} {operation} failed with a retryable error ({e}), "
+                      f"retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def write(self, spreadsheet_id, data, requests, service_factory):
+        """
+        Queues a write to the spreadsheet.
+        Args:
+            data (list): {'range', 'values'} entries for values().batchUpdate.
+            requests (list): Requests for batchUpdate, sent after the values.
+            service_factory (callable): Returns a Sheets service for the sender thread that calls it.
+        Returns:
+            Future: Resolves to the number of API calls of the batch the write was sent in.
+        """
+        future = Future()
+        with self._condition:
+            self._ensure_workers()
+            self._pending.setdefault(spreadsheet_id, []).append((data, requests, service_factory, future))
+            self.writes += 1
+            self._condition.notify_all()
+        return future
+
+    def _ensure_workers(self):
+        # Started on first use, like the job queue's workers
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._run, name=f"google-writer-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                spreadsheet_id = None
+                while spreadsheet_id is None:
+                    spreadsheet_id = next((key for key in self._pending if key not in self._in_flight), None)
+                    if spreadsheet_id is None:
+                        self._condition.wait()
+                self._in_flight.add(spreadsheet_id)
+            # Writes arriving while this waits for budget join the batch
+            self._acquire('sheets_write')
+            with self._condition:
+                batch = self._pending.pop(spreadsheet_id)
+                self.batches += 1
+            try:
+                calls = self._send(spreadsheet_id, batch)
+                for *_, future in batch:
+                    future.set_result(calls)
+            except Exception as e:
+                for *_, future in batch:
+                    future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._in_flight.discard(spreadsheet_id)
+                    self._condition.notify_all()
+
+    def _send(self, spreadsheet_id, batch):
+        service = batch[0][2]()
+        data = [entry for entry_data, _, _, _ in batch for entry in entry_data]
+        requests = []
+        seen = set()
+        for _, entry_requests, _, _ in batch:
+            for request in entry_requests:
+                # Several writes to one tab each ask for the same resize
+                key = json.dumps(request, sort_keys=True)
+                if key not in seen:
+                    seen.add(key)
+                    requests.append(request)
+        calls = 0
+        acquired = True
+        if data:
+            self.call('sheets_write', lambda: service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id, body={'valueInputOption': 'USER_ENTERED', 'data': data}
+            ).execute(), 'sheets', 'values.batchUpdate', acquired=acquired)
+            calls += 1
+            acquired = False
+        if requests:
+            # Resizing must follow the value writes so it accounts for the new content
+            self.call('sheets_write', lambda: service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id, body={'requests': requests}).execute(),
+                'sheets', 'batchUpdate', acquired=acquired)
+            calls += 1
+        return calls
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queued_writes': sum(len(batch) for batch in self._pending.values()),
+                'writes': self.writes,
+                'batches': self.batches,
+                'calls': self.calls,
+                'throttles': self.throttles,
+                'retries': self.retries,
+                'failures': self.failures,
+            }
+
+def create_google_scheduler():
+    """
+    Creates the Sheets and Drive scheduler configured by the environment variables.
+    """
+    return GoogleApiScheduler(
+        sheets_writes_per_minute=int(os.getenv('SHEETS_WRITE_REQUESTS_PER_MINUTE', '60')),
+        sheets_reads_per_minute=int(os.getenv('SHEETS_READ_REQUESTS_PER_MINUTE', '60')),
+        drive_requests_per_minute=int(os.getenv('DRIVE_REQUESTS_PER_MINUTE', '120')),
+        max_retries=int(os.getenv('GOOGLE_MAX_RETRIES', '6')),
+    )
@@ -0,0 +1,124 @@
+import itertools
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from metrics import current_job_id
+
+
+class JobQueue:
+    """
+    In-process job queue backed by a bounded pool of worker threads.
+
+    Slack endpoints enqueue work here and return immediately, so the slow parts of the
+    pipeline (STS, Drive, Bedrock, Sheets) never run inside the HTTP request. Job IDs
+    start with id_prefix, so the jobs of several queues can be told apart.
+    """
+
+    def __init__(self, max_workers=4, max_queue_size=100, max_finished_jobs=500, name='job', id_prefix=''):
+        self.max_workers = max_workers
+        self.name = name
+        self.id_prefix = id_prefix
+        self.max_finished_jobs = max_finished_jobs
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._workers = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_workers(self):
+        # Workers are started on first use so importing the app stays cheap and the
+        # Flask reloader's parent process never spawns threads it won't use.
+        with self._start_lock:
+            if self._workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, fn, *args, description=None, **kwargs):
+        """
+        Enqueues a call to fn(*args, **kwargs).
+        Returns:
+            str: The job ID, or None if the queue is full.
+        """
+        self._ensure_workers()
+        job_id = f"{self.id_prefix}{next(self._ids)}"
+        job = {
+            'id': job_id,
+            'description': description or getattr(fn, '__name__', 'job'),
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+        }
+        with self._jobs_lock:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait((job_id, fn, args, kwargs))
+        except queue.Full:
+            with self._jobs_lock:
+                del self._jobs[job_id]
+            print(f"The {self.name} queue is full, rejecting job: {job['description']}")
+            return None
+        return job_id
+
+    def _run(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            self._set_status(job_id, 'running', started_at=time.time())
+            token = current_job_id.set(job_id)
+            try:
+                fn(*args, **kwargs)
+                self._set_status(job_id, 'succeeded', finished_at=time.time())
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                traceback.print_exc()
+                self._set_status(job_id, 'failed', finished_at=time.time(), error=str(e))
+            finally:
+                current_job_id.reset(token)
+                self._queue.task_done()
+
+    def _set_status(self, job_id, status, **fields):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = status
+            job.update(fields)
+            if status in ('succeeded', 'failed'):
+                self._prune_finished()
+
+    def _prune_finished(self):
+        # Keep only the most recent finished jobs so status history stays bounded
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job['status'] in ('succeeded', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._jobs_lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+        return {
+            'workers': self.max_workers,
+            'queue_depth': self._queue.qsize(),
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'succeeded': statuses.count('succeeded'),
+            'failed': statuses.count('failed'),
+        }
+
+    def join(self):
+        """
+        Blocks until every enqueued job has finished.
+        """
+        self._queue.join()
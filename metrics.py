@@ -0,0 +1,182 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# ID of the job the current code runs for, set by the job queue
+current_job_id = contextvars.ContextVar('current_job_id', default=None)
+# Labels (such as the tab) added to every timing recorded in the current context
+_context_labels = contextvars.ContextVar('context_labels', default={})
+
+_lock = threading.Lock()
+_help = {}
+_types = {}
+_histograms = {}
+_counters = {}
+_gauges = {}
+# job ID -> {span name: total seconds}, for the most recent jobs only
+_job_spans = OrderedDict()
+MAX_TRACKED_JOBS = 500
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def _declare(name, metric_type, help_text):
+    _types.setdefault(name, metric_type)
+    if help_text:
+        _help.setdefault(name, help_text)
+
+def observe(name, value, help_text=None, buckets=DEFAULT_BUCKETS, **labels):
+    """
+    Records value in the histogram name{labels}.
+    """
+    with _lock:
+        _declare(name, 'histogram', help_text)
+        key = _key(name, labels)
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def inc(name, value=1, help_text=None, **labels):
+    """
+    Increments the counter name{labels}.
+    """
+    with _lock:
+        _declare(name, 'counter', help_text)
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+def register_gauge(name, callback, help_text=None):
+    """
+    Registers a gauge whose value is read from callback() whenever metrics are rendered.
+    """
+    with _lock:
+        _declare(name, 'gauge', help_text)
+        _gauges[name] = callback
+
+@contextmanager
+def tagged(**labels):
+    """
+    Adds labels to every timing recorded inside the block, including in outbound calls.
+    """
+    token = _context_labels.set({**_context_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _context_labels.reset(token)
+
+@contextmanager
+def timed(name, help_text=None, **labels):
+    """
+    Times the block into the histogram name{labels}, tagged with the context's labels, and
+    adds the duration to the current job's spans.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        all_labels = {**_context_labels.get(), **labels}
+        observe(name, elapsed, help_text=help_text, **all_labels)
+        _record_job_span(name, all_labels, elapsed)
+
+def stage(name):
+    """
+    Times a stage of the test-plan pipeline.
+    """
+    return timed('pipeline_stage_seconds', help_text='Duration of test-plan pipeline stages.', stage=name)
+
+def outbound_call(service, operation):
+    """
+    Times a call to an external service.
+    """
+    return timed('outbound_call_seconds', help_text='Duration of calls to external services.',
+                 service=service, operation=operation)
+
+def _record_job_span(name, labels, elapsed):
+    job_id = current_job_id.get()
+    if job_id is None:
+        return
+    span = '.'.join([name] + [str(v) for _, v in sorted(labels.items()) if v is not None])
+    with _lock:
+        spans = _job_spans.get(job_id)
+        if spans is None:
+            spans = _job_spans[job_id] = {}
+            while len(_job_spans) > MAX_TRACKED_JOBS:
+                _job_spans.popitem(last=False)
+        spans[span] = spans.get(span, 0.0) + elapsed
+
+def job_spans(job_id):
+    """
+    Returns:
+        dict: Total seconds per span recorded for the job, or None if it is unknown.
+    """
+    with _lock:
+        spans = _job_spans.get(job_id)
+        return dict(spans) if spans is not None else None
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus():
+    """
+    Returns:
+        str: Every metric in the Prometheus text exposition format.
+    """
+    with _lock:
+        histograms = {key: dict(value, counts=list(value['counts'])) for key, value in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        types = dict(_types)
+        help_texts = dict(_help)
+
+    lines = []
+    def header(name):
+        if name in help_texts:
+            lines.append(f"# HELP {name} {help_texts[name]}")
+        lines.append(f"# TYPE {name} {types[name]}")
+
+    for name in sorted({key[0] for key in histograms}):
+        header(name)
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    for name in sorted({key[0] for key in counters}):
+        header(name)
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for name, callback in sorted(gauges.items()):
+        try:
+            value = callback()
+        except Exception as e:
+            print(f"Error reading gauge {name}: {e}")
+            continue
+        header(name)
+        lines.append(f"{name} {_format_value(value)}")
+
+    return '\n'.join(lines) + '\n'
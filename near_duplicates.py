@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+
+# Columns that do not describe what a test case checks, so they are left out of comparisons
+IGNORED_COLUMNS = ('s.no', 'priority', 'category')
+BREAK_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+# Signatures are computed over blocks of rows with about this many (shingle, permutation)
+# hashes, which keeps the working array (8 bytes per hash) small enough to stay fast
+BLOCK_HASHES = 1 << 20
+
+def priority_rank(priority):
+    """
+    Returns:
+        int: 0 for P0, 1 for P1, 2 for P2, and 3 for anything else, so lower ranks first.
+    """
+    match = re.fullmatch(r'p([0-2])', (priority or '').strip().lower())
+    return int(match.group(1)) if match else 3
+
+def choose_bands(num_perm, threshold):
+    """
+    Returns:
+        tuple: The (bands, rows per band) of LSH banding whose similarity threshold,
+        about (1 / bands) ** (1 / rows), is the highest one not above threshold, so pairs
+        at the threshold are still likely to become candidates.
+    """
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1])) if below else options[-1]
+
+class NearDuplicateFilter:
+    """
+    Drops test cases that nearly repeat another one. Each row's text (all columns but S.No,
+    Priority and Category, normalized) is cut into character shingles whose MinHash
+    signatures are computed for many rows at once with NumPy; LSH banding over the
+    signatures finds candidate pairs, which are kept as near duplicates when their
+    estimated Jaccard similarity reaches threshold.
+
+    One filter is shared by the tabs of a plan. Within a table the higher-priority row of a
+    near-duplicate pair is kept (the earlier row on a tie); a row that nearly repeats a row
+    kept by an earlier call (for example a tab already written to the sheet) is dropped.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=128, shingle_size=5, seed=1):
+        import numpy as np
+        self.np = np
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.band_rows = choose_bands(num_perm, threshold)
+        random = np.random.default_rng(seed)
+        # Multiply-shift hashing: odd multipliers, the high 32 bits of each product are used
+        self._multipliers = random.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._offsets = random.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._band_weights = random.integers(1, 2 ** 63, self.band_rows, dtype=np.uint64) | np.uint64(1)
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._lock = threading.Lock()
+        self.removed = 0
+
+    @staticmethod
+    def row_texts(header, rows):
+        """
+        Returns:
+            list: The text each row is compared by, lowercased with whitespace collapsed.
+        """
+        keep = [i for i, cell in enumerate(header) if cell.strip().lower().rstrip('.') not in IGNORED_COLUMNS]
+        texts = []
+        for row in rows:
+            text = ' '.join(row[i] for i in keep if i < len(row))
+            if '<' in text:
+                text = BREAK_PATTERN.sub(' ', text)
+            texts.append(' '.join(text.lower().split()))
+        return texts
+
+    def signatures(self, texts):
+        """
+        Returns:
+            ndarray: One MinHash signature (num_perm uint32 values) per text. Texts must not be empty.
+        """
+        np = self.np
+        k = self.shingle_size
+        # Every text is padded to at least one shingle and joined into one byte array
+        encoded = [text.encode('utf-8').ljust(k) for text in texts]
+        lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+
+        # Polynomial hash of every k-byte window, kept only where the window is inside one text
+        windows = len(data) - k + 1
+        hashes = np.zeros(windows, dtype=np.uint64)
+        for j in range(k):
+            hashes = hashes * np.uint64(1099511628211) + data[j:j + windows]
+        row_of = np.repeat(np.arange(len(texts)), lengths)
+        inside = row_of[:windows] == row_of[k - 1:]
+        hashes = hashes[inside]
+        hashes ^= hashes >> np.uint64(29)
+        counts = lengths - k + 1
+        # Where each text's shingles start, and where the last one's end
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+
+        # MinHash over blocks of whole rows, permuting in place in one reused buffer;
+        # reduceat takes the minimum of each row's shingles
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        block = max(1, BLOCK_HASHES // self.num_perm)
+        buffer = np.empty((self.num_perm, block), dtype=np.uint64)
+        first = 0
+        while first < len(texts):
+            begin = bounds[first]
+            last = max(first + 1, int(np.searchsorted(bounds, begin + block, side='right')) - 1)
+            end = bounds[last]
+            # A single row longer than a block gets its own array
+            permuted = buffer[:, :end - begin] if end - begin <= block else np.empty((self.num_perm, end - begin),
+                                                                                   dtype=np.uint64)
+            np.multiply(self._multipliers[:, None], hashes[None, begin:end], out=permuted)
+            permuted += self._offsets[:, None]
+            permuted >>= np.uint64(32)
+            minimums = np.minimum.reduceat(permuted, bounds[first:last] - begin, axis=1)
+            signatures[first:last] = minimums.T
+            first = last
+        return signatures
+
+    def _candidate_pairs(self, signatures, ranks):
+        # Rows sharing a band bucket become candidates, each paired with the best-ranked row of the bucket
+        np = self.np
+        pairs = []
+        for band in range(self.bands):
+            columns = signatures[:, band * self.band_rows:(band + 1) * self.band_rows].astype(np.uint64)
+            keys = (columns * self._band_weights).sum(axis=1)
+            order = np.lexsort((ranks, keys))
+            sorted_keys = keys[order]
+            run_start = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+            run_ids = np.cumsum(run_start) - 1
+            leaders = order[run_start][run_ids]
+            duplicate = leaders != order
+            pairs.append(np.stack((leaders[duplicate], order[duplicate]), axis=1))
+        pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+        return np.unique(pairs, axis=0) if len(pairs) else pairs
+
+    def filter_table(self, table, first_number=1):
+        """
+        Args:
+            table (list): A header row followed by test case rows.
+            first_number (int): The S.No of the first row kept.
+        Returns:
+            list: The header row followed by the rows kept, with S.No renumbered.
+        """
+        np = self.np
+        if len(table) < 2:
+            return table
+        header, rows = table[0], table[1:]
+        texts = self.row_texts(header, rows)
+        compared = [i for i, text in enumerate(texts) if text]
+        if not compared:
+            return table
+        normalized_header = [cell.strip().lower().rstrip('.') for cell in header]
+        priority_column = normalized_header.index('priority') if 'priority' in normalized_header else None
+        number_column = normalized_header.index('s.no') if 's.no' in normalized_header else None
+        signatures = self.signatures([texts[i] for i in compared])
+        row_ranks = np.array([priority_rank(rows[i][priority_column] if priority_column is not None
+                                            and priority_column < len(rows[i]) else None) * len(rows) + i
+                              for i in compared], dtype=np.int64)
+
+        with self._lock:
+            previous = self._signatures
+            # Rows kept by earlier calls rank first, so they always win
+            all_signatures = np.concatenate((previous, signatures))
+            ranks = np.concatenate((np.arange(len(previous), dtype=np.int64) - len(previous), row_ranks))
+            pairs = self._candidate_pairs(all_signatures, ranks)
+            if len(pairs):
+                similarity = (all_signatures[pairs[:, 0]] == all_signatures[pairs[:, 1]]).mean(axis=1)
+                pairs = pairs[similarity >= self.threshold]
+            # Orient every pair from the better-ranked row to the other
+            swap = ranks[pairs[:, 0]] > ranks[pairs[:, 1]]
+            pairs[swap] = pairs[swap][:, ::-1]
+
+            kept = np.ones(len(all_signatures), dtype=bool)
+            rivals = {}
+            for winner, loser in pairs.tolist():
+                rivals.setdefault(loser, []).append(winner)
+            for row in sorted(rivals, key=lambda row: ranks[row]):
+                if row >= len(previous) and any(kept[winner] for winner in rivals[row]):
+                    kept[row] = False
+            new_kept = kept[len(previous):]
+            self._signatures = np.concatenate((previous, signatures[new_kept]))
+            dropped = {compared[i] for i in np.flatnonzero(~new_kept).tolist()}
+            self.removed += len(dropped)
+
+        result = [header]
+        for i, row in enumerate(rows):
+            if i in dropped:
+                continue
+            if number_column is not None and number_column < len(row):
+                row = list(row)
+                row[number_column] = str(first_number + len(result) - 1)
+            result.append(row)
+        return result
+
+def create_near_duplicate_filter():
+    """
+    Creates the near-duplicate filter for one plan with NEAR_DUPLICATE_THRESHOLD, or returns
+    None if it is 0.
+    """
+    threshold = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.85'))
+    if threshold <= 0:
+        return None
+    return NearDuplicateFilter(threshold)
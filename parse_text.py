@@ -3,46 +3,211 @@ import re
 def is_greeting(text):
     return text.lower() == "hi"
 
+def is_revise_request(text):
+    return text.lower() in ("revise", "revise plan")
+
+def is_regenerate_request(text):
+    return text.lower() in ("regenerate", "regenerate plan")
+
+def is_same(text):
+    return text.lower() == "same"
+
 def remove_curly_brace_pairs(input_text):
     # This regex will match pairs of curly braces with anything in between, non-greedy
     pattern = re.compile(r'\{.*?\}')
     return re.sub(pattern, '', input_text)
 
 def parse_claude_response(raw_response):
+    """
+    Parses the markdown table in Claude's response in a single pass.
+    Args:
+        raw_response (str or iterable): The response text, or an iterable of its lines.
+    Returns:
+        list: The header row followed by the table rows, every row as wide as the header.
+    """
     if raw_response is None:
         raise ValueError("The response from Claude is empty. Cannot parse an empty response.")
 
-    raw_response = raw_response.replace('<br>', '[BR_TOKEN]').replace('\n', '[NL_TOKEN]')
-    lines = raw_response.split('[NL_TOKEN]')
-    data = []
-
-    # Flags to identify if we are inside a table
-    header_found = False
-    table_started = False
-
-    for i, line in enumerate(lines):
-        if '|' in line:
-            # Replace tokens with actual newline characters to preserve the formatting inside the cells
-            line = line.replace('[BR_TOKEN]', '\n')
-
-            # Check for the header row based on the presence of '| --- |'
-            if '---' in line and '|' in lines[i-1]:
-                header_found = True
-                # Strip leading and trailing '|', then split using '|' and strip each cell value
-                headers = [cell.strip() for cell in lines[i-1].strip('|').split('|')]
-                data.append(headers)  # Append headers to the data
-                continue
-            
-            # Check if this could be a content row based on whether we already found a header
-            if header_found and '|' in line:
-                table_started = True
-                row_data = [cell.strip() for cell in line.strip('|').split('|')]
-                data.append(row_data)
-            elif table_started:
-                # Once table content has started, break out at the first row without '|'
-                break
-
-    if not data or not header_found:
+    parser = IncrementalTableParser()
+    if isinstance(raw_response, str):
+        # Split a block of lines at a time rather than the whole response up front, so only
+        # one block of line strings is alive besides the parsed rows
+        data = []
+        for lines in _line_blocks(raw_response):
+            data.extend(parser.parse_lines(lines))
+    else:
+        data = parser.parse_lines(raw_response)
+
+    if not data or not parser.header_found:
         raise ValueError("No markdown table data found in the response")
 
     return data
+
+# Characters of a response split into lines at once by parse_claude_response
+LINE_BLOCK_SIZE = 64 * 1024
+
+def _line_blocks(text):
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start + LINE_BLOCK_SIZE)
+        if end == -1:
+            end = len(text)
+        yield text[start:end].split('\n')
+        start = end + 1
+
+BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+# Splits on '|' unless it is escaped as '\|'
+CELL_SEPARATOR_PATTERN = re.compile(r'(?<!\\)\|')
+SEPARATOR_ROW_PATTERN = re.compile(r'^[\s|:-]*-{3}[\s|:-]*$')
+
+def _split_row(line):
+    if '<' in line:
+        line = line.replace('<br>', '\n')
+        if '<' in line:
+            line = BR_PATTERN.sub('\n', line)
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    if '\\|' not in line:
+        return [cell.strip() for cell in line.split('|')]
+    return [cell.replace('\\|', '|').strip() for cell in CELL_SEPARATOR_PATTERN.split(line)]
+
+class IncrementalTableParser:
+    """
+    Parses a markdown table line by line. Text can also be fed in arbitrary chunks, as it
+    arrives from a streamed response, and every row is returned as soon as the line it is
+    on is complete. The header row is returned first, and every row is padded (or has its
+    extra cells merged into the last column) to the width of the header.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._previous_line = ''
+        self._width = 0
+        self.header_found = False
+
+    def feed(self, chunk):
+        """
+        Returns:
+            list: The rows completed by this chunk.
+        """
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        return self.parse_lines(lines)
+
+    def close(self):
+        """
+        Parses the trailing line once the stream has ended.
+        Returns:
+            list: The rows completed by the trailing line.
+        """
+        rows = self.parse_lines([self._buffer]) if self._buffer else []
+        self._buffer = ''
+        if not self.header_found:
+            raise ValueError("No markdown table data found in the response")
+        return rows
+
+    def parse_line(self, line):
+        """
+        Returns:
+            list: The row on this line, or None if the line is not a table row.
+        """
+        rows = self.parse_lines([line])
+        return rows[0] if rows else None
+
+    def parse_lines(self, lines):
+        """
+        Returns:
+            list: The rows on these complete lines. Blank lines are skipped.
+        """
+        # The loop runs once per line of every response, so the parser's state is kept in
+        # locals and the common case of _split_row is inlined
+        rows = []
+        previous_line = self._previous_line
+        width = self._width
+        header_found = self.header_found
+        for line in lines:
+            if '|' not in line:
+                if line:
+                    previous_line = line
+                continue
+            if '---' in line and SEPARATOR_ROW_PATTERN.match(line):
+                # The header is the row right above the first '| --- |' separator
+                if not header_found and '|' in previous_line:
+                    header_found = True
+                    header = _split_row(previous_line)
+                    width = len(header)
+                    rows.append(header)
+                previous_line = line
+                continue
+            previous_line = line
+            if not header_found:
+                continue
+            if '\\|' in line:
+                row = _split_row(line)
+            else:
+                if '<' in line:
+                    line = line.replace('<br>', '\n')
+                    if '<' in line:
+                        line = BR_PATTERN.sub('\n', line)
+                line = line.strip()
+                if line[:1] == '|':
+                    line = line[1:]
+                if line[-1:] == '|':
+                    line = line[:-1]
+                row = [cell.strip() for cell in line.split('|')]
+            if len(row) != width:
+                if len(row) < width:
+                    row.extend([''] * (width - len(row)))
+                else:
+                    row[width - 1:] = [' | '.join(cell for cell in row[width - 1:] if cell)]
+            rows.append(row)
+        self._previous_line = previous_line
+        self._width = width
+        self.header_found = header_found
+        return rows
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def _row_key(row, skip_column):
+    return tuple(WHITESPACE_PATTERN.sub(' ', cell).strip().lower()
+                 for i, cell in enumerate(row) if i != skip_column)
+
+def merge_tables(tables):
+    """
+    Merges tables parsed from separate responses under the first table's header. Rows that
+    repeat an earlier row (ignoring case, whitespace and the S.No column) are dropped, and
+    the S.No column is renumbered from 1.
+    Args:
+        tables (list): Tables as returned by parse_claude_response.
+    Returns:
+        list: The header row followed by the merged rows.
+    """
+    tables = [table for table in tables if table]
+    if not tables:
+        raise ValueError("No markdown table data found in the response")
+
+    header = tables[0][0]
+    width = len(header)
+    normalized_header = [cell.strip().lower().rstrip('.') for cell in header]
+    number_column = normalized_header.index('s.no') if 's.no' in normalized_header else None
+
+    merged = [header]
+    seen = set()
+    for table in tables:
+        for row in table[1:]:
+            if len(row) < width:
+                row = row + [''] * (width - len(row))
+            elif len(row) > width:
+                row = row[:width - 1] + [' | '.join(cell for cell in row[width - 1:] if cell)]
+            key = _row_key(row, number_column)
+            if key in seen or not any(key):
+                continue
+            seen.add(key)
+            if number_column is not None:
+                row = list(row)
+                row[number_column] = str(len(merged))
+            merged.append(row)
+    return merged
@@ -0,0 +1,143 @@
+from collections import namedtuple
+from functools import lru_cache
+
+# Shared by every tab of a plan and placed first, so Bedrock prompt caching can reuse it
+# across the plan's tabs. Only the feature context varies.
+PREFIX_TEMPLATE = """ Human: You are writing test cases in tabular form for a feature's test plan.
+Feature name: {feature_name}
+Feature details: {feature_details}
+Extra Information: {extra_info}
+Do not include any introductory text, explanations, or comments outside of the table.
+Start your table immediately and exclude any non-table text.
+Priority must be one of P0 (high), P1 (medium) or P2 (low).
+"""
+
+DEFAULT_COLUMNS = ("S.No", "Test Case Description", "Priority", "Test Steps", "Expected Outcomes")
+SECURITY_COLUMNS = ("S.No", "Category", "Test Case Description", "Priority", "Test Steps", "Expected Outcomes")
+
+# slices: scenario areas a large tab can be split into, each generated by its own prompt
+PromptTemplate = namedtuple('PromptTemplate', ['task', 'guidance', 'columns', 'slices'], defaults=[()])
+
+# Keyed by the tab names in app.tab_mapping
+PROMPT_TEMPLATES = {
+    "Acceptance Criteria - Use Cases": PromptTemplate(
+        "Generate as many test cases as possible for the feature, ensuring that all logic paths and user scenarios are covered.",
+        "Do not just limit to 10-15 test cases (if possible), build as many test cases as possible with all possible permutations and combinations.",
+        DEFAULT_COLUMNS,
+        ("core user flows and happy paths",
+         "input validation, boundary values and error handling",
+         "roles, permissions and configuration combinations",
+         "integrations, concurrent use and state transitions")),
+    "Regression Tests - Impacted Features": PromptTemplate(
+        "Generate as many test cases as possible for potential regression in features that might be impacted by the feature.",
+        "Focus on areas of the application that are most likely to be affected and detail the steps required to verify that existing functionality is still working as expected.\n"
+        "Build as many regression test cases as possible with all possible permutations and combinations.",
+        DEFAULT_COLUMNS),
+    "Performance": PromptTemplate(
+        "Generate as many test cases as possible to outline performance test scenarios that assess the responsiveness, stability, and speed of the feature.",
+        "Describe the setup, tools required to measure, expected metrics, and how to simulate load or stress conditions.\n"
+        "Build as many performance test cases as possible with all possible permutations and combinations.",
+        DEFAULT_COLUMNS),
+    "Security": PromptTemplate(
+        "Generate as many test cases as possible covering comprehensive security verification of the feature including role-based access control, cross-organization data isolation, common attack vectors like XSS, SQL injection, and any potential vulnerabilities related to data exposure.",
+        "Build as many security test cases as possible with all possible permutations and combinations.",
+        SECURITY_COLUMNS,
+        ("authentication, authorization and role-based access control",
+         "cross-organization data isolation and data exposure",
+         "injection and cross-site scripting attack vectors",
+         "session handling, rate limiting and auditability")),
+    "API": PromptTemplate(
+        "If the feature includes API changes, provide as many API test cases as possible that validate both positive paths and error cases.",
+        "Include tests for request and response integrity, error handling, and adherence to RESTful principles if applicable. Test cases should also consider boundary conditions and data validation.\n"
+        "Test steps should include steps to be performed, Request, API and Payload to be used (if possible).",
+        DEFAULT_COLUMNS),
+    "Browser Specific": PromptTemplate(
+        "Generate as many browser compatibility test cases as possible that ensure the feature works correctly on supported web browsers.",
+        "Include steps for checking functionality, layout, and user interactions.",
+        DEFAULT_COLUMNS),
+    "Usability": PromptTemplate(
+        "Generate as many usability test cases as possible that assess the user experience and interaction flow of the feature.",
+        "Focus on intuitiveness, ease of use, and user satisfaction metrics.",
+        DEFAULT_COLUMNS),
+    "Backward Compatibility": PromptTemplate(
+        "Generate as many test cases as possible to ensure backward compatibility for the feature, paying special attention to impacts on existing features, customer queries, and data handling.",
+        "Address any potential breaking changes and compatibility with previous versions.",
+        DEFAULT_COLUMNS),
+    "Migration": PromptTemplate(
+        "Generate as many test cases as possible to validate migration scenarios for the feature including data migration integrity prior and post-migration, performance comparison, and the correctness of the data transformation process.",
+        "",
+        DEFAULT_COLUMNS),
+}
+
+def compile_suffix(template, slice_name=None):
+    """
+    Renders the tab-specific part of a prompt. It does not depend on the feature, so it is
+    rendered once per tab (and slice) when the module is loaded.
+    """
+    lines = [template.task]
+    if slice_name:
+        lines.append(f"Only cover test cases for this area: {slice_name}. Other areas are covered separately.")
+    if template.guidance:
+        lines.append(template.guidance)
+    lines.append(f"The table should only include the columns: {', '.join(template.columns)}.")
+    lines.append("The response should be in markdown format, starting immediately below a header row like this:")
+    lines.append("| " + " | ".join(template.columns) + " |")
+    lines.append("|" + " --- |" * len(template.columns))
+    lines.append("Assistant: ")
+    return '\n'.join(lines)
+
+# (tab, slice or None) -> suffix
+COMPILED_SUFFIXES = {}
+for _tab, _template in PROMPT_TEMPLATES.items():
+    for _slice in (None,) + _template.slices:
+        COMPILED_SUFFIXES[_tab, _slice] = compile_suffix(_template, _slice)
+
+def prompt_slices(tab):
+    """
+    Returns:
+        tuple: The areas the tab can be split into, empty if it is always generated whole.
+    """
+    template = PROMPT_TEMPLATES.get(tab)
+    return template.slices if template else ()
+
+@lru_cache(maxsize=256)
+def render_prefix(feature_name, feature_details, extra_info):
+    # str.format does not re-interpret braces inside the values, so user text is safe as is
+    return PREFIX_TEMPLATE.format(feature_name=feature_name, feature_details=feature_details,
+                                  extra_info=extra_info)
+
+def render_examples(table, max_rows=15):
+    """
+    Renders test cases written earlier for a similar feature (header row first), to be
+    shown to Claude as examples to extend rather than repeat.
+    """
+    lines = ["Test cases written earlier for a similar feature are listed below. "
+             "Adapt them to this feature and add what they miss instead of repeating them:"]
+    for row in table[:max_rows + 1]:
+        lines.append("| " + " | ".join(cell.replace('\n', ' ') for cell in row) + " |")
+    return '\n'.join(lines) + '\n'
+
+def build_claude_prompt_parts(feature_name, feature_details, extra_info, tab, slice_name=None, examples=None):
+    """
+    Args:
+        slice_name (str): One of prompt_slices(tab), to only ask for that area of the tab.
+        examples (list): Earlier test cases (header row first) to seed the tab with.
+    Returns:
+        tuple: The prompt's (prefix, suffix). The prefix is identical for every tab of a plan.
+    """
+    suffix = COMPILED_SUFFIXES.get((tab, slice_name))
+    if suffix is None:
+        if tab in PROMPT_TEMPLATES:
+            raise ValueError(f"Prompt for tab '{tab}' has no slice '{slice_name}'.")
+        raise ValueError(f"Prompt for tab '{tab}' does not exist.")
+    if examples:
+        # After the prefix, so the plan's tabs still share it
+        suffix = render_examples(examples) + suffix
+    return render_prefix(feature_name, feature_details, extra_info), suffix
+
+def build_claude_prompt(feature_name, feature_details, extra_info, tab):
+    """
+    Construct prompt text based on provided details for Claude.
+    """
+    prefix, suffix = build_claude_prompt_parts(feature_name, feature_details, extra_info, tab)
+    return prefix + suffix
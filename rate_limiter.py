@@ -0,0 +1,220 @@
+import os
+import random
+import threading
+import time
+import metrics
+
+# Error codes that mean "slow down": they shrink the concurrency limit and are retried
+# (errors raised inside a response stream use lower camel case codes)
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException', 'Throttling', 'throttlingException'}
+# Transient server-side errors that are retried without shrinking the concurrency limit
+TRANSIENT_ERROR_CODES = {'ServiceUnavailableException', 'InternalServerException',
+                         'ModelNotReadyException', 'ModelTimeoutException', 'serviceUnavailableException',
+                         'internalServerException', 'modelStreamErrorException'}
+
+def classify_error(error):
+    """
+    Returns:
+        tuple: (retryable, throttled) for an exception raised by a Bedrock call. Anything
+        not known to be transient (validation, access denied, missing model...) is fatal.
+    """
+    # Only reached once a Bedrock call has been made, so botocore is already loaded
+    from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, ReadTimeoutError
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if code in THROTTLING_ERROR_CODES or status == 429:
+            return True, True
+        if code in TRANSIENT_ERROR_CODES or (status is not None and status >= 500):
+            return True, False
+        return False, False
+    if isinstance(error, (BotocoreConnectionError, ReadTimeoutError)):
+        return True, False
+    return False, False
+
+class Permit:
+    """
+    A slot held by one in-flight call. Used as a context manager, it is released on exit
+    and a throttling error raised inside the block counts against the concurrency limit.
+    """
+
+    def __init__(self, limiter, estimated_tokens):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.released = False
+
+    def record_usage(self, actual_tokens):
+        """
+        Corrects the token bucket once the real token count of the call is known.
+        """
+        if not actual_tokens:
+            return
+        self.limiter._adjust_tokens(self.estimated_tokens - actual_tokens)
+        self.estimated_tokens = actual_tokens
+
+    def release(self, error=None):
+        if not self.released:
+            self.released = True
+            self.limiter._release(error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(exc)
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide limiter in front of every Bedrock call.
+
+    Two token buckets cap requests per minute and (estimated) tokens per minute, and an
+    AIMD concurrency limit caps calls in flight: every success raises the limit by about
+    one per window of successful calls, and a throttle halves it (at most once per
+    decrease_cooldown seconds, so one burst of throttles counts once). Retryable errors
+    are retried with full-jitter exponential backoff; fatal errors are raised at once.
+    """
+
+    def __init__(self, requests_per_minute=200, tokens_per_minute=400000, max_concurrency=16,
+                 min_concurrency=1, max_retries=6, base_delay=1.0, max_delay=30.0,
+                 burst_seconds=10, decrease_cooldown=1.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_cooldown = decrease_cooldown
+        # A rate of 0 disables that bucket
+        self._request_rate = requests_per_minute / 60
+        self._token_rate = tokens_per_minute / 60
+        self._request_capacity = max(1.0, self._request_rate * burst_seconds)
+        self._token_capacity = self._token_rate * burst_seconds
+        self._request_level = self._request_capacity
+        self._token_level = self._token_capacity
+        self._refilled_at = time.monotonic()
+        self.concurrency_limit = float(max(min_concurrency, max_concurrency // 2))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self.calls = 0
+        self.throttles = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_level = min(self._request_capacity, self._request_level + elapsed * self._request_rate)
+        self._token_level = min(self._token_capacity, self._token_level + elapsed * self._token_rate)
+
+    def _wait_time(self, tokens):
+        # Seconds until both buckets and the concurrency limit admit the call, 0 if they do now
+        waits = [0.0]
+        if self._request_rate and self._request_level < 1:
+            waits.append((1 - self._request_level) / self._request_rate)
+        # A call larger than the whole bucket waits for a full bucket instead of forever
+        tokens = min(tokens, self._token_capacity)
+        if self._token_rate and self._token_level < tokens:
+            waits.append((tokens - self._token_level) / self._token_rate)
+        return max(waits)
+
+    def acquire(self, estimated_tokens=0):
+        """
+        Blocks until the call is admitted.
+        Returns:
+            Permit: The slot to release once the call is finished.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(estimated_tokens)
+                if wait == 0 and self.in_flight < int(self.concurrency_limit):
+                    break
+                # Releases notify the condition; bucket refills are waited out with a timeout
+                self._condition.wait(wait or None)
+            if self._request_rate:
+                self._request_level -= 1
+            if self._token_rate:
+                self._token_level -= estimated_tokens
+            self.in_flight += 1
+            self.calls += 1
+        return Permit(self, estimated_tokens)
+
+    def _release(self, error):
+        throttled = error is not None and classify_error(error)[1]
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttles += 1
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._last_decrease = now
+                    self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            elif error is None:
+                self.concurrency_limit = min(self.max_concurrency,
+                                             self.concurrency_limit + 1 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    def _adjust_tokens(self, delta):
+        if not self._token_rate:
+            return
+        with self._condition:
+            self._token_level = min(self._token_capacity, self._token_level + delta)
+            self._condition.notify_all()
+
+    def backoff_delay(self, attempt):
+        # Full jitter spreads the retries of calls throttled at the same moment
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, estimated_tokens=0, operation='call'):
+        """
+        Calls fn() once admitted, retrying retryable errors with backoff.
+        Returns:
+            tuple: fn's result and its Permit, which the caller releases (for example with
+            a with block) once it has finished reading the result.
+        """
+        attempt = 0
+        while True:
+            permit = self.acquire(estimated_tokens)
+            try:
+                return fn(), permit
+            except Exception as e:
+                permit.release(e)
+                retryable, throttled = classify_error(e)
+                if throttled:
+                    metrics.inc('bedrock_throttles_total', help_text='Bedrock calls rejected by throttling.',
+                                operation=operation)
+                if not retryable or attempt >= self.max_retries:
+                    with self._condition:
+                        self.failures += 1
+                    raise
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                with self._condition:
+                    self.retries += 1
+                metrics.inc('bedrock_retries_total', help_text='Bedrock calls retried after a transient error.',
+                            operation=operation)
+                print(f"Bedrock {operation} failed with a retryable error ({e}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'calls': self.calls,
+                'throttles': self.throttles,
+                'retries': self.retries,
+                'failures': self.failures,
+                'in_flight': self.in_flight,
+                'concurrency_limit': self.concurrency_limit,
+            }
+
+def create_rate_limiter():
+    """
+    Creates the Bedrock rate limiter configured by the BEDROCK_* environment variables.
+    """
+    return AdaptiveRateLimiter(
+        requests_per_minute=int(os.getenv('BEDROCK_REQUESTS_PER_MINUTE', '200')),
+        tokens_per_minute=int(os.getenv('BEDROCK_TOKENS_PER_MINUTE', '400000')),
+        max_concurrency=int(os.getenv('BEDROCK_MAX_CONCURRENCY', '16')),
+        max_retries=int(os.getenv('BEDROCK_MAX_RETRIES', '6')),
+    )
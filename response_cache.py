@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    Content-addressed cache of model responses with a size-bounded in-memory LRU tier and
+    an optional size-bounded on-disk tier. Entries expire after ttl_seconds.
+    """
+
+    def __init__(self, memory_max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024, ttl_seconds=24 * 60 * 60):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # key -> (created_at, text), least recently used first
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    @staticmethod
+    def make_key(model_id, request_body):
+        """
+        Returns the cache key for a request: a hash of the model ID and the full request
+        body, which includes the prompt and every generation parameter.
+        """
+        payload = json.dumps({'model_id': model_id, 'body': request_body}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                self._remove_from_memory(key)
+
+        entry = self._read_from_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._add_to_memory(key, entry)
+        return entry[1]
+
+    def put(self, key, text):
+        entry = (time.time(), text)
+        with self._lock:
+            self._add_to_memory(key, entry)
+        self._write_to_disk(key, entry)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_bytes': self._disk_bytes,
+        }
+
+    def _add_to_memory(self, key, entry):
+        size = len(entry[1].encode())
+        if size > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._remove_from_memory(key)
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            self._remove_from_memory(next(iter(self._memory)))
+
+    def _remove_from_memory(self, key):
+        created_at, text = self._memory.pop(key)
+        self._memory_bytes -= len(text.encode())
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_entries(self):
+        for directory, _, filenames in os.walk(self.disk_dir):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _read_from_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            created_at, text = float(data['created_at']), data['text']
+            if not isinstance(text, str):
+                raise TypeError(f"cached text is a {type(text).__name__}")
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            # Truncated or in another format: a miss, and removed so the next response replaces it
+            print(f"Ignoring malformed response cache entry {path}: {e}")
+            self._delete_from_disk(path)
+            return None
+        if now - created_at >= self.ttl_seconds:
+            self._delete_from_disk(path)
+            return None
+        # The modification time records the last use for LRU eviction
+        os.utime(path)
+        return created_at, text
+
+    def _write_to_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'created_at': entry[0], 'text': entry[1]}, f)
+        size = os.path.getsize(temp_path)
+        # A regenerated response replaces the key's entry, whose size no longer counts
+        try:
+            size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, path)
+        with self._lock:
+            self._disk_bytes += size
+            over_limit = self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._evict_from_disk()
+
+    def _delete_from_disk(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _evict_from_disk(self):
+        # Evict least recently used files until the tier is back under 90% of its budget
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.disk_max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+def create_response_cache():
+    """
+    Creates the response cache configured by the RESPONSE_CACHE_* environment variables,
+    or returns None if RESPONSE_CACHE_ENABLED is false.
+    """
+    if os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+    return ResponseCache(
+        memory_max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_MB', '64')) * 1024 * 1024,
+        disk_dir=os.getenv('RESPONSE_CACHE_DIR') or None,
+        disk_max_bytes=int(os.getenv('RESPONSE_CACHE_DISK_MAX_MB', '512')) * 1024 * 1024,
+        ttl_seconds=int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', str(24 * 60 * 60))),
+    )
@@ -0,0 +1,280 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import metrics
+from google_scheduler import classify_error
+from sheets_manager import duplicate_template_sheet, rename_file, delete_file, get_modified_time, forget_sheet_ids
+
+# Name of the copies waiting in the pool, until a plan claims one
+UNCLAIMED_TITLE = "Unclaimed test plan"
+# Reservations of copies that never finished (the process stopped during the copy) expire after this long
+STALE_RESERVATION_SECONDS = 600
+
+def _is_gone(error):
+    # The copy was deleted, or is no longer shared with the service account (a 403 that is
+    # not a rate limit)
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return status is not None and int(status) in (403, 404) and not classify_error(error)[1]
+
+class SpreadsheetPool:
+    """
+    Copies of the template spreadsheet made ahead of time by a background thread, so a new
+    plan only has to rename one instead of waiting for Drive to copy the template.
+
+    The pool is kept in a local SQLite database, so copies outlive restarts and the worker
+    processes of one host share them without handing one out twice. Whenever the number of
+    copies falls to low_water, the thread copies the template until there are size again.
+    Each copy records the template's Drive modifiedTime (checked at most every
+    check_seconds); copies of an older version of the template are never handed out, and
+    the thread deletes them.
+    """
+
+    def __init__(self, template_id, path, size=4, low_water=2, check_seconds=60.0):
+        self.template_id = template_id
+        self.path = path
+        self.size = size
+        self.low_water = min(low_water, size - 1)
+        self.check_seconds = check_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._service_account_info = None
+        self._template_version = None
+        self._checked_at = 0.0
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS spreadsheet_pool ('
+                'spreadsheet_id TEXT PRIMARY KEY, template_id TEXT NOT NULL, template_version TEXT NOT NULL, '
+                'ready INTEGER NOT NULL, created_at REAL NOT NULL)'
+            )
+
+    @contextmanager
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so each thread keeps its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        yield connection
+
+    @contextmanager
+    def _transaction(self):
+        # Takes the write lock up front, so a copy is claimed or reserved by one process only
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def start(self, service_account_info):
+        """
+        Starts the background thread that fills the pool, once.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._service_account_info = service_account_info
+            self._thread = threading.Thread(target=self._run, name='spreadsheet-pool', daemon=True)
+            self._thread.start()
+
+    def template_version(self, service_account_info, max_age=None):
+        """
+        Returns:
+            str: The template's modifiedTime, looked up again if the last lookup is older
+            than max_age seconds (check_seconds by default).
+        """
+        max_age = self.check_seconds if max_age is None else max_age
+        with self._lock:
+            if self._template_version is not None and time.monotonic() - self._checked_at < max_age:
+                return self._template_version
+        version = get_modified_time(service_account_info, self.template_id)
+        with self._lock:
+            if self._template_version is not None and version != self._template_version:
+                print(f"The template spreadsheet changed ({version}), its pooled copies are discarded")
+                # Its sheetIds may have changed as well
+                forget_sheet_ids(self.template_id)
+                self._wake.set()
+            self._template_version = version
+            self._checked_at = time.monotonic()
+        return version
+
+    def claim(self, service_account_info, new_title):
+        """
+        Takes a copy of the current template from the pool and renames it to new_title.
+        Returns:
+            str: The copy's spreadsheet ID, or None if the pool has none or Drive could not
+            rename it (the caller copies the template itself).
+        """
+        self.start(service_account_info)
+        try:
+            version = self.template_version(service_account_info)
+        except Exception as e:
+            print(f"Could not check the template spreadsheet's version, not using the pool: {e}")
+            return None
+        try:
+            while True:
+                with self._transaction() as connection:
+                    row = connection.execute(
+                        'SELECT spreadsheet_id, created_at FROM spreadsheet_pool WHERE template_id = ? '
+                        'AND template_version = ? AND ready = 1 ORDER BY created_at LIMIT 1',
+                        (self.template_id, version)
+                    ).fetchone()
+                    if row is not None:
+                        connection.execute('DELETE FROM spreadsheet_pool WHERE spreadsheet_id = ?', row[:1])
+                if row is None:
+                    self._record_claim('miss')
+                    return None
+                try:
+                    rename_file(service_account_info, row[0], new_title)
+                except Exception as e:
+                    print(f"Could not claim the pooled spreadsheet {row[0]}: {e}")
+                    if _is_gone(e):
+                        # Deleted or no longer shared with us: whatever is left of it is deleted,
+                        # and the next copy is tried
+                        try:
+                            delete_file(service_account_info, row[0])
+                        except Exception as e:
+                            print(f"Could not delete the pooled spreadsheet {row[0]}: {e}")
+                        continue
+                    # Drive is failing or unreachable: the copy goes back to the pool, and the
+                    # caller copies the template rather than trying every other copy
+                    with self._connection() as connection:
+                        connection.execute('INSERT OR IGNORE INTO spreadsheet_pool VALUES (?, ?, ?, 1, ?)',
+                                           (row[0], self.template_id, version, row[1]))
+                    self._record_claim('miss')
+                    return None
+                self._record_claim('hit')
+                return row[0]
+        finally:
+            # Refills once the claim took the pool down to the low-water mark
+            self._wake.set()
+
+    def _record_claim(self, result):
+        with self._lock:
+            if result == 'hit':
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.inc('spreadsheet_pool_claims_total', help_text='New plans served from the spreadsheet pool, or not.',
+                    result=result)
+
+    def _run(self):
+        while True:
+            # Cleared first, so a claim made during the refill triggers another one
+            self._wake.clear()
+            try:
+                self.refill()
+            except Exception as e:
+                print(f"Error refilling the spreadsheet pool: {e}")
+            self._wake.wait(self.check_seconds)
+
+    def refill(self):
+        """
+        Deletes the copies of older template versions and, if the copies of the current
+        version are down to low_water, copies the template until there are size.
+        """
+        info = self._service_account_info
+        version = self.template_version(info)
+        self._discard_outdated(info, version)
+        with self._connection() as connection:
+            available = connection.execute(
+                'SELECT COUNT(*) FROM spreadsheet_pool WHERE template_id = ? AND template_version = ?',
+                (self.template_id, version)
+            ).fetchone()[0]
+        if available > self.low_water:
+            return
+        while True:
+            # Reserved first, so processes refilling together do not overfill the pool
+            reservation = f"reserved:{uuid.uuid4().hex}"
+            with self._transaction() as connection:
+                available = connection.execute(
+                    'SELECT COUNT(*) FROM spreadsheet_pool WHERE template_id = ? AND template_version = ?',
+                    (self.template_id, version)
+                ).fetchone()[0]
+                if available >= self.size:
+                    return
+                connection.execute('INSERT INTO spreadsheet_pool VALUES (?, ?, ?, 0, ?)',
+                                   (reservation, self.template_id, version, time.time()))
+            try:
+                spreadsheet_id = duplicate_template_sheet(info, self.template_id, UNCLAIMED_TITLE)
+            except Exception:
+                with self._connection() as connection:
+                    connection.execute('DELETE FROM spreadsheet_pool WHERE spreadsheet_id = ?', (reservation,))
+                raise
+            with self._connection() as connection:
+                connection.execute('UPDATE spreadsheet_pool SET spreadsheet_id = ?, ready = 1, created_at = ? '
+                                   'WHERE spreadsheet_id = ?', (spreadsheet_id, time.time(), reservation))
+
+    def _discard_outdated(self, info, version):
+        with self._transaction() as connection:
+            outdated = [row[0] for row in connection.execute(
+                'SELECT spreadsheet_id FROM spreadsheet_pool WHERE template_id = ? AND template_version != ? '
+                'AND ready = 1', (self.template_id, version))]
+            connection.execute('DELETE FROM spreadsheet_pool WHERE template_id = ? AND template_version != ? '
+                               'AND ready = 1', (self.template_id, version))
+            connection.execute('DELETE FROM spreadsheet_pool WHERE ready = 0 AND created_at < ?',
+                               (time.time() - STALE_RESERVATION_SECONDS,))
+        for spreadsheet_id in outdated:
+            try:
+                delete_file(info, spreadsheet_id)
+            except Exception as e:
+                print(f"Could not delete the outdated pooled spreadsheet {spreadsheet_id}: {e}")
+        if outdated:
+            with self._lock:
+                self.invalidated += len(outdated)
+            metrics.inc('spreadsheet_pool_invalidated_total', len(outdated),
+                        help_text='Pooled spreadsheets discarded because the template changed.')
+
+    def available(self):
+        """
+        Returns:
+            int: The number of ready copies of the last known template version.
+        """
+        with self._lock:
+            version = self._template_version
+        with self._connection() as connection:
+            return connection.execute(
+                'SELECT COUNT(*) FROM spreadsheet_pool WHERE template_id = ? AND template_version = ? AND ready = 1',
+                (self.template_id, version)
+            ).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            hits, misses, invalidated = self.hits, self.misses, self.invalidated
+        return {
+            'size': self.size,
+            'low_water': self.low_water,
+            'available': self.available(),
+            'hits': hits,
+            'misses': misses,
+            'invalidated': invalidated,
+        }
+
+def create_sheet_pool(template_id):
+    """
+    Creates the pool of copies of template_id configured by the environment variables, or
+    returns None if SHEET_POOL_SIZE is 0 (the default). The copies are only recorded in
+    the local database, so the pool is meant for hosts whose working directory persists.
+    """
+    size = int(os.getenv('SHEET_POOL_SIZE', '0'))
+    if size <= 0:
+        return None
+    return SpreadsheetPool(
+        template_id,
+        os.getenv('SHEET_POOL_DB_PATH', 'sheet_pool.db'),
+        size=size,
+        low_water=int(os.getenv('SHEET_POOL_LOW_WATER', '2')),
+        check_seconds=float(os.getenv('SHEET_POOL_CHECK_SECONDS', '60')),
+    )
@@ -1,6 +1,14 @@
-from googleapiclient.discovery import build
-from google.oauth2 import service_account 
-from googleapiclient.errors import HttpError
+from threading import Lock
+from client_registry import get_sheets_service, get_drive_service
+from google_scheduler import create_google_scheduler
+
+# Shared by every job: paces Sheets and Drive calls to the per-minute quotas, retries 429
+# and 5xx errors, and merges concurrent writes to the same spreadsheet
+scheduler = create_google_scheduler()
+
+# spreadsheet ID -> {sheet title: sheetId}
+_sheet_ids_cache = {}
+_sheet_ids_lock = Lock()
 
 def initialize_sheets_service(service_account_info):
     """
@@ -8,11 +16,9 @@ def initialize_sheets_service(service_account_info):
     Args:
         service_account_info (dict): The service account info loaded from the JSON file.
     Returns:
-        service: An authorized Google Sheets service object.
+        service: An authorized Google Sheets service object, reused by the calling thread.
     """
-    credentials = service_account.Credentials.from_service_account_info(service_account_info)
-    service = build('sheets', 'v4', credentials=credentials)
-    return service
+    return get_sheets_service(service_account_info)
 
 def duplicate_template_sheet(service_account_info, template_id, new_title):
     """
@@ -26,15 +32,15 @@ def duplicate_template_sheet(service_account_info, template_id, new_title):
     Returns:
         str: The ID of the newly created, duplicated spreadsheet.
     """
-    credentials = service_account.Credentials.from_service_account_info(service_account_info)
-    drive_service = build('drive', 'v3', credentials=credentials)
+    drive_service = get_drive_service(service_account_info)
 
     try:
-        # Copy the spreadsheet
+        # Copy the spreadsheet. A copy that failed with a 5xx or timed out may still have been
+        # made, so only rate limits are retried rather than risking a second copy
         copy_metadata = {'name': new_title}
-        new_file = drive_service.files().copy(
+        new_file = scheduler.call('drive', lambda: drive_service.files().copy(
             fileId=template_id, body=copy_metadata, fields='id', supportsAllDrives=True
-        ).execute()
+        ).execute(), 'drive', 'files.copy', idempotent=False)
 
         # Retrieve and return the ID of the new spreadsheet
         new_spreadsheet_id = new_file.get('id')
@@ -44,64 +50,180 @@ def duplicate_template_sheet(service_account_info, template_id, new_title):
         print(f"Error duplicating spreadsheet: {e}")
         raise
 
-def update_sheet_with_data(service, spreadsheet_id, sheet_range, values):
+def rename_file(service_account_info, file_id, new_title):
     """
-    Updates the specified range in a sheet with the given data.
+    Renames a Drive file, such as a spreadsheet taken from the pool of template copies.
     """
-    try:
-        body = {'values': values}
-        result = service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=sheet_range,
-            body=body,
-            valueInputOption='USER_ENTERED'
-        ).execute()
-        
-        # Parse the sheet name and get sheetId from the range to be used for auto-resizing the columns
-        sheet_name = sheet_range.split('!')[0].strip("'")
-        sheet_id = get_sheet_id_by_name(service, spreadsheet_id, sheet_name)
-        
-        # Auto-resize the columns
-        if sheet_id is not None:
-            autoresize_dimensions(service, spreadsheet_id, sheet_id)
-        return result
-
-    except HttpError as error:
-        print(f"Error updating the sheet: {error}")
-        raise
+    drive_service = get_drive_service(service_account_info)
+    scheduler.call('drive', lambda: drive_service.files().update(
+        fileId=file_id, body={'name': new_title}, fields='id', supportsAllDrives=True
+    ).execute(), 'drive', 'files.update')
+
+def delete_file(service_account_info, file_id):
+    drive_service = get_drive_service(service_account_info)
+    scheduler.call('drive', lambda: drive_service.files().delete(
+        fileId=file_id, supportsAllDrives=True).execute(), 'drive', 'files.delete')
+
+def get_modified_time(service_account_info, file_id):
+    """
+    Returns:
+        str: The Drive modifiedTime of the file (RFC 3339), which changes whenever it is edited.
+    """
+    drive_service = get_drive_service(service_account_info)
+    return scheduler.call('drive', lambda: drive_service.files().get(
+        fileId=file_id, fields='modifiedTime', supportsAllDrives=True
+    ).execute(), 'drive', 'files.get')['modifiedTime']
 
-def autoresize_dimensions(service, spreadsheet_id, sheet_id):
-    body = {
-        "requests": [
-            {
-                "autoResizeDimensions": {
-                    "dimensions": {
-                        "sheetId": sheet_id,
-                        "dimension": "COLUMNS",
-                        "startIndex": 2,  
-                    }
+def autoresize_requests(sheet_id):
+    return [
+        {
+            "autoResizeDimensions": {
+                "dimensions": {
+                    "sheetId": sheet_id,
+                    "dimension": "COLUMNS",
+                    "startIndex": 2,  
                 }
-            },
-            {
-                "autoResizeDimensions": {
-                    "dimensions": {
-                        "sheetId": sheet_id,
-                        "dimension": "ROWS",
-                        "startIndex": 2,  
-                    }
+            }
+        },
+        {
+            "autoResizeDimensions": {
+                "dimensions": {
+                    "sheetId": sheet_id,
+                    "dimension": "ROWS",
+                    "startIndex": 2,  
                 }
             }
-        ]
-    }
-    response = service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet_id, body=body).execute()
-    return response
-
-def get_sheet_id_by_name(service, spreadsheet_id, sheet_name):
-    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    
-    # Find the sheet by name and return its ID
-    for sheet in spreadsheet.get('sheets', []):
-        if sheet['properties']['title'] == sheet_name:
-            return sheet['properties']['sheetId']
-    return None    
+        }
+    ]
+
+def get_sheet_ids(service, spreadsheet_id):
+    """
+    Returns the {sheet title: sheetId} mapping of a spreadsheet, fetched once per spreadsheet.
+    Copies made with duplicate_template_sheet keep the template's sheetIds, so the
+    template's mapping can be used for every copy.
+    """
+    sheet_ids = _sheet_ids_cache.get(spreadsheet_id)
+    if sheet_ids is not None:
+        return sheet_ids
+    # Concurrent plans starting together share a single lookup
+    with _sheet_ids_lock:
+        sheet_ids = _sheet_ids_cache.get(spreadsheet_id)
+        if sheet_ids is None:
+            spreadsheet = scheduler.call('sheets_read', lambda: service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id, fields='sheets.properties(sheetId,title)').execute(), 'sheets', 'get')
+            sheet_ids = {sheet['properties']['title']: sheet['properties']['sheetId']
+                         for sheet in spreadsheet.get('sheets', [])}
+            _sheet_ids_cache[spreadsheet_id] = sheet_ids
+    return sheet_ids
+
+def forget_sheet_ids(spreadsheet_id):
+    """
+    Drops the cached sheetIds of a spreadsheet (the template, after it was edited).
+    """
+    with _sheet_ids_lock:
+        _sheet_ids_cache.pop(spreadsheet_id, None)
+
+def diff_rows(values, previous):
+    """
+    Compares a table with the rows currently in a sheet, position by position.
+    Args:
+        values (list): The new rows.
+        previous (list): The rows read from the sheet at the same position.
+    Returns:
+        list: (offset, rows) for every run of consecutive rows that differ. Rows beyond
+        the end of values that still hold data are returned blank, so they are cleared.
+    """
+    width = max((len(row) for row in values + previous), default=0)
+
+    def padded(rows, i):
+        row = [str(cell) for cell in rows[i]] if i < len(rows) else []
+        return row + [''] * (width - len(row))
+
+    runs = []
+    for i in range(max(len(values), len(previous))):
+        row = padded(values, i)
+        if row == padded(previous, i):
+            continue
+        if runs and runs[-1][0] + len(runs[-1][1]) == i:
+            runs[-1][1].append(row)
+        else:
+            runs.append((i, [row]))
+    return runs
+
+class SheetWriter:
+    """
+    Collects value writes and column/row resizing for one spreadsheet. Every commit is sent
+    by the shared scheduler, which merges it with the other writes to the spreadsheet still
+    waiting to be sent (from this writer's threads or other jobs) into one
+    values().batchUpdate and one batchUpdate call.
+    """
+
+    def __init__(self, service_account_info, spreadsheet_id, sheet_ids):
+        self.service_account_info = service_account_info
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_ids = sheet_ids
+        self.api_calls = 0
+        self._pending = []
+        self._pending_lock = Lock()
+
+    def add(self, sheet_range, values=None, resize=True):
+        """
+        Queues values for sheet_range and, if resize is set, auto-resizing of its sheet.
+        Nothing is sent until flush() is called.
+        """
+        sheet_name = sheet_range.split('!')[0].strip("'")
+        with self._pending_lock:
+            self._pending.append({'range': sheet_range, 'values': values,
+                                  'sheet_name': sheet_name if resize else None})
+
+    def read(self, sheet_names, start_row):
+        """
+        Reads the rows of several sheets from start_row down, with one values().batchGet call.
+        Returns:
+            dict: {sheet name: rows}, without the trailing empty cells and rows Sheets omits.
+        """
+        if not sheet_names:
+            return {}
+        service = initialize_sheets_service(self.service_account_info)
+        response = scheduler.call('sheets_read', lambda: service.spreadsheets().values().batchGet(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=[f"'{sheet_name}'!A{start_row}:Z" for sheet_name in sheet_names]
+        ).execute(), 'sheets', 'values.batchGet')
+        self.api_calls += 1
+        value_ranges = response.get('valueRanges', [])
+        return {sheet_name: value_range.get('values', [])
+                for sheet_name, value_range in zip(sheet_names, value_ranges)}
+
+    def write(self, sheet_range, values, resize=True):
+        """
+        Writes values to sheet_range and returns once they are committed, together with
+        anything else pending for this spreadsheet.
+        """
+        self.add(sheet_range, values, resize)
+        self.flush()
+
+    def resize(self, sheet_name):
+        self.add(f"'{sheet_name}'", resize=True)
+        self.flush()
+
+    def flush(self):
+        """
+        Commits everything queued with add(), and returns once it is written.
+        """
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        data = [{'range': entry['range'], 'values': entry['values']} for entry in batch if entry['values']]
+        sheet_ids = []
+        for entry in batch:
+            sheet_id = self.sheet_ids.get(entry['sheet_name'])
+            if sheet_id is not None and sheet_id not in sheet_ids:
+                sheet_ids.append(sheet_id)
+        requests = [request for sheet_id in sheet_ids for request in autoresize_requests(sheet_id)]
+        try:
+            self.api_calls += scheduler.write(self.spreadsheet_id, data, requests,
+                                              lambda: initialize_sheets_service(self.service_account_info)).result()
+        except Exception as error:
+            print(f"Error updating the sheet: {error}")
+            raise
@@ -1,5 +1,5 @@
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+from client_registry import get_slack_client
+import metrics
 import os
 
 def initialize_slack_client(slack_bot_token):
@@ -10,18 +10,22 @@ def initialize_slack_client(slack_bot_token):
     Returns:
         WebClient: The Slack WebClient instance.
     """
-    return WebClient(token=slack_bot_token)
+    return get_slack_client(slack_bot_token)
 
 def send_slack_message(slack_client, channel_id, text):
+    # slack_sdk is already loaded by the client; importing it here keeps module import cheap
+    from slack_sdk.errors import SlackApiError
     try:
         message_data = {'channel': channel_id, 'text': text}
-        response = slack_client.chat_postMessage(**message_data)
+        with metrics.outbound_call('slack', 'chat_postMessage'):
+            response = slack_client.chat_postMessage(**message_data)
         return response
     except SlackApiError as e:
         print(f"Error sending message to Slack: {e.response['error']}")
         raise
 
 def publish_app_home(user_id, slack_client):
+    from slack_sdk.errors import SlackApiError
     try:
         home_view = {
             "type": "home",
@@ -39,7 +43,8 @@ def publish_app_home(user_id, slack_client):
         }
 
         # Publish the view to the specified user's App Home
-        response = slack_client.views_publish(user_id=user_id, view=home_view)
+        with metrics.outbound_call('slack', 'views_publish'):
+            response = slack_client.views_publish(user_id=user_id, view=home_view)
         return response
     except SlackApiError as e:
         print(f"Got an error: {e.response['error']} - {e.response['response_metadata']}")
@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+# Emoji shown next to each item of a progress message
+STATUS_ICONS = {
+    'queued': ':white_circle:',
+    'generating': ':hourglass_flowing_sand:',
+    'done': ':white_check_mark:',
+    'failed': ':x:',
+    'unchanged': ':heavy_minus_sign:',
+    'cancelled': ':no_entry_sign:',
+}
+
+class ProgressMessage:
+    """
+    A Slack message listing the status of several items (such as the tabs of a plan). It is
+    posted once and then edited in place; updates only change local state and return
+    immediately, and the outbox delivers the latest state in the background.
+    """
+
+    def __init__(self, outbox, slack_client, channel_id, title, items):
+        self.outbox = outbox
+        self.slack_client = slack_client
+        self.channel_id = channel_id
+        self.title = title
+        self.statuses = OrderedDict((item, 'queued') for item in items)
+        self.ts = None
+        # Bumped by every update; the outbox sends until sent_version catches up
+        self.version = 0
+        self.sent_version = 0
+        self.due_at = 0.0
+        self.sending = False
+        self.closing = False
+
+    def update(self, item, status):
+        self.outbox._change(self, lambda: self.statuses.__setitem__(item, status))
+
+    def set_title(self, title):
+        self.outbox._change(self, lambda: setattr(self, 'title', title))
+
+    def close(self, timeout=5.0):
+        """
+        Waits (at most timeout seconds) until the latest state has been delivered, so that
+        messages posted afterwards appear below it.
+        Returns:
+            bool: Whether the latest state was delivered in time.
+        """
+        return self.outbox._wait_until_sent(self, timeout)
+
+    def render(self):
+        lines = [self.title]
+        for item, status in self.statuses.items():
+            lines.append(f"{STATUS_ICONS.get(status, '')} {item}: {status}")
+        return '\n'.join(lines)
+
+class SlackOutbox:
+    """
+    Delivers progress messages from background sender threads, so workers never wait on
+    Slack. Updates to a message arriving within coalesce_seconds of its last delivery are
+    combined into a single chat_update, and a channel that Slack rate limits is paused for
+    the Retry-After it returns while other channels keep going.
+    """
+
+    def __init__(self, coalesce_seconds=1.0, max_workers=2, max_attempts=5):
+        self.coalesce_seconds = coalesce_seconds
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self._pending = OrderedDict()
+        self._attempts = {}
+        self._paused_until = {}
+        self._condition = threading.Condition()
+        self._workers = []
+        self.posts = 0
+        self.updates = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    def start_progress(self, slack_client, channel_id, title, items):
+        """
+        Returns:
+            ProgressMessage: A new progress message, posted in the background.
+        """
+        message = ProgressMessage(self, slack_client, channel_id, title, items)
+        self._change(message, lambda: None)
+        return message
+
+    def _ensure_workers(self):
+        # Started on first use, like the job queue's workers
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._run, name=f"slack-outbox-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _change(self, message, apply):
+        with self._condition:
+            self._ensure_workers()
+            apply()
+            message.version += 1
+            self._pending.setdefault(id(message), message)
+            self._condition.notify_all()
+
+    def _next_message(self):
+        # Called with the condition held; blocks until a message is due
+        while True:
+            now = time.monotonic()
+            wake_at = None
+            for message in self._pending.values():
+                if message.sending:
+                    continue
+                due_at = max(message.due_at, self._paused_until.get(message.channel_id, 0.0))
+                if due_at <= now:
+                    return message
+                wake_at = due_at if wake_at is None else min(wake_at, due_at)
+            self._condition.wait(None if wake_at is None else wake_at - now)
+
+    def _run(self):
+        from slack_sdk.errors import SlackApiError
+        while True:
+            with self._condition:
+                message = self._next_message()
+                message.sending = True
+                version, text, ts = message.version, message.render(), message.ts
+            try:
+                if ts is None:
+                    with metrics.outbound_call('slack', 'chat_postMessage'):
+                        response = message.slack_client.chat_postMessage(channel=message.channel_id, text=text)
+                    ts = response.get('ts')
+                else:
+                    with metrics.outbound_call('slack', 'chat_update'):
+                        message.slack_client.chat_update(channel=message.channel_id, ts=ts, text=text)
+                self._sent(message, version, ts)
+            except SlackApiError as e:
+                self._failed(message, e, retry_after=self._retry_after(e))
+            except Exception as e:
+                self._failed(message, e)
+
+    @staticmethod
+    def _retry_after(error):
+        if error.response.status_code != 429:
+            return None
+        try:
+            return float(error.response.headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            return 1.0
+
+    def _sent(self, message, version, ts):
+        with self._condition:
+            if message.ts is None:
+                self.posts += 1
+            else:
+                self.updates += 1
+            message.ts = ts
+            message.sending = False
+            message.sent_version = version
+            # Once closed, the message is no longer coalesced
+            message.due_at = 0.0 if message.closing else time.monotonic() + self.coalesce_seconds
+            self._attempts.pop(id(message), None)
+            self._paused_until.pop(message.channel_id, None)
+            if message.sent_version == message.version:
+                del self._pending[id(message)]
+            self._condition.notify_all()
+
+    def _failed(self, message, error, retry_after=None):
+        with self._condition:
+            message.sending = False
+            if retry_after is not None:
+                # Rate limits don't count as attempts; the channel waits as long as Slack asks
+                self.rate_limited += 1
+                metrics.inc('slack_rate_limited_total', help_text='Slack calls answered with a rate limit.')
+                self._paused_until[message.channel_id] = time.monotonic() + retry_after
+            else:
+                attempts = self._attempts.get(id(message), 0) + 1
+                self._attempts[id(message)] = attempts
+                print(f"Error updating Slack progress message in {message.channel_id}: {error}")
+                if attempts >= self.max_attempts:
+                    # Give up on this state; a later update tries again
+                    self.failures += 1
+                    self._attempts.pop(id(message), None)
+                    message.sent_version = message.version
+                    del self._pending[id(message)]
+                else:
+                    message.due_at = time.monotonic() + self.coalesce_seconds * attempts
+            self._condition.notify_all()
+
+    def _wait_until_sent(self, message, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # The final state skips the coalescing window (but not a rate limit pause)
+            message.closing = True
+            message.due_at = 0.0
+            self._condition.notify_all()
+            while id(message) in self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pending': len(self._pending),
+                'posts': self.posts,
+                'updates': self.updates,
+                'rate_limited': self.rate_limited,
+                'failures': self.failures,
+            }
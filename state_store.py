@@ -0,0 +1,188 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Conversations untouched for this long are considered abandoned and evicted
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+class MemoryStateStore:
+    """
+    Process-local conversation state with LRU and TTL eviction.
+    Users are locked through a fixed set of lock stripes, so a slow user only ever
+    blocks the few users that hash to the same stripe, and the locks never grow.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=100000, lock_stripes=256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evictions = 0
+        # user_id -> (updated_at, state), oldest first
+        self._states = OrderedDict()
+        self._states_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+
+    def _evict(self, now):
+        # Entries are kept in update order, so expired entries are always at the front
+        while self._states:
+            user_id, (updated_at, _) = next(iter(self._states.items()))
+            if len(self._states) <= self.max_entries and now - updated_at < self.ttl_seconds:
+                break
+            del self._states[user_id]
+            self.evictions += 1
+
+    def get(self, user_id):
+        with self._states_lock:
+            entry = self._states.get(user_id)
+            if entry is None or time.time() - entry[0] >= self.ttl_seconds:
+                return None
+            return entry[1]
+
+    def put(self, user_id, state):
+        now = time.time()
+        with self._states_lock:
+            self._states[user_id] = (now, state)
+            self._states.move_to_end(user_id)
+            self._evict(now)
+
+    def delete(self, user_id):
+        with self._states_lock:
+            self._states.pop(user_id, None)
+
+    @contextmanager
+    def transaction(self, user_id, default=None):
+        """
+        Locks the user's state and yields it for modification. The state is saved when
+        the block exits, including on early return, and left as it was if the block raises.
+        """
+        with self._stripes[hash(user_id) % len(self._stripes)]:
+            state = self.get(user_id)
+            # A copy, so changes made before an exception never reach the stored state
+            state = copy.deepcopy(state) if state is not None else dict(default or {})
+            yield state
+            self.put(user_id, state)
+
+    def evict_expired(self):
+        with self._states_lock:
+            self._evict(time.time())
+
+    def __len__(self):
+        return len(self._states)
+
+class SQLiteStateStore:
+    """
+    Conversation state in a local SQLite database in WAL mode, shared safely by several
+    worker processes on the same host. Transactions take SQLite's write lock up front
+    (BEGIN IMMEDIATE), so read-modify-write cycles never interleave across processes.
+    """
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS, eviction_interval=60):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.eviction_interval = eviction_interval
+        self.evictions = 0
+        self._last_eviction = 0
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS conversation_states ('
+                'user_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS conversation_states_updated_at '
+                'ON conversation_states (updated_at)'
+            )
+
+    @contextmanager
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so each thread keeps its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        yield connection
+
+    def _load(self, connection, user_id):
+        row = connection.execute(
+            'SELECT state, updated_at FROM conversation_states WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def _save(self, connection, user_id, state):
+        connection.execute(
+            'INSERT INTO conversation_states (user_id, state, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at',
+            (user_id, json.dumps(state), time.time())
+        )
+
+    def get(self, user_id):
+        with self._connection() as connection:
+            return self._load(connection, user_id)
+
+    def put(self, user_id, state):
+        with self._connection() as connection:
+            self._save(connection, user_id, state)
+        self._maybe_evict()
+
+    def delete(self, user_id):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM conversation_states WHERE user_id = ?', (user_id,))
+
+    @contextmanager
+    def transaction(self, user_id, default=None):
+        """
+        Locks the user's state and yields it for modification. The state is saved when
+        the block exits, including on early return, and rolled back if the block raises.
+        """
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                state = self._load(connection, user_id)
+                if state is None:
+                    state = dict(default or {})
+                yield state
+                self._save(connection, user_id, state)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        self._maybe_evict()
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self._last_eviction >= self.eviction_interval:
+            self._last_eviction = now
+            self.evict_expired()
+
+    def evict_expired(self):
+        with self._connection() as connection:
+            cursor = connection.execute(
+                'DELETE FROM conversation_states WHERE updated_at < ?', (time.time() - self.ttl_seconds,)
+            )
+            self.evictions += cursor.rowcount
+
+    def __len__(self):
+        with self._connection() as connection:
+            return connection.execute('SELECT COUNT(*) FROM conversation_states').fetchone()[0]
+
+def create_state_store():
+    """
+    Creates the conversation state store selected by the STATE_BACKEND environment variable
+    ('memory' or 'sqlite').
+    """
+    backend = os.getenv('STATE_BACKEND', 'memory')
+    ttl_seconds = int(os.getenv('STATE_TTL_SECONDS', str(DEFAULT_TTL_SECONDS)))
+    if backend == 'memory':
+        return MemoryStateStore(ttl_seconds=ttl_seconds,
+                                max_entries=int(os.getenv('STATE_MAX_USERS', '100000')))
+    if backend == 'sqlite':
+        return SQLiteStateStore(os.getenv('STATE_DB_PATH', 'conversation_states.db'), ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown state backend '{backend}'.")
@@ -0,0 +1,328 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future
+import metrics
+
+# Priorities of a plan's tab tasks; lower runs first
+PRIORITY_SINGLE_TAB = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BATCH = 2
+
+class PlanCancelled(Exception):
+    """
+    Raised in the tasks of a plan that was cancelled, and by PlanTasks.raise_if_cancelled.
+    """
+
+# The plan of the tab task running in this context
+_current_plan = contextvars.ContextVar('current_plan', default=None)
+
+def raise_if_cancelled():
+    """
+    Raises PlanCancelled if the plan of the tab task running in this context was cancelled.
+    A running Bedrock call cannot be interrupted, so tabs check between their stages.
+    """
+    plan = _current_plan.get()
+    if plan is not None:
+        plan.raise_if_cancelled()
+
+def current_plan():
+    """
+    Returns:
+        PlanTasks: The plan of the tab task running in this context, or None.
+    """
+    return _current_plan.get()
+
+def _cancel(future):
+    # Notifies as_completed and wait(), as an executor does when it reaches a cancelled future
+    future.cancel()
+    future.set_running_or_notify_cancel()
+
+class PlanTasks:
+    """
+    The tab tasks of one plan, submitted to a TabScheduler. At most max_in_flight of them
+    run at once.
+
+    If given, is_current(plan) tells whether the plan is still wanted. raise_if_cancelled
+    calls it at most every check_seconds of the scheduler and cancels the plan once it
+    returns False, so a plan can be superseded from another process through shared state.
+    """
+
+    def __init__(self, scheduler, user_id, priority, max_in_flight, is_current=None):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.max_in_flight = max_in_flight
+        self.is_current = is_current
+        self.plan_id = uuid.uuid4().hex
+        self.cancelled = threading.Event()
+        self._checked_at = None
+        # (future, context, fn, args, kwargs, queued at) of the tasks waiting for a worker
+        self.queued = deque()
+        self.in_flight = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues a call to fn(*args, **kwargs), run in a copy of the caller's context.
+        Returns:
+            Future: The result of the call. It is cancelled if the plan is cancelled first.
+        """
+        return self.scheduler._submit(self, fn, args, kwargs)
+
+    def map(self, fn, items):
+        """
+        Calls fn on each of items as tasks of the plan, so they share its max_in_flight and
+        its turns with the other users. The caller runs the first item itself, and any item
+        no worker has started by the time its result is needed, so a tab task never waits
+        for a worker slot its own plan holds.
+        Returns:
+            list: The results, in the order of items.
+        """
+        items = list(items)
+        if not items:
+            return []
+        futures = [self.submit(fn, item) for item in items[1:]]
+        remaining = list(zip(items[1:], futures))
+        try:
+            results = [fn(items[0])]
+            while remaining:
+                item, future = remaining.pop(0)
+                if self.scheduler._take_back(self, future):
+                    results.append(fn(item))
+                    continue
+                try:
+                    results.append(future.result())
+                except CancelledError:
+                    self.raise_if_cancelled()
+                    raise
+            return results
+        finally:
+            # Drops the items not started yet if one of them failed
+            for _, future in remaining:
+                self.scheduler._take_back(self, future)
+
+    def raise_if_cancelled(self):
+        if self.is_current is not None and not self.cancelled.is_set():
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= self.scheduler.check_seconds:
+                self._checked_at = now
+                if not self.is_current(self):
+                    self.scheduler.cancel_plan(self)
+        if self.cancelled.is_set():
+            raise PlanCancelled(f"The plan of {self.user_id} was cancelled")
+
+    def close(self):
+        """
+        Unregisters the plan once it is finished, so cancelling its user no longer reaches it.
+        """
+        self.scheduler._close(self)
+
+class TabScheduler:
+    """
+    Runs the tab tasks of every plan on one shared pool of worker threads.
+
+    Workers take turns between users (round-robin), so a plan with many tabs does not hold
+    every worker while another user's plan waits. Among the users with a task ready, the
+    one whose plan has the lowest priority value goes first: single-tab plans before other
+    Slack plans, and those before batch plans. A plan's priority improves by one for every
+    aging_seconds its oldest task has waited, so lower-priority plans are not starved.
+
+    cancel_user cancels the queued tasks of a user's plans and marks their running tasks,
+    which stop at their next raise_if_cancelled check. Plans started with is_current are
+    also cancelled at a check once it returns False (looked up at most every
+    check_seconds).
+    """
+
+    def __init__(self, max_workers=16, aging_seconds=30.0, check_seconds=2.0):
+        self.max_workers = max_workers
+        self.aging_seconds = aging_seconds
+        self.check_seconds = check_seconds
+        self._condition = threading.Condition()
+        # user ID -> their open plans, oldest first
+        self._plans = {}
+        # Users with queued tasks, in the order they get a turn
+        self._rotation = OrderedDict()
+        self._anonymous_ids = itertools.count(1)
+        self._workers = []
+        self.completed = 0
+        self.cancelled = 0
+
+    def start_plan(self, user_id=None, priority=PRIORITY_INTERACTIVE, max_in_flight=4, is_current=None):
+        """
+        Registers a new plan of user_id (a plan of its own if None).
+        Args:
+            is_current (callable): Called with the plan, returns False once it is superseded.
+        Returns:
+            PlanTasks: The plan, to submit its tab tasks to.
+        """
+        if user_id is None:
+            user_id = f"plan-{next(self._anonymous_ids)}"
+        plan = PlanTasks(self, user_id, priority, max(1, max_in_flight), is_current)
+        with self._condition:
+            self._plans.setdefault(user_id, []).append(plan)
+        return plan
+
+    def _close(self, plan):
+        with self._condition:
+            plans = self._plans.get(plan.user_id, [])
+            if plan in plans:
+                plans.remove(plan)
+            if not plans:
+                self._plans.pop(plan.user_id, None)
+                self._rotation.pop(plan.user_id, None)
+
+    def _submit(self, plan, fn, args, kwargs):
+        future = Future()
+        with self._condition:
+            self._ensure_workers()
+            if plan.cancelled.is_set():
+                _cancel(future)
+                return future
+            plan.queued.append((future, contextvars.copy_context(), fn, args, kwargs, time.monotonic()))
+            if plan not in self._plans.get(plan.user_id, []):
+                self._plans.setdefault(plan.user_id, []).append(plan)
+            self._rotation.setdefault(plan.user_id)
+            self._condition.notify()
+        return future
+
+    def _take_back(self, plan, future):
+        # Removes the task of future if no worker has started it yet
+        with self._condition:
+            for task in plan.queued:
+                if task[0] is future:
+                    plan.queued.remove(task)
+                    break
+            else:
+                return False
+            if not any(other.queued for other in self._plans.get(plan.user_id, [])):
+                self._rotation.pop(plan.user_id, None)
+            return True
+
+    def _ensure_workers(self):
+        # Started on first use, like the job queue's workers
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._run, name=f"tab-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _effective_priority(self, plan, now):
+        waited = now - plan.queued[0][5]
+        return plan.priority - (int(waited / self.aging_seconds) if self.aging_seconds else 0)
+
+    def _next_task(self):
+        # The ready plan with the best priority; ties go to the user whose turn comes first
+        now = time.monotonic()
+        best = None
+        for user_id in self._rotation:
+            for plan in self._plans.get(user_id, []):
+                if plan.queued and plan.in_flight < plan.max_in_flight:
+                    priority = self._effective_priority(plan, now)
+                    if best is None or priority < best[0]:
+                        best = (priority, plan)
+        if best is None:
+            return None
+        plan = best[1]
+        task = plan.queued.popleft()
+        plan.in_flight += 1
+        # The user's next turn comes after everyone else's
+        if any(other.queued for other in self._plans[plan.user_id]):
+            self._rotation.move_to_end(plan.user_id)
+        else:
+            del self._rotation[plan.user_id]
+        return plan, task
+
+    def _run(self):
+        while True:
+            with self._condition:
+                picked = self._next_task()
+                while picked is None:
+                    self._condition.wait()
+                    picked = self._next_task()
+            plan, (future, context, fn, args, kwargs, queued_at) = picked
+            metrics.observe('tab_task_wait_seconds', time.monotonic() - queued_at,
+                            help_text='Time tab tasks waited for a worker.', priority=str(plan.priority))
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(context.run(self._call, plan, fn, args, kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    plan.in_flight -= 1
+                    self.completed += 1
+                    # The plan may have room for another task
+                    self._condition.notify_all()
+
+    @staticmethod
+    def _call(plan, fn, args, kwargs):
+        _current_plan.set(plan)
+        plan.raise_if_cancelled()
+        return fn(*args, **kwargs)
+
+    def cancel_user(self, user_id):
+        """
+        Cancels every open plan of user_id: their queued tasks are dropped and their running
+        tasks stop at their next check.
+        Returns:
+            int: The number of tasks cancelled (queued and running).
+        """
+        with self._condition:
+            plans = list(self._plans.get(user_id, []))
+        return sum(self.cancel_plan(plan) for plan in plans)
+
+    def cancel_plan(self, plan):
+        """
+        Cancels the plan: its queued tasks are dropped and its running tasks stop at their
+        next check.
+        Returns:
+            int: The number of tasks cancelled (queued and running), 0 if it already was.
+        """
+        with self._condition:
+            if plan.cancelled.is_set():
+                return 0
+            plan.cancelled.set()
+            queued = 0
+            while plan.queued:
+                _cancel(plan.queued.popleft()[0])
+                queued += 1
+            running = plan.in_flight
+            if not any(other.queued for other in self._plans.get(plan.user_id, [])):
+                self._rotation.pop(plan.user_id, None)
+            self.cancelled += queued + running
+        if queued:
+            metrics.inc('tab_tasks_cancelled_total', queued, help_text='Tab tasks of superseded plans cancelled.',
+                        state='queued')
+        if running:
+            metrics.inc('tab_tasks_cancelled_total', running, help_text='Tab tasks of superseded plans cancelled.',
+                        state='running')
+        return queued + running
+
+    def stats(self):
+        with self._condition:
+            plans = [plan for user_plans in self._plans.values() for plan in user_plans]
+            return {
+                'workers': self.max_workers,
+                'queued': sum(len(plan.queued) for plan in plans),
+                'running': sum(plan.in_flight for plan in plans),
+                'plans': len(plans),
+                'users_waiting': len(self._rotation),
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+            }
+
+def create_tab_scheduler():
+    """
+    Creates the tab scheduler configured by the environment variables.
+    """
+    return TabScheduler(
+        max_workers=int(os.getenv('TAB_WORKERS', '16')),
+        aging_seconds=float(os.getenv('TAB_PRIORITY_AGING_SECONDS', '30')),
+        check_seconds=float(os.getenv('PLAN_CANCEL_CHECK_SECONDS', '2')),
+    )
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Words too common in feature descriptions to tell two features apart
+STOPWORDS = frozenset("""
+a an and are as at be by can for from has have if in into is it its of on or should that the
+their then there these this to was were will with user users feature features new allow allows
+""".split())
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Column of the corpus -> words that identify it in a table header
+COLUMNS = {
+    'description': ('description', 'test case'),
+    'priority': ('priority',),
+    'steps': ('steps',),
+    'expected': ('expected', 'outcome'),
+    'category': ('category',),
+}
+
+def feature_words(*texts):
+    """
+    Returns:
+        set: The distinctive lowercase words of the texts, used to compare features.
+    """
+    words = set()
+    for text in texts:
+        words.update(word for word in WORD_PATTERN.findall((text or '').lower())
+                     if word not in STOPWORDS and len(word) > 1)
+    return words
+
+def fts_query(text, operator='AND'):
+    # Every word is quoted, so user input can never be parsed as FTS5 syntax
+    words = WORD_PATTERN.findall((text or '').lower())
+    return f' {operator} '.join(f'"{word}"' for word in words)
+
+def _column_indexes(header):
+    indexes = {}
+    for i, cell in enumerate(header):
+        name = cell.strip().lower()
+        for column, keys in COLUMNS.items():
+            if column not in indexes and any(key in name for key in keys):
+                indexes[column] = i
+                break
+    return indexes
+
+class TestCaseCorpus:
+    """
+    Every generated table, stored in a local SQLite database with an FTS5 index over the
+    test cases and the features they were written for. Searching finds past cases by text,
+    tab, priority and feature; find_similar finds the cases of a tab written for a feature
+    with nearly the same name and details, so they can be reused or used as examples.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS features (
+                    feature_key TEXT PRIMARY KEY, feature_name TEXT NOT NULL,
+                    feature_details TEXT NOT NULL, updated_at REAL NOT NULL);
+                CREATE VIRTUAL TABLE IF NOT EXISTS features_fts USING fts5(
+                    feature_name, feature_details, content='features', content_rowid='rowid');
+                CREATE TABLE IF NOT EXISTS test_cases (
+                    id INTEGER PRIMARY KEY, feature_key TEXT NOT NULL, tab TEXT NOT NULL,
+                    position INTEGER NOT NULL, priority TEXT, description TEXT, steps TEXT,
+                    expected TEXT, category TEXT, header TEXT NOT NULL, row TEXT NOT NULL,
+                    created_at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS test_cases_feature_tab ON test_cases (feature_key, tab);
+                CREATE VIRTUAL TABLE IF NOT EXISTS test_cases_fts USING fts5(
+                    description, steps, expected, category, content='test_cases', content_rowid='id');
+            ''')
+
+    @contextmanager
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so each thread keeps its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        yield connection
+
+    @staticmethod
+    def feature_key(feature_name, feature_details):
+        return hashlib.sha256(json.dumps([feature_name, feature_details]).encode()).hexdigest()[:32]
+
+    def add_table(self, feature_name, feature_details, tab, table):
+        """
+        Stores a parsed table (header row first) for the feature's tab, replacing the
+        cases stored for that tab by an earlier plan of the same feature.
+        Returns:
+            int: The number of test cases stored.
+        """
+        if not table or len(table) < 2:
+            return 0
+        header, rows = table[0], table[1:]
+        indexes = _column_indexes(header)
+        key = self.feature_key(feature_name, feature_details)
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                previous = connection.execute('SELECT rowid, feature_name, feature_details FROM features '
+                                              'WHERE feature_key = ?', (key,)).fetchone()
+                if previous is None:
+                    cursor = connection.execute('INSERT INTO features (feature_key, feature_name, feature_details, '
+                                                'updated_at) VALUES (?, ?, ?, ?)',
+                                                (key, feature_name, feature_details, now))
+                    connection.execute('INSERT INTO features_fts (rowid, feature_name, feature_details) '
+                                       'VALUES (?, ?, ?)', (cursor.lastrowid, feature_name, feature_details))
+                else:
+                    connection.execute('UPDATE features SET updated_at = ? WHERE feature_key = ?', (now, key))
+
+                for old in connection.execute('SELECT id, description, steps, expected, category FROM test_cases '
+                                              'WHERE feature_key = ? AND tab = ?', (key, tab)).fetchall():
+                    # External-content FTS5 tables are updated with the 'delete' command
+                    connection.execute('INSERT INTO test_cases_fts (test_cases_fts, rowid, description, steps, '
+                                       'expected, category) VALUES (\'delete\', ?, ?, ?, ?, ?)', tuple(old))
+                connection.execute('DELETE FROM test_cases WHERE feature_key = ? AND tab = ?', (key, tab))
+
+                header_json = json.dumps(header)
+                for position, row in enumerate(rows):
+                    values = {column: row[i] if i < len(row) else '' for column, i in indexes.items()}
+                    cursor = connection.execute(
+                        'INSERT INTO test_cases (feature_key, tab, position, priority, description, steps, '
+                        'expected, category, header, row, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (key, tab, position, values.get('priority', '').upper() or None, values.get('description'),
+                         values.get('steps'), values.get('expected'), values.get('category'), header_json,
+                         json.dumps(row), now))
+                    connection.execute('INSERT INTO test_cases_fts (rowid, description, steps, expected, category) '
+                                       'VALUES (?, ?, ?, ?, ?)',
+                                       (cursor.lastrowid, values.get('description'), values.get('steps'),
+                                        values.get('expected'), values.get('category')))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def search(self, query='', tab=None, priority=None, feature=None, limit=20):
+        """
+        Full-text search of past test cases, best matches first.
+        Args:
+            query (str): Words that must all appear in the case's description, steps,
+                expected outcome or category. Empty to list the most recent cases.
+            tab (str): Only cases of this tab.
+            priority (str): Only cases of this priority, such as 'P0'.
+            feature (str): Only cases of features whose name or details match these words.
+        Returns:
+            list: Dicts with the feature name, tab, priority, description, steps and expected outcome.
+        """
+        conditions, parameters = [], []
+        match = fts_query(query)
+        if match:
+            # Driven from the FTS5 index, so bm25 ranking only visits matching cases
+            source = ('test_cases_fts JOIN test_cases ON test_cases.id = test_cases_fts.rowid '
+                      'JOIN features ON features.feature_key = test_cases.feature_key')
+            conditions.append('test_cases_fts MATCH ?')
+            parameters.append(match)
+            order = 'test_cases_fts.rank'
+        else:
+            source = 'test_cases JOIN features ON features.feature_key = test_cases.feature_key'
+            order = 'test_cases.created_at DESC, test_cases.position'
+        if tab:
+            conditions.append('test_cases.tab = ? COLLATE NOCASE')
+            parameters.append(tab)
+        if priority:
+            conditions.append('test_cases.priority = ?')
+            parameters.append(priority.upper())
+        feature_match = fts_query(feature)
+        if feature_match:
+            conditions.append('features.rowid IN (SELECT rowid FROM features_fts WHERE features_fts MATCH ?)')
+            parameters.append(feature_match)
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        parameters.append(limit)
+        with self._connection() as connection:
+            rows = connection.execute(
+                'SELECT features.feature_name, test_cases.tab, test_cases.priority, test_cases.description, '
+                f'test_cases.steps, test_cases.expected FROM {source} {where} ORDER BY {order} LIMIT ?',
+                parameters).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_similar(self, feature_name, feature_details, tab, min_similarity=0.8, candidates=20):
+        """
+        Finds the cases of tab stored for the feature most similar to this one, measured
+        as the Jaccard similarity of their distinctive words.
+        Returns:
+            tuple: (similarity, table with its header row first), or None if no stored
+            feature with this tab reaches min_similarity.
+        """
+        words = feature_words(feature_name, feature_details)
+        match = fts_query(' '.join(sorted(words)), operator='OR')
+        if not match:
+            return None
+        with self._connection() as connection:
+            features = connection.execute(
+                'SELECT features.feature_key, features.feature_name, features.feature_details FROM features_fts '
+                'JOIN features ON features.rowid = features_fts.rowid WHERE features_fts MATCH ? '
+                'AND EXISTS (SELECT 1 FROM test_cases WHERE test_cases.feature_key = features.feature_key '
+                'AND test_cases.tab = ?) ORDER BY bm25(features_fts) LIMIT ?', (match, tab, candidates)).fetchall()
+            best = None
+            for feature in features:
+                other = feature_words(feature['feature_name'], feature['feature_details'])
+                similarity = len(words & other) / len(words | other)
+                if similarity >= min_similarity and (best is None or similarity > best[0]):
+                    best = (similarity, feature['feature_key'])
+            if best is None:
+                return None
+            rows = connection.execute('SELECT header, row FROM test_cases WHERE feature_key = ? AND tab = ? '
+                                      'ORDER BY position', (best[1], tab)).fetchall()
+        return best[0], [json.loads(rows[0]['header'])] + [json.loads(row['row']) for row in rows]
+
+    def __len__(self):
+        with self._connection() as connection:
+            return connection.execute('SELECT COUNT(*) FROM test_cases').fetchone()[0]
+
+def create_corpus():
+    """
+    Creates the test-case corpus at CORPUS_DB_PATH, or returns None if CORPUS_ENABLED is false.
+    """
+    if os.getenv('CORPUS_ENABLED', 'true').lower() != 'true':
+        return None
+    return TestCaseCorpus(os.getenv('CORPUS_DB_PATH', 'test_cases.db'))